@@ -0,0 +1,35 @@
+# Generated by Django 4.2.15 on 2026-10-18 14:14
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0002_alter_customer_address"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="account",
+            index=models.Index(
+                django.db.models.functions.text.Lower("email"),
+                name="account_email_lower_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                django.db.models.functions.text.Lower("first_name"),
+                name="customer_first_name_lower_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                django.db.models.functions.text.Lower("last_name"),
+                name="customer_last_name_lower_idx",
+            ),
+        ),
+    ]
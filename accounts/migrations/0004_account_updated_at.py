@@ -0,0 +1,20 @@
+# Generated by Django 4.2.15 on 2026-10-18 18:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0003_customer_autocomplete_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="account",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -4,6 +4,7 @@ from django.contrib.auth.models import (
     PermissionsMixin,
 )
 from django.db import models
+from django.db.models.functions import Lower
 from django.utils import timezone
 
 from common.models import BaseModel
@@ -32,15 +33,26 @@ class Account(AbstractBaseUser, PermissionsMixin):
     is_staff = models.BooleanField(default=False)
     is_superuser = models.BooleanField(default=False)
     date_joined = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
 
     objects = AccountManager()
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
 
+    class Meta:
+        # Case-insensitive prefix lookups for the customer autocomplete
+        indexes = [models.Index(Lower("email"), name="account_email_lower_idx")]
+
     def __str__(self):
         return f"{self.email}"
 
+    def save(self, *args, update_fields=None, **kwargs):
+        # Partial saves (e.g. last_login on login) still mark the row as changed
+        if update_fields:
+            update_fields = {*update_fields, "updated_at"}
+        super().save(*args, update_fields=update_fields, **kwargs)
+
 
 class Employee(BaseModel):
     first_name = models.CharField(max_length=100, verbose_name="First Name")
@@ -75,5 +87,12 @@ class Customer(BaseModel):
         blank=True,
     )
 
+    class Meta:
+        # Case-insensitive prefix lookups for the customer autocomplete
+        indexes = [
+            models.Index(Lower("first_name"), name="customer_first_name_lower_idx"),
+            models.Index(Lower("last_name"), name="customer_last_name_lower_idx"),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
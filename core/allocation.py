@@ -0,0 +1,108 @@
+"""
+Allocation of concrete RentalItems to the components of booked ItemSets.
+
+Candidates for every component type are fetched in one query, assigned in
+memory and written back with a single bulk_create, instead of one query and
+one INSERT per component/item.
+"""
+
+from collections import defaultdict
+
+from django.db.models import Exists, OuterRef
+
+from core import ledger, occupancy
+from core.models import ItemStatus, RentalItem, RentalItemDetail
+
+
+class AllocationError(ValueError):
+    """Raised when there are not enough free items to fill the requested sets."""
+
+
+def required_counts(set_requests):
+    """
+    Sums the number of items needed per item type.
+    set_requests is a list of (item_set, quantity) with components prefetched.
+    """
+    counts = defaultdict(int)
+    for item_set, quantity in set_requests:
+        for component in item_set.itemsetcomponent_set.all():
+            counts[component.item_type_id] += component.quantity * quantity
+    return counts
+
+
+def free_candidates(type_ids, start_date, end_date, exclude_item_ids=()):
+    """Available items of the given types that are not booked between the dates, grouped by type."""
+    booked = occupancy.overlapping(start_date, end_date).filter(item=OuterRef("pk"))
+    candidates = (
+        RentalItem.objects.filter(item_type_id__in=type_ids, status=ItemStatus.AVAILABLE)
+        .exclude(pk__in=list(exclude_item_ids))
+        .exclude(Exists(booked))
+        .order_by("item_type_id", "serial_number")
+        .values_list("pk", "item_type_id")
+    )
+    by_type = defaultdict(list)
+    for item_pk, item_type_id in candidates:
+        by_type[item_type_id].append(item_pk)
+    return by_type
+
+
+def allocate(set_requests, start_date, end_date, exclude_item_ids=()):
+    """
+    Picks concrete items for every component of the requested sets.
+    Returns {item_set.pk: [(component, item_pk), ...]}.
+    Raises AllocationError listing every component type that falls short.
+    """
+    counts = required_counts(set_requests)
+    if not counts:
+        return {}
+
+    pool = free_candidates(counts.keys(), start_date, end_date, exclude_item_ids)
+
+    item_types = {
+        component.item_type_id: component.item_type
+        for item_set, _ in set_requests
+        for component in item_set.itemsetcomponent_set.all()
+    }
+    shortfalls = [
+        f"'{item_types[type_id]}' (need {needed}, {len(pool.get(type_id, []))} free)"
+        for type_id, needed in counts.items()
+        if len(pool.get(type_id, [])) < needed
+    ]
+    if shortfalls:
+        raise AllocationError(
+            "Not enough available items for the selected dates: " + "; ".join(shortfalls)
+        )
+
+    allocation = {}
+    for item_set, quantity in set_requests:
+        assigned = []
+        for component in item_set.itemsetcomponent_set.all():
+            candidates = pool[component.item_type_id]
+            take = component.quantity * quantity
+            assigned.extend((component, item_pk) for item_pk in candidates[:take])
+            del candidates[:take]
+        allocation[item_set.pk] = assigned
+    return allocation
+
+
+def create_component_details(rental, set_details, allocation):
+    """
+    Writes the RentalItemDetail rows for an allocation in one bulk_create.
+    set_details maps item_set.pk -> the RentalSetDetail created for it.
+    """
+    details = [
+        RentalItemDetail(
+            rental=rental,
+            item_id=item_pk,
+            quantity=1,  # Each detail is for one specific item instance
+            rented_price_per_day=component.item_type.rental_price_per_day,
+            set_rental=set_details[set_pk],
+        )
+        for set_pk, assigned in allocation.items()
+        for component, item_pk in assigned
+    ]
+    RentalItemDetail.objects.bulk_create(details)
+    # bulk_create skips post_save, so index the new rows explicitly
+    occupancy.sync_transaction(rental)
+    ledger.schedule(rental.pk)
+    return details
@@ -0,0 +1,92 @@
+"""
+Customer autocomplete for the dashboard's customer fields.
+
+Suggestions match the start of a customer's first name, last name or account
+email, case-insensitively. Each field is looked up with a range on its
+LOWER(...) expression index (accounts migration 0003) and a LIMIT, so a lookup
+reads only the few index entries it returns however many customers there are.
+"Somchai Ph" matches the first name exactly and the last name by prefix.
+
+Recent prefixes are memoised in a small per-process LRU cache keyed by the row
+counts and latest updated_at of the customers and accounts, read in one query,
+so a change made by any process is seen by the next lookup.
+"""
+
+from functools import lru_cache
+
+from django.db.models.functions import Lower
+
+from accounts.models import Account, Customer
+from core import conditional
+
+MIN_QUERY_LENGTH = 2
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 20
+CACHE_SIZE = 256
+# Sorts after every character a name or email can contain
+PREFIX_END = "\U0010ffff"
+
+
+def _prefix_pks(queryset, field, prefix, limit):
+    """Primary keys of the rows whose lower-cased field starts with prefix, via its index."""
+    return list(
+        queryset.annotate(key=Lower(field))
+        .filter(key__gte=prefix, key__lt=prefix + PREFIX_END)
+        .order_by("key")
+        .values_list("pk", flat=True)[:limit]
+    )
+
+
+def _matching_pks(query, limit):
+    first, _, rest = query.partition(" ")
+    if rest:
+        # "first last": exact first name, last name by prefix
+        return list(
+            Customer.objects.annotate(first=Lower("first_name"))
+            .filter(first=first)
+            .annotate(key=Lower("last_name"))
+            .filter(key__gte=rest, key__lt=rest + PREFIX_END)
+            .order_by("key")
+            .values_list("pk", flat=True)[:limit]
+        )
+
+    pks = _prefix_pks(Customer.objects, "first_name", query, limit)
+    pks += _prefix_pks(Customer.objects, "last_name", query, limit)
+    user_pks = _prefix_pks(Account.objects, "email", query, limit)
+    if user_pks:
+        pks += Customer.objects.filter(user__in=user_pks).values_list("pk", flat=True)
+    return list(dict.fromkeys(pks))[:limit]
+
+
+def _payload(customer):
+    return {
+        "id": customer.pk,
+        "name": str(customer),
+        "email": customer.user.email if customer.user else "",
+        "phone_number": customer.phone_number,
+    }
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _suggest(query, limit, data_version):
+    pks = _matching_pks(query, limit)
+    customers = Customer.objects.select_related("user").in_bulk(pks)
+    return tuple(_payload(customers[pk]) for pk in pks if pk in customers)
+
+
+def normalize(query):
+    return " ".join(query.split()).lower()
+
+
+def suggest(query, limit=DEFAULT_LIMIT):
+    """Up to limit customer suggestions for query, first-name matches first."""
+    query = normalize(query)
+    if len(query) < MIN_QUERY_LENGTH:
+        return ()
+    limit = max(1, min(limit, MAX_LIMIT))
+    return _suggest(query, limit, data_version())
+
+
+def data_version():
+    """(index, count, latest updated_at) of the customers and accounts, in one query."""
+    return tuple(conditional.summarize([Customer.objects.all(), Account.objects.all()]))
@@ -0,0 +1,119 @@
+"""
+Date-aware availability calendar.
+
+Per-day available counts for every RentalItemType and ItemSet are derived from
+the booked intervals in the occupancy index with a difference-array sweep:
+each interval adds +1 on its first day and -1 after its last day, and a running
+sum gives the number of booked items per day. The whole window costs a fixed
+handful of queries regardless of its length, and results are cached until the
+underlying bookings or inventory change.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from itertools import accumulate
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from core import occupancy, versions
+from core.models import ItemSet, ItemSetComponent, ItemStatus, RentalItem, RentalItemType
+
+# Dataset name bumped whenever bookings or inventory change
+VERSION_NAME = "availability"
+
+MAX_WINDOW_DAYS = 90
+DEFAULT_WINDOW_DAYS = 30
+CACHE_TIMEOUT = 60 * 60
+
+
+def booked_counts_by_type(start_date, days):
+    """Returns {item_type_id: [booked items on each day of the window]}."""
+    end_date = start_date + timedelta(days=days - 1)
+    intervals = (
+        occupancy.overlapping(start_date, end_date)
+        .filter(item__status=ItemStatus.AVAILABLE)
+        .values_list("item__item_type_id", "start_date", "end_date")
+    )
+
+    diffs = defaultdict(lambda: [0] * (days + 1))
+    for item_type_id, booked_from, booked_to in intervals:
+        diff = diffs[item_type_id]
+        diff[max(0, (booked_from - start_date).days)] += 1
+        diff[min(days, (booked_to - start_date).days + 1)] -= 1
+
+    return {item_type_id: list(accumulate(diff[:days])) for item_type_id, diff in diffs.items()}
+
+
+def compute_calendar(start_date, days):
+    """Builds the calendar payload for [start_date, start_date + days)."""
+    fleet = dict(
+        RentalItem.objects.filter(status=ItemStatus.AVAILABLE)
+        .values("item_type_id")
+        .annotate(count=Count("id"))
+        .values_list("item_type_id", "count")
+    )
+    booked = booked_counts_by_type(start_date, days)
+    no_bookings = [0] * days
+
+    type_availability = {}
+    item_types = []
+    for item_type in RentalItemType.objects.all():
+        total = fleet.get(item_type.pk, 0)
+        available = [total - count for count in booked.get(item_type.pk, no_bookings)]
+        type_availability[item_type.pk] = available
+        item_types.append(
+            {
+                "id": item_type.pk,
+                "name": str(item_type),
+                "total": total,
+                "available": available,
+            }
+        )
+
+    components_by_set = defaultdict(list)
+    for set_id, item_type_id, quantity in ItemSetComponent.objects.filter(
+        quantity__gt=0
+    ).values_list("item_set_id", "item_type_id", "quantity"):
+        components_by_set[set_id].append((item_type_id, quantity))
+
+    no_items = [0] * days
+    item_sets = []
+    for item_set in ItemSet.objects.order_by("name").only("pk", "name"):
+        components = components_by_set.get(item_set.pk)
+        if components:
+            available = [
+                min(
+                    type_availability.get(item_type_id, no_items)[day] // quantity
+                    for item_type_id, quantity in components
+                )
+                for day in range(days)
+            ]
+        else:
+            available = no_items
+        item_sets.append({"id": item_set.pk, "name": item_set.name, "available": available})
+
+    return {
+        "start": start_date.isoformat(),
+        "days": days,
+        "dates": [(start_date + timedelta(days=day)).isoformat() for day in range(days)],
+        "item_types": item_types,
+        "item_sets": item_sets,
+    }
+
+
+def get_calendar(start_date, days=DEFAULT_WINDOW_DAYS):
+    """Cached calendar; invalidated whenever bookings or inventory change."""
+    days = max(1, min(days, MAX_WINDOW_DAYS))
+    key = versions.versioned_key(
+        "core:availability-calendar", VERSION_NAME, start=start_date.isoformat(), days=days
+    )
+    data = cache.get(key)
+    if data is None:
+        data = compute_calendar(start_date, days)
+        cache.set(key, data, CACHE_TIMEOUT)
+    return data
+
+
+def invalidate():
+    versions.bump_on_commit(VERSION_NAME)
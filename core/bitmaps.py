@@ -0,0 +1,246 @@
+"""
+In-process occupancy bitmaps for planning screens.
+
+Every rentable item gets one integer whose bit N is set when the item is booked
+on day origin + N of a rolling horizon. "Is this item free between D1 and D2"
+becomes a single AND against a window mask, and "how many items of type T are
+free" a pass of ANDs over the items of that type, without reading bookings.
+
+The bitmaps of a process form an immutable Snapshot; a refresh builds a new one
+and swaps it in, so a query always sees one consistent snapshot. `current()`
+checks the snapshot against the data before handing it out: one aggregate query
+fingerprints the occupancy index and the items (row count and latest
+updated_at of each), which catches changes made by any process. When it moved,
+only the items with occupancy or item rows updated since the last build are
+reloaded. Deleted rows leave no timestamp behind, so when a count is lower than
+the rows added since would make it, everything is rebuilt, as it is when the
+day rolls over. Nothing is done on the write path.
+
+The planning endpoint (dashboard/planning/free-items/) answers from here.
+"""
+
+import sys
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.utils import timezone
+
+from core import conditional, occupancy
+from core.models import ItemOccupancy, ItemStatus, RentalItem
+
+DEFAULT_HORIZON_DAYS = 365
+
+
+def _interval_mask(origin, horizon_days, start_date, end_date):
+    """Bitmask covering [start_date, end_date], clipped to the horizon starting at origin."""
+    first = max(0, (start_date - origin).days)
+    last = min(horizon_days - 1, (end_date - origin).days)
+    if last < first:
+        return 0
+    return ((1 << (last - first + 1)) - 1) << first
+
+
+class Snapshot:
+    """The bitmaps of every available item as of one build. Never modified once built."""
+
+    def __init__(self, origin, horizon_days, bits, item_types, occupancy_items, fingerprint):
+        self.origin = origin
+        self.horizon_days = horizon_days
+        self.bits = bits  # item_id -> int bitmap
+        self.item_types = item_types  # item_id -> item_type_id
+        # occupancy row pk -> item_id, to clear an item whose booking moved to another
+        self.occupancy_items = occupancy_items
+        self.fingerprint = fingerprint
+        items_by_type = defaultdict(set)
+        for item_id, item_type_id in item_types.items():
+            items_by_type[item_type_id].add(item_id)
+        self.items_by_type = {
+            item_type_id: frozenset(members) for item_type_id, members in items_by_type.items()
+        }
+
+    @property
+    def horizon_end(self):
+        return self.origin + timedelta(days=self.horizon_days - 1)
+
+    def _day_index(self, day):
+        return (day - self.origin).days
+
+    def _window(self, start_date, end_date):
+        if self._day_index(start_date) < 0 or self._day_index(end_date) >= self.horizon_days:
+            raise ValueError(f"Dates must fall within {self.origin} and {self.horizon_end}.")
+        return _interval_mask(self.origin, self.horizon_days, start_date, end_date)
+
+    def free_item_ids(self, item_ids, start_date, end_date):
+        """Subset of item_ids free on every day in [start_date, end_date]."""
+        mask = self._window(start_date, end_date)
+        bits = self.bits
+        return {item_id for item_id in item_ids if item_id in bits and not bits[item_id] & mask}
+
+    def free_items_of_type(self, item_type_id, start_date, end_date):
+        """Ids of the items of a type that are free on every day in [start_date, end_date]."""
+        return self.free_item_ids(self.items_by_type.get(item_type_id, ()), start_date, end_date)
+
+    def count_free(self, item_type_id, start_date, end_date):
+        """Number of items of a type that are free on every day in [start_date, end_date]."""
+        mask = self._window(start_date, end_date)
+        bits = self.bits
+        return sum(
+            1 for item_id in self.items_by_type.get(item_type_id, ()) if not bits[item_id] & mask
+        )
+
+    def free_per_day(self, item_type_id, start_date, end_date):
+        """Per-day count of free items of a type over [start_date, end_date]."""
+        self._window(start_date, end_date)
+        members = self.items_by_type.get(item_type_id, ())
+        counts = []
+        for offset in range((end_date - start_date).days + 1):
+            day_bit = 1 << (self._day_index(start_date) + offset)
+            counts.append(sum(1 for item_id in members if not self.bits[item_id] & day_bit))
+        return counts
+
+    def memory_bytes(self):
+        """Approximate memory held by the bitmaps and their indexes."""
+        total = sys.getsizeof(self.bits) + sum(sys.getsizeof(b) for b in self.bits.values())
+        total += sys.getsizeof(self.items_by_type)
+        total += sum(sys.getsizeof(members) for members in self.items_by_type.values())
+        return total
+
+
+def data_fingerprint():
+    """[(index, count, latest updated_at)] of the occupancy index and the items, in one query."""
+    return conditional.summarize([ItemOccupancy.objects.all(), RentalItem.objects.all()])
+
+
+def _since(queryset, latest):
+    return queryset if latest is None else queryset.filter(updated_at__gt=latest)
+
+
+class OccupancyBitmap:
+    def __init__(self, horizon_days=DEFAULT_HORIZON_DAYS):
+        self.horizon_days = horizon_days
+        self.snapshot = None
+        self._lock = threading.RLock()
+
+    # --- Building -------------------------------------------------------
+
+    def _build(self, origin, fingerprint, item_types, bookings, kept=None):
+        """
+        A snapshot of the given available items ({item_id: item_type_id}) and their
+        bookings, on top of the (bits, item_types, occupancy_items) kept from the last one.
+        """
+        bits, all_types, occupancy_items = kept or ({}, {}, {})
+        for item_id, item_type_id in item_types.items():
+            bits[item_id] = 0
+            all_types[item_id] = item_type_id
+        for pk, item_id, start_date, end_date in bookings:
+            occupancy_items[pk] = item_id
+            if item_id in bits:
+                bits[item_id] |= _interval_mask(origin, self.horizon_days, start_date, end_date)
+        return Snapshot(origin, self.horizon_days, bits, all_types, occupancy_items, fingerprint)
+
+    def rebuild(self, fingerprint=None):
+        """Builds and swaps in a snapshot of every available item. Returns it."""
+        with self._lock:
+            fingerprint = fingerprint or data_fingerprint()
+            origin = timezone.now().date()
+            items = RentalItem.objects.filter(status=ItemStatus.AVAILABLE)
+            bookings = occupancy.overlapping(
+                origin, origin + timedelta(days=self.horizon_days - 1)
+            ).values_list("pk", "item_id", "start_date", "end_date")
+            self.snapshot = self._build(
+                origin, fingerprint, dict(items.values_list("pk", "item_type_id")), bookings
+            )
+            return self.snapshot
+
+    def _reload_changed(self, snapshot, fingerprint):
+        """
+        The snapshot with the items changed since it was built reloaded, or None
+        when rows were deleted and only a full rebuild can tell which.
+        """
+        (_, old_bookings, bookings_since), (_, old_items, items_since) = snapshot.fingerprint
+        (_, bookings_count, _), (_, items_count, _) = fingerprint
+        changed_bookings = list(
+            _since(ItemOccupancy.objects.all(), bookings_since).values_list(
+                "pk", "item_id", "created_at"
+            )
+        )
+        changed_items = list(
+            _since(RentalItem.objects.all(), items_since).values_list("pk", "created_at")
+        )
+        added_bookings = sum(
+            1 for *_, created in changed_bookings if not bookings_since or created > bookings_since
+        )
+        added_items = sum(
+            1 for _, created in changed_items if not items_since or created > items_since
+        )
+        if (
+            bookings_count != old_bookings + added_bookings
+            or items_count != old_items + added_items
+        ):
+            return None
+
+        affected = {item_id for _, item_id, _ in changed_bookings}
+        affected.update(snapshot.occupancy_items.get(pk) for pk, _, _ in changed_bookings)
+        affected.update(pk for pk, _ in changed_items)
+        affected.discard(None)
+        kept = (
+            {k: v for k, v in snapshot.bits.items() if k not in affected},
+            {k: v for k, v in snapshot.item_types.items() if k not in affected},
+            {k: v for k, v in snapshot.occupancy_items.items() if v not in affected},
+        )
+        item_types = RentalItem.objects.filter(pk__in=affected, status=ItemStatus.AVAILABLE)
+        bookings = (
+            occupancy.overlapping(snapshot.origin, snapshot.horizon_end)
+            .filter(item_id__in=affected)
+            .values_list("pk", "item_id", "start_date", "end_date")
+        )
+        return self._build(
+            snapshot.origin,
+            fingerprint,
+            dict(item_types.values_list("pk", "item_type_id")),
+            bookings,
+            kept,
+        )
+
+    def ensure_fresh(self):
+        """Brings the snapshot up to date with the data and the day. Returns it."""
+        with self._lock:
+            fingerprint = data_fingerprint()
+            snapshot = self.snapshot
+            if snapshot is not None and snapshot.origin == timezone.now().date():
+                if fingerprint == snapshot.fingerprint:
+                    return snapshot
+                snapshot = self._reload_changed(snapshot, fingerprint)
+                if snapshot is not None:
+                    self.snapshot = snapshot
+                    return snapshot
+            return self.rebuild(fingerprint)
+
+    # --- Queries --------------------------------------------------------
+
+    def _current_snapshot(self):
+        return self.snapshot or self.rebuild()
+
+    def free_item_ids(self, item_ids, start_date, end_date):
+        return self._current_snapshot().free_item_ids(item_ids, start_date, end_date)
+
+    def free_items_of_type(self, item_type_id, start_date, end_date):
+        return self._current_snapshot().free_items_of_type(item_type_id, start_date, end_date)
+
+    def count_free(self, item_type_id, start_date, end_date):
+        return self._current_snapshot().count_free(item_type_id, start_date, end_date)
+
+    def free_per_day(self, item_type_id, start_date, end_date):
+        return self._current_snapshot().free_per_day(item_type_id, start_date, end_date)
+
+    def memory_bytes(self):
+        return self._current_snapshot().memory_bytes()
+
+
+engine = OccupancyBitmap()
+
+
+def current():
+    """The process's bitmaps as one Snapshot, brought up to date with the data first."""
+    return engine.ensure_fresh()
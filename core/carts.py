@@ -0,0 +1,127 @@
+"""
+Database-backed booking carts.
+
+Each user has one Cart whose CartLines are the selected items and sets. Every
+change is a single statement on the line: adding is an INSERT ... ON CONFLICT
+upsert, quantity changes and removals are one UPDATE or DELETE. The cart's
+line_count is then recomputed with one UPDATE, and the navbar reads it from the
+cart's row (one lookup on its unique user column), so every process shows the
+same count and rendering a page never touches the session.
+
+The navbar's mini-cart is priced by core.quotes and cached per user under a
+digest of the user's cart lines and the catalogue tables (row counts and latest
+updated_at, read in one query), so a change to the cart or to a price made by
+any process renders a fresh fragment.
+"""
+
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from core import catalog, quotes
+from core.models import Cart, CartLine
+
+SUMMARY_KEY_PREFIX = "core:cart-summary:"
+SUMMARY_CACHE_TIMEOUT = 60 * 60
+SUMMARY_TEMPLATE_NAME = "core/clients/partials/mini_cart.html"
+LINE_KINDS = {"item": "item_id", "set": "item_set_id"}
+
+
+def line_lookup(kind, pk):
+    """Filter kwargs for the line of an "item" or "set" pk; None for an unknown kind."""
+    field = LINE_KINDS.get(kind)
+    return {field: pk} if field else None
+
+
+def get_cart(user):
+    return Cart.objects.get_or_create(user=user)[0]
+
+
+def set_line(user, quantity, item=None, item_set=None):
+    """Puts quantity x item (or item_set) in the cart, replacing any existing line for it."""
+    cart = get_cart(user)
+    CartLine.objects.bulk_create(
+        [CartLine(cart=cart, item=item, item_set=item_set, quantity=quantity)],
+        update_conflicts=True,
+        unique_fields=["cart", "item" if item is not None else "item_set"],
+        update_fields=["quantity", "updated_at"],
+    )
+    _refresh_count(user)
+
+
+def update_quantity(user, quantity, **lookup):
+    """Changes the quantity of an existing line. Returns False when there is no such line."""
+    updated = CartLine.objects.filter(cart__user=user, **lookup).update(
+        quantity=quantity, updated_at=timezone.now()
+    )
+    if updated:
+        _refresh_count(user)
+    return bool(updated)
+
+
+def remove_line(user, **lookup):
+    """Removes a line. Returns False when there is no such line."""
+    deleted, _ = CartLine.objects.filter(cart__user=user, **lookup).delete()
+    if deleted:
+        _refresh_count(user)
+    return bool(deleted)
+
+
+def clear(user):
+    CartLine.objects.filter(cart__user=user).delete()
+    _refresh_count(user)
+
+
+def _refresh_count(user):
+    total = (
+        CartLine.objects.filter(cart=OuterRef("pk"))
+        .order_by()
+        .values("cart")
+        .annotate(total=Sum("quantity"))
+        .values("total")
+    )
+    Cart.objects.filter(user=user).update(line_count=Coalesce(Subquery(total), 0))
+
+
+def count(user):
+    """Total quantity in the user's cart."""
+    return Cart.objects.filter(user=user).values_list("line_count", flat=True).first() or 0
+
+
+def selection(user):
+    """The cart as a quotes selection: (kind, pk, quantity) of each line."""
+    return tuple(
+        ("item", item_id, quantity) if item_id else ("set", item_set_id, quantity)
+        for item_id, item_set_id, quantity in CartLine.objects.filter(cart__user=user).values_list(
+            "item_id", "item_set_id", "quantity"
+        )
+    )
+
+
+def summarize(user):
+    """The lines of the user's cart with their prices per day, and the cart's total."""
+    quote = quotes.quote(selection(user))
+    entries = [
+        {
+            "name": line.obj.name if line.kind == "set" else str(line.obj.item_type),
+            "is_set": line.kind == "set",
+            "quantity": line.quantity,
+            "price_per_day": line.price_per_day,
+        }
+        for line in quote.lines
+    ]
+    return {"lines": entries, "total_price_per_day": quote.total_price_per_day}
+
+
+def render_summary(user):
+    """The mini-cart's HTML, rendered once per change of the user's cart or prices."""
+    version = catalog.data_version(CartLine.objects.filter(cart__user=user))
+    key = f"{SUMMARY_KEY_PREFIX}{user.pk}:{version}"
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(SUMMARY_TEMPLATE_NAME, summarize(user))
+        cache.set(key, html, SUMMARY_CACHE_TIMEOUT)
+    return mark_safe(html)
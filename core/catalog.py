@@ -0,0 +1,92 @@
+"""
+Cached client catalogue (the item and set grid on the home page).
+
+The catalogue is the same for every visitor until inventory changes, so both
+its data (available items, sets with their available quantities) and the
+rendered grid are cached against the catalogue's data version: the row count
+and latest updated_at of the items, item types, sets and components, read with
+one query (core.conditional.summarize). It comes from the database, so a change
+made by any process is picked up by all of them. The grid is also keyed on the
+"catalog" version, which this process bumps when it changes the inventory or
+writes renditions the grid links to.
+
+The grid's booking forms need the visitor's own CSRF token, so the fragment is
+cached with a placeholder in its place and the token is filled in per request.
+"""
+
+import hashlib
+
+from django.core.cache import cache
+from django.template.backends.utils import csrf_input
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core import conditional, versions
+from core.models import ItemSet, ItemSetComponent, ItemStatus, RentalItem, RentalItemType
+
+# Dataset name bumped whenever this process changes the inventory or its images
+VERSION_NAME = "catalog"
+
+CACHE_TIMEOUT = 60 * 60
+TEMPLATE_NAME = "core/clients/partials/catalog.html"
+CSRF_PLACEHOLDER = mark_safe("<!--catalog-csrf-input-->")
+
+
+def querysets():
+    """The querysets the catalogue is built from."""
+    return [
+        RentalItem.objects.all(),
+        RentalItemType.objects.all(),
+        ItemSet.objects.all(),
+        ItemSetComponent.objects.all(),
+    ]
+
+
+def data_version(*extra):
+    """
+    Digest of the row counts and latest updated_at of the catalogue's tables, and
+    of any extra querysets summarised in the same query.
+    """
+    summary = conditional.summarize([*querysets(), *extra])
+    return hashlib.sha1(repr(summary).encode()).hexdigest()
+
+
+def compute_catalog():
+    rental_items = list(
+        RentalItem.objects.filter(status=ItemStatus.AVAILABLE)
+        .select_related("item_type")
+        .order_by("-updated_at")
+    )
+    # Availability for all sets is computed in bulk (fixed number of queries)
+    item_sets = ItemSet.objects.all().order_by("name").with_available_quantity()
+    return {
+        "rental_items": rental_items,
+        "item_sets": item_sets,
+        "available_sets": [item_set for item_set in item_sets if item_set.available_quantity > 0],
+    }
+
+
+def get_catalog(data=None):
+    """Cached catalogue data for the given data version (the current one by default)."""
+    key = f"core:catalog-data:{data or data_version()}"
+    data = cache.get(key)
+    if data is None:
+        data = compute_catalog()
+        cache.set(key, data, CACHE_TIMEOUT)
+    return data
+
+
+def render_catalog(request):
+    """The catalogue grid's HTML, rendered once per data and catalogue version."""
+    data = data_version()
+    key = versions.versioned_key("core:catalog-html", VERSION_NAME, data=data)
+    html = cache.get(key)
+    if html is None:
+        context = {**get_catalog(data), "csrf_input": CSRF_PLACEHOLDER}
+        html = render_to_string(TEMPLATE_NAME, context)
+        cache.set(key, html, CACHE_TIMEOUT)
+    return mark_safe(html.replace(CSRF_PLACEHOLDER, csrf_input(request)))
+
+
+def invalidate():
+    versions.bump_on_commit(VERSION_NAME)
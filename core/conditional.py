@@ -0,0 +1,102 @@
+"""
+Conditional GET (ETag / Last-Modified) for the client pages.
+
+A page declares the querysets its content is built from. Before the view runs,
+one UNION ALL query fetches the row count and latest updated_at of each; the
+latest updated_at is the page's Last-Modified, and the ETag hashes all of them
+together with the visitor's own state shown on the page (user, CSRF cookie,
+cart size). The visitor's cart lines are summarised in the same query, so the
+navbar mini-cart changes the ETag even when the cart size stays the same.
+Counts are part of the ETag because deleting a row does not move the latest
+updated_at, and so is the index of the queryset each summary belongs to, so
+the summaries are never matched up with the wrong querysets. A client whose copy is still current gets a 304 without
+the page being rendered.
+
+While flash messages are waiting to be shown the page is always rendered, so
+they are never lost behind a 304.
+"""
+
+import hashlib
+from functools import wraps
+
+from django.contrib import messages
+from django.db.models import Count, IntegerField, Max, Value
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from core import carts
+from core.models import CartLine
+
+
+def summarize(querysets):
+    """[(index, row count, latest updated_at or None)] of each queryset, in a single query."""
+    parts = [
+        queryset.order_by()
+        .annotate(source=Value(index, output_field=IntegerField()))
+        .values("source")
+        .annotate(count=Count("pk"), latest=Max("updated_at"))
+        .values_list("source", "count", "latest")
+        for index, queryset in enumerate(querysets)
+    ]
+    return sorted(parts[0].union(*parts[1:], all=True))
+
+
+def _viewer_state(request):
+    # Pages embed a CSRF token; make sure the secret exists before the first
+    # response, or that response's ETag would never match again
+    get_token(request)
+    return [
+        request.user.pk,
+        request.META["CSRF_COOKIE"],
+        carts.count(request.user) if request.user.is_authenticated else 0,
+    ]
+
+
+def _validators(request, querysets):
+    """(etag, last_modified) of the page; (None, None) when it must be rendered anyway."""
+    if len(messages.get_messages(request)):
+        return None, None
+    querysets = list(querysets)
+    if request.user.is_authenticated:
+        # The navbar's mini-cart lists the lines
+        querysets.append(CartLine.objects.filter(cart__user=request.user))
+    summary = summarize(querysets)
+    timestamps = [latest for _, _, latest in summary if latest is not None]
+    payload = repr([summary, _viewer_state(request)])
+    return hashlib.sha1(payload.encode()).hexdigest(), max(timestamps, default=None)
+
+
+def conditional_page(get_querysets):
+    """
+    Adds ETag/Last-Modified validators to a page view and answers 304 when the
+    client's copy is current. get_querysets(request, *args, **kwargs) returns
+    the querysets the page is built from.
+    """
+
+    def decorator(view):
+        def validators(request, *args, **kwargs):
+            if not hasattr(request, "_page_validators"):
+                request._page_validators = _validators(
+                    request, get_querysets(request, *args, **kwargs)
+                )
+            return request._page_validators
+
+        def etag(request, *args, **kwargs):
+            return validators(request, *args, **kwargs)[0]
+
+        def last_modified(request, *args, **kwargs):
+            return validators(request, *args, **kwargs)[1]
+
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def page(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            # Browsers may keep the page but must revalidate before reusing it
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        return page
+
+    return decorator
@@ -0,0 +1,198 @@
+"""
+Cached statistics for the admin dashboard.
+
+The dashboard is split into tiles, each computed by one function and cached
+under its own version with a short timeout. A tile lists the models it reads;
+core.signals bumps the versions of only the tiles that read a model whenever
+one of its rows is saved or deleted, so e.g. a new payment leaves the inventory
+counts cached. Tiles that depend on the date also key on today's date.
+
+Hits and misses are counted per tile in the cache; `cache_stats()` (served at
+dashboard/stats/cache/) reports them so the hit rate can be checked.
+"""
+
+import decimal
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from accounts.models import Account, Customer
+from core import revenue, versions
+from core.models import (
+    ItemSet,
+    ItemSetComponent,
+    ItemStatus,
+    Payment,
+    PaymentStatus,
+    RentalItem,
+    RentalItemDetail,
+    RentalSetDetail,
+    RentalTransaction,
+)
+
+DEFAULT_TIMEOUT = 60
+COUNTER_PREFIX = "core:dashboard-stats:"
+ACTIVE_STATUSES = [PaymentStatus.PAID, PaymentStatus.PARTIAL]
+UPCOMING_RETURN_DAYS = 7
+LIST_SIZE = 5
+
+
+class Tile:
+    def __init__(self, name, compute, models, timeout=DEFAULT_TIMEOUT):
+        self.name = name
+        # compute(today) returns the tile's context variables
+        self.compute = compute
+        self.models = models
+        self.timeout = timeout
+
+    @property
+    def version_name(self):
+        return f"dashboard:{self.name}"
+
+    def cache_key(self, today):
+        return versions.versioned_key(
+            "core:dashboard-tile", self.version_name, tile=self.name, day=today.isoformat()
+        )
+
+
+def _approvals(today):
+    return {
+        "pending_approvals_count": RentalTransaction.objects.filter(
+            payment_status=PaymentStatus.PENDING
+        ).count()
+    }
+
+
+def _active_rentals(today):
+    return {
+        "active_rentals_count": RentalTransaction.objects.filter(
+            payment_status=PaymentStatus.PAID, start_date__lte=today, end_date__gte=today
+        ).count(),
+        "total_deposits_held": RentalTransaction.objects.filter(
+            payment_status__in=ACTIVE_STATUSES, end_date__gte=today
+        ).aggregate(total_deposits=Sum("total_deposit"))["total_deposits"]
+        or decimal.Decimal("0.00"),
+    }
+
+
+def _returns(today):
+    active = RentalTransaction.objects.filter(payment_status__in=ACTIVE_STATUSES).select_related(
+        "customer__user"
+    )
+    return {
+        "upcoming_returns": list(
+            active.filter(
+                end_date__gte=today, end_date__lte=today + timedelta(days=UPCOMING_RETURN_DAYS)
+            ).order_by("end_date")[:LIST_SIZE]
+        ),
+        "overdue_rentals": list(active.filter(end_date__lt=today).order_by("end_date")[:LIST_SIZE]),
+    }
+
+
+def _recent_bookings(today):
+    return {
+        "recent_bookings": list(
+            RentalTransaction.objects.with_financials()
+            .select_related("customer__user")
+            .order_by("-created_at")[:LIST_SIZE]
+        )
+    }
+
+
+def _revenue(today):
+    # Payments received this month, read from the daily revenue rollup.
+    # Still an approximation of earned revenue as it includes deposits.
+    return {"revenue_this_month_approx": revenue.total(since=today.replace(day=1))}
+
+
+def _customers(today):
+    return {"total_customers_count": Customer.objects.count()}
+
+
+def _inventory(today):
+    return {
+        "total_items_count": RentalItem.objects.count(),
+        "available_items_count": RentalItem.objects.filter(status=ItemStatus.AVAILABLE).count(),
+        "total_sets_count": ItemSet.objects.count(),
+        "available_sets_count": sum(
+            1 for quantity in ItemSet.objects.available_quantities().values() if quantity > 0
+        ),
+    }
+
+
+TILES = {
+    tile.name: tile
+    for tile in (
+        Tile("approvals", _approvals, [RentalTransaction]),
+        Tile("active_rentals", _active_rentals, [RentalTransaction]),
+        Tile("returns", _returns, [RentalTransaction, Customer, Account]),
+        Tile(
+            "recent_bookings",
+            _recent_bookings,
+            [RentalTransaction, RentalItemDetail, RentalSetDetail, Payment, Customer, Account],
+        ),
+        Tile("revenue", _revenue, [Payment], timeout=5 * 60),
+        Tile("customers", _customers, [Customer], timeout=5 * 60),
+        Tile("inventory", _inventory, [RentalItem, ItemSet, ItemSetComponent], timeout=5 * 60),
+    )
+}
+
+
+def _count(tile, outcome):
+    key = f"{COUNTER_PREFIX}{tile.name}:{outcome}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def get_stats(today=None):
+    """Context variables of every tile, computing only the tiles missing from the cache."""
+    today = today or timezone.now().date()
+    keys = {tile.name: tile.cache_key(today) for tile in TILES.values()}
+    cached = cache.get_many(keys.values())
+
+    stats = {}
+    for tile in TILES.values():
+        key = keys[tile.name]
+        if key in cached:
+            values = cached[key]
+            _count(tile, "hits")
+        else:
+            values = tile.compute(today)
+            cache.set(key, values, tile.timeout)
+            _count(tile, "misses")
+        stats.update(values)
+    return stats
+
+
+def cache_stats():
+    """{tile: {"hits", "misses", "hit_rate"}} counted since the cache was last cleared."""
+    names = [
+        f"{COUNTER_PREFIX}{name}:{outcome}" for name in TILES for outcome in ("hits", "misses")
+    ]
+    counters = cache.get_many(names)
+    report = {}
+    for name in TILES:
+        hits = counters.get(f"{COUNTER_PREFIX}{name}:hits", 0)
+        misses = counters.get(f"{COUNTER_PREFIX}{name}:misses", 0)
+        report[name] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+    return report
+
+
+def models():
+    """Every model read by at least one tile."""
+    return {model for tile in TILES.values() for model in tile.models}
+
+
+def invalidate_model(model):
+    """Drops the cached tiles that read model, once the current transaction commits."""
+    names = [tile.version_name for tile in TILES.values() if model in tile.models]
+    if names:
+        versions.bump_on_commit(*names)
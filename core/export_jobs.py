@@ -0,0 +1,230 @@
+"""
+Background export jobs and cached export artifacts.
+
+Large exports are built outside the request: the dashboard enqueues a job,
+a small in-process thread pool writes the file under MEDIA_ROOT/exports/ and
+the page polls the job's progress until it can download the result.
+
+A job's fingerprint covers its dataset, format, normalised filters and the
+dataset's data version: the row count and latest updated_at of each of the
+dataset's models, read with one query (core.conditional.summarize). The version
+comes from the database rather than from this process, so a change made by any
+process is seen by all of them. Requests with the same fingerprint reuse the
+pending, running or finished job, so identical exports are built once and
+served until the underlying data changes.
+
+The catalogue exports are also served synchronously from these artifacts
+(cached_export_response): the fingerprint doubles as the ETag, so a repeat
+download of unchanged data is answered with 304 after that one query, and
+otherwise the stored file is sent without rebuilding the workbook.
+"""
+
+import hashlib
+import json
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
+from django.http import FileResponse, JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from core import conditional, exports, pagination
+from core.models import ExportJob, ExportStatus
+from core.spreadsheets import CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+# A queued/running job without progress for this long is assumed lost (e.g. a restart)
+STALE_AFTER = timedelta(minutes=15)
+# Querystring parameters that never change an export's contents
+IGNORED_PARAMS = {exports.FORMAT_PARAM, "page", pagination.CURSOR_PARAM}
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "EXPORT_JOB_WORKERS", DEFAULT_WORKERS),
+    thread_name_prefix="export-job",
+)
+
+
+def normalize_params(params):
+    """Filter parameters that affect the output, as a plain sorted dict."""
+    return {
+        key: value
+        for key, value in sorted(params.items())
+        if key not in IGNORED_PARAMS and value != ""
+    }
+
+
+def data_version(dataset_class):
+    """[model index, row count, latest updated_at] of each of the dataset's models."""
+    return [
+        [source, count, latest.isoformat() if latest else None]
+        for source, count, latest in conditional.summarize(exports.version_querysets(dataset_class))
+    ]
+
+
+def fingerprint(dataset_class, export_format, params):
+    version = data_version(dataset_class)
+    payload = json.dumps([dataset_class.name, export_format, params, version], sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _is_reusable(job):
+    if job.status in (ExportStatus.PENDING, ExportStatus.RUNNING):
+        return job.updated_at > timezone.now() - STALE_AFTER
+    return job.status == ExportStatus.DONE and job.file and job.file.storage.exists(job.file.name)
+
+
+def _find_reusable(key):
+    for job in ExportJob.objects.filter(fingerprint=key).exclude(status=ExportStatus.FAILED):
+        if _is_reusable(job):
+            return job
+    return None
+
+
+def request_export(dataset_class, export_format, params, user=None):
+    """
+    Returns (job, created). An existing job for the same export and data version
+    is reused; otherwise a new job is queued once the current transaction commits.
+    """
+    params = normalize_params(params)
+    key = fingerprint(dataset_class, export_format, params)
+    job = _find_reusable(key)
+    if job is not None:
+        return job, False
+
+    job = ExportJob.objects.create(
+        dataset=dataset_class.name,
+        export_format=export_format,
+        params=params,
+        fingerprint=key,
+        requested_by=user if user and user.is_authenticated else None,
+    )
+    transaction.on_commit(lambda: _executor.submit(_run_in_worker, job.pk))
+    return job, True
+
+
+def _counted(rows, job_id):
+    """Yields rows, recording progress on the job every CHUNK_SIZE rows."""
+    written = 0
+    for row in rows:
+        yield row
+        written += 1
+        if written % CHUNK_SIZE == 0:
+            ExportJob.objects.filter(pk=job_id).update(
+                rows_written=written, updated_at=timezone.now()
+            )
+
+
+def run(job_id):
+    """Builds one export job's file and records the outcome on the job."""
+    try:
+        job = ExportJob.objects.get(pk=job_id)
+        dataset = exports.DATASETS[job.dataset](job.params)
+        ExportJob.objects.filter(pk=job_id).update(
+            status=ExportStatus.RUNNING,
+            total_rows=dataset.queryset().count(),
+            updated_at=timezone.now(),
+        )
+
+        with tempfile.TemporaryFile() as output:
+            exports.write_file(dataset, job.export_format, output, _counted(dataset.rows(), job_id))
+            output.seek(0)
+            job.refresh_from_db()
+            job.file.save(
+                f"{job.dataset}_{job.fingerprint[:12]}.{job.export_format}",
+                File(output),
+                save=False,
+            )
+        job.status = ExportStatus.DONE
+        job.rows_written = job.total_rows
+        job.finished_at = timezone.now()
+        job.save(update_fields=["file", "status", "rows_written", "finished_at", "updated_at"])
+    except Exception as exc:
+        logger.exception("Export job %s failed", job_id)
+        ExportJob.objects.filter(pk=job_id).update(
+            status=ExportStatus.FAILED, error=str(exc), finished_at=timezone.now()
+        )
+
+
+def _run_in_worker(job_id):
+    try:
+        run(job_id)
+    finally:
+        # Each worker thread opens its own connection; don't leave it open between jobs
+        connection.close()
+
+
+def cached_export_response(request, dataset_class):
+    """
+    Serves an export from its cached artifact, building it in the request on a miss.
+    Responds 304 when the client already holds the current version.
+    """
+    export_format = request.GET.get(exports.FORMAT_PARAM, exports.DEFAULT_FORMAT)
+    if export_format not in exports.FORMATS:
+        return JsonResponse({"error": "Unsupported export format."}, status=400)
+
+    params = normalize_params(request.GET)
+    key = fingerprint(dataset_class, export_format, params)
+    etag = quote_etag(key)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return _with_validators(not_modified, etag)
+
+    job = _find_reusable(key)
+    if job is None or job.status != ExportStatus.DONE:
+        job = ExportJob.objects.create(
+            dataset=dataset_class.name,
+            export_format=export_format,
+            params=params,
+            fingerprint=key,
+            requested_by=request.user if request.user.is_authenticated else None,
+        )
+        run(job.pk)
+        job.refresh_from_db()
+        if job.status != ExportStatus.DONE:
+            # Don't fail the download because the artifact couldn't be stored
+            return exports.FORMATS[export_format](dataset_class(request.GET))
+
+    last_modified = int(job.finished_at.timestamp())  # HTTP dates have 1 s resolution
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return _with_validators(not_modified, etag, last_modified)
+
+    response = FileResponse(
+        job.file.open("rb"),
+        as_attachment=True,
+        filename=f"{dataset_class(request.GET).get_filename()}.{export_format}",
+        content_type=exports.CONTENT_TYPES[export_format],
+    )
+    return _with_validators(response, etag, last_modified)
+
+
+def _with_validators(response, etag, last_modified=None):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    # Browsers may keep the file but must revalidate before reusing it
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def purge(older_than=timedelta(days=7)):
+    """Deletes finished jobs (and their files) older than the given age. Returns the count."""
+    cutoff = timezone.now() - older_than
+    jobs = ExportJob.objects.filter(created_at__lt=cutoff).exclude(
+        status__in=(ExportStatus.PENDING, ExportStatus.RUNNING)
+    )
+    count = 0
+    for job in jobs.iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        count += 1
+    return count
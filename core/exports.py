@@ -0,0 +1,466 @@
+"""
+Declarative dashboard exports.
+
+A dataset declares its base queryset, the filter it shares with its list view
+(see core.filters) and its columns once; the engine then streams it as XLSX,
+CSV or NDJSON, chosen with ?format= on the export URL. Rows are read with
+queryset.iterator() and CSV/NDJSON are written line by line as the response
+is sent, which makes them much cheaper than XLSX for very large pulls.
+"""
+
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.text import slugify
+
+from accounts.models import Account, Customer, Employee
+from core import filters
+from core.models import (
+    Accessory,
+    ItemSet,
+    ItemSetComponent,
+    Payment,
+    RentalItem,
+    RentalItemDetail,
+    RentalItemType,
+    RentalSetDetail,
+    RentalTransaction,
+)
+from core.spreadsheets import CHUNK_SIZE, XLSX_CONTENT_TYPE, StreamingSheet
+
+FORMAT_PARAM = "format"
+DEFAULT_FORMAT = "xlsx"
+
+
+class Column:
+    """One exported column: a header and a function extracting its value from a row object."""
+
+    def __init__(self, header, value, key=None):
+        self.header = header
+        self.value = value
+        # Field name used by NDJSON, e.g. "Customer Email" -> "customer_email"
+        self.key = key or slugify(header).replace("-", "_")
+
+
+class Dataset:
+    name = ""  # Registry key, used in export job URLs
+    title = ""  # Sheet title
+    filename = ""  # Download name without the extension
+    filter = staticmethod(lambda queryset, params: (queryset, []))
+    columns = ()
+    # Models whose changes alter the output; their row counts and latest
+    # updated_at make up the dataset's data version
+    models = ()
+
+    def __init__(self, params):
+        self.params = params
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def get_filename(self):
+        return self.filename
+
+    def headers(self):
+        return [column.header for column in self.columns]
+
+    def keys(self):
+        return [column.key for column in self.columns]
+
+    def queryset(self):
+        queryset, _ = self.filter(self.get_queryset(), self.params)
+        return queryset
+
+    def rows(self):
+        for obj in self.queryset().iterator(chunk_size=CHUNK_SIZE):
+            yield [column.value(obj) for column in self.columns]
+
+
+def _date(value, fmt="%d/%m/%Y", default=""):
+    return value.strftime(fmt) if value else default
+
+
+def _yes_no(value):
+    return "Yes" if value else "No"
+
+
+# --- Datasets ---
+
+
+class UserExport(Dataset):
+    name = "users"
+    title = "Users"
+    filename = "users_export"
+    filter = staticmethod(filters.filter_users)
+    columns = (
+        Column("Email", lambda user: user.email),
+        Column("Date Joined", lambda user: _date(user.date_joined, "%d/%m/%Y %H:%M")),
+        Column("Last Login", lambda user: _date(user.last_login, "%d/%m/%Y %H:%M", "N/A")),
+        Column("Is Active", lambda user: _yes_no(user.is_active)),
+        Column("Is Staff", lambda user: _yes_no(user.is_staff)),
+        Column("Is Admin", lambda user: _yes_no(user.is_superuser)),
+    )
+    models = (Account,)
+
+    def get_queryset(self):
+        return Account.objects.all().order_by("-date_joined")
+
+
+class EmployeeExport(Dataset):
+    name = "employees"
+    title = "Employees"
+    filename = "employees_export"
+    filter = staticmethod(filters.filter_employees)
+    columns = (
+        Column("First Name", lambda emp: emp.first_name),
+        Column("Last Name", lambda emp: emp.last_name),
+        Column("Phone Number", lambda emp: emp.phone_number),
+        Column("Address", lambda emp: emp.address),
+        Column("Employment Date", lambda emp: _date(emp.employment_date)),
+        Column("User Email", lambda emp: emp.user.email if emp.user else "N/A"),
+        Column(
+            "User Status",
+            lambda emp: "Active" if emp.user and emp.user.is_active else "Inactive",
+        ),
+    )
+    models = (Employee, Account)
+
+    def get_queryset(self):
+        return Employee.objects.select_related("user").order_by("-updated_at")
+
+
+class CustomerExport(Dataset):
+    name = "customers"
+    title = "Customers"
+    filename = "customers_export"
+    filter = staticmethod(filters.filter_customers)
+    columns = (
+        Column("First Name", lambda customer: customer.first_name),
+        Column("Last Name", lambda customer: customer.last_name),
+        Column("Phone Number", lambda customer: customer.phone_number),
+        Column("Address", lambda customer: customer.address),
+        Column("User Email", lambda customer: customer.user.email if customer.user else "N/A"),
+        Column(
+            "User Status",
+            lambda customer: (
+                "Active" if customer.user and customer.user.is_active else "Inactive"
+            ),
+        ),
+    )
+    models = (Customer, Account)
+
+    def get_queryset(self):
+        return Customer.objects.select_related("user").order_by("-updated_at")
+
+
+class RentalItemTypeExport(Dataset):
+    name = "rental_item_types"
+    title = "Rental Item Types"
+    filename = "rental_item_types_export"
+    filter = staticmethod(filters.filter_rental_item_types)
+    columns = (
+        Column("Type Name", lambda item_type: item_type.type_name),
+        Column("Size", lambda item_type: item_type.size or "N/A"),
+        Column("Capacity", lambda item_type: item_type.capacity or "N/A"),
+        Column("Rental Price Per Day", lambda item_type: item_type.rental_price_per_day),
+        Column("Replacement Cost", lambda item_type: item_type.replacement_cost),
+        Column("Description", lambda item_type: item_type.description or "N/A"),
+    )
+    models = (RentalItemType,)
+
+    def get_queryset(self):
+        return RentalItemType.objects.all().order_by("-updated_at")
+
+
+class RentalItemExport(Dataset):
+    name = "rental_items"
+    title = "Rental Items"
+    filename = "rental_items_export"
+    filter = staticmethod(filters.filter_rental_items)
+    columns = (
+        Column("Serial Number", lambda item: item.serial_number),
+        Column("Item Type", lambda item: str(item.item_type)),
+        Column("Status", lambda item: item.get_status_display()),
+        Column("Purchase Date", lambda item: _date(item.purchase_date)),
+        Column("Last Inspection Date", lambda item: _date(item.last_inspection_date)),
+        Column("Condition Notes", lambda item: item.condition_notes or "N/A"),
+    )
+    models = (RentalItem, RentalItemType)
+
+    def get_queryset(self):
+        return RentalItem.objects.select_related("item_type").order_by("-updated_at")
+
+
+class AccessoryExport(Dataset):
+    name = "accessories"
+    title = "Accessories"
+    filename = "accessories_export"
+    filter = staticmethod(filters.filter_accessories)
+    columns = (
+        Column("Accessory Name", lambda accessory: accessory.accessory_name),
+        Column("Item Type", lambda accessory: str(accessory.item_type)),
+        Column("Standard Quantity", lambda accessory: accessory.standard_quantity),
+        Column("Replacement Cost", lambda accessory: accessory.replacement_cost),
+    )
+    models = (Accessory, RentalItemType)
+
+    def get_queryset(self):
+        return Accessory.objects.select_related("item_type").order_by("-updated_at")
+
+
+def _set_components(item_set):
+    components = ", ".join(
+        f"{c.item_type.type_name} x {c.quantity}" for c in item_set.itemsetcomponent_set.all()
+    )
+    return components or "None"
+
+
+class ItemSetExport(Dataset):
+    name = "item_sets"
+    title = "Item Sets"
+    filename = "item_sets_export"
+    filter = staticmethod(filters.filter_item_sets)
+    columns = (
+        Column("Set Name", lambda item_set: item_set.name),
+        Column("Description", lambda item_set: item_set.description or "N/A"),
+        Column("Base Price", lambda item_set: item_set.base_price),
+        Column("Replacement Deposit", lambda item_set: item_set.replacement_deposit),
+        Column("Components", _set_components),
+    )
+    models = (ItemSet, ItemSetComponent, RentalItemType)
+
+    def get_queryset(self):
+        return (
+            ItemSet.objects.all()
+            .order_by("name")
+            .prefetch_related("itemsetcomponent_set__item_type")
+        )
+
+
+def _rented_items(rental):
+    # Both lists are prefetched by RentalTransactionExport.get_queryset()
+    return (
+        "; ".join(
+            [f"{d.quantity} x {d.item_set.name} (Set)" for d in rental.export_set_details]
+            + [
+                f"{d.quantity} x {d.item.item_type} ({d.item.serial_number})"
+                for d in rental.export_item_details
+            ]
+        )
+        or "None"
+    )
+
+
+class RentalTransactionExport(Dataset):
+    name = "rental_transactions"
+    title = "Rental Transactions"
+    filename = "rental_transactions_export"
+    filter = staticmethod(filters.filter_rental_transactions)
+    columns = (
+        Column("Transaction ID", lambda rental: rental.id),
+        Column(
+            "Customer Name",
+            lambda rental: rental.customer.first_name + " " + rental.customer.last_name,
+        ),
+        Column(
+            "Customer Email",
+            lambda rental: rental.customer.user.email if rental.customer.user else "N/A",
+        ),
+        Column(
+            "Rental Dates",
+            lambda rental: f"{_date(rental.start_date)} - {_date(rental.end_date)}",
+        ),
+        Column("Total Days", lambda rental: rental.total_rental_days),
+        Column("Items/Sets Rented", _rented_items, key="items_rented"),
+        Column("Total Deposit", lambda rental: rental.total_deposit),
+        Column("Total Rental Cost", lambda rental: rental.total_rental_cost),
+        Column("Amount Paid", lambda rental: rental.amount_paid),
+        Column("Payment Status", lambda rental: rental.get_payment_status_display()),
+        Column("Created At", lambda rental: _date(rental.created_at, "%d/%m/%Y %H:%M")),
+    )
+    models = (
+        RentalTransaction,
+        RentalItemDetail,
+        RentalSetDetail,
+        Payment,
+        Customer,
+        Account,
+        RentalItem,
+        RentalItemType,
+        ItemSet,
+    )
+
+    def get_queryset(self):
+        return (
+            RentalTransaction.objects.with_financials()
+            .select_related("customer__user")
+            .prefetch_related(
+                # Only items rented individually; set components are listed through their set
+                Prefetch(
+                    "rentalitemdetail_set",
+                    queryset=RentalItemDetail.objects.filter(
+                        set_rental__isnull=True
+                    ).select_related("item__item_type"),
+                    to_attr="export_item_details",
+                ),
+                Prefetch(
+                    "rentalsetdetail_set",
+                    queryset=RentalSetDetail.objects.select_related("item_set"),
+                    to_attr="export_set_details",
+                ),
+            )
+            .order_by("-start_date", "-created_at")
+        )
+
+
+def _payment_customer(payment):
+    if payment.rental and payment.rental.customer:
+        return payment.rental.customer.first_name + " " + payment.rental.customer.last_name
+    return "N/A"
+
+
+class RevenueExport(Dataset):
+    name = "revenue_report"
+    title = "Revenue Report"
+    filter = staticmethod(filters.filter_payments)
+    columns = (
+        Column("Payment Date", lambda payment: _date(payment.transaction_date, "%Y-%m-%d %H:%M")),
+        Column("Rental ID", lambda payment: payment.rental.id if payment.rental else "N/A"),
+        Column("Customer", _payment_customer),
+        Column("Amount", lambda payment: payment.amount),
+        Column("Payment Type", lambda payment: payment.get_payment_type_display()),
+        Column("Payment Method", lambda payment: payment.get_payment_method_display()),
+        Column("Notes", lambda payment: payment.notes or ""),
+    )
+    models = (Payment, RentalTransaction, Customer)
+
+    def get_queryset(self):
+        return Payment.objects.select_related("rental__customer__user").order_by(
+            "-transaction_date"
+        )
+
+    def get_filename(self):
+        year, month, _ = filters.revenue_period(self.params)
+        filename_month = f"_month-{month}" if month else ""
+        return f"revenue_report_{year}{filename_month}"
+
+
+DATASETS = {
+    dataset.name: dataset
+    for dataset in (
+        UserExport,
+        EmployeeExport,
+        CustomerExport,
+        RentalItemTypeExport,
+        RentalItemExport,
+        AccessoryExport,
+        ItemSetExport,
+        RentalTransactionExport,
+        RevenueExport,
+    )
+}
+
+
+def version_querysets(dataset_class):
+    """One queryset per model of the dataset, whose summary is the data's version."""
+    return [model.objects.all() for model in dataset_class.models]
+
+
+# --- Formats ---
+
+
+class _Echo:
+    """File-like object whose write() hands the line back, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(headers, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(keys, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(keys, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+CONTENT_TYPES = {
+    "xlsx": XLSX_CONTENT_TYPE,
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson; charset=utf-8",
+}
+
+
+def write_file(dataset, export_format, output, rows=None):
+    """Writes a whole export to the binary file object output (used by export jobs)."""
+    rows = dataset.rows() if rows is None else rows
+    if export_format == "xlsx":
+        sheet = StreamingSheet(dataset.title)
+        sheet.append(dataset.headers())
+        for row in rows:
+            sheet.append(row)
+        sheet.save(output)
+    elif export_format == "csv":
+        for line in csv_lines(dataset.headers(), rows):
+            output.write(line.encode())
+    elif export_format == "ndjson":
+        for line in ndjson_lines(dataset.keys(), rows):
+            output.write(line.encode())
+    else:
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+
+def _streaming_response(lines, content_type, filename):
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def render_xlsx(dataset):
+    sheet = StreamingSheet(dataset.title)
+    sheet.append(dataset.headers())
+    for row in dataset.rows():
+        sheet.append(row)
+    return sheet.as_response(f"{dataset.get_filename()}.xlsx")
+
+
+def render_csv(dataset):
+    return _streaming_response(
+        csv_lines(dataset.headers(), dataset.rows()),
+        CONTENT_TYPES["csv"],
+        f"{dataset.get_filename()}.csv",
+    )
+
+
+def render_ndjson(dataset):
+    return _streaming_response(
+        ndjson_lines(dataset.keys(), dataset.rows()),
+        CONTENT_TYPES["ndjson"],
+        f"{dataset.get_filename()}.ndjson",
+    )
+
+
+FORMATS = {
+    "xlsx": render_xlsx,
+    "csv": render_csv,
+    "ndjson": render_ndjson,
+}
+
+
+def export_response(request, dataset_class):
+    """Streams dataset_class filtered by the request's querystring in the requested format."""
+    export_format = request.GET.get(FORMAT_PARAM, DEFAULT_FORMAT)
+    renderer = FORMATS.get(export_format)
+    if renderer is None:
+        return JsonResponse(
+            {"error": f"Unsupported export format. Use one of: {', '.join(FORMATS)}."},
+            status=400,
+        )
+    return renderer(dataset_class(request.GET))
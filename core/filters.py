@@ -0,0 +1,124 @@
+"""
+Querystring filters shared by the dashboard list views and their exports.
+
+Each filter takes a queryset and the request's GET parameters and returns the
+filtered queryset together with a list of problems found in the parameters.
+List views show those problems as messages; exports ignore them, so both apply
+exactly the same filters to the same querystring. Text searches go through
+core.search.
+"""
+
+from django.db.models import Q
+from django.utils import timezone
+
+from core import search
+
+SEARCH_PARAM = "search"
+
+
+def _parse_date(value):
+    return timezone.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _search(queryset, params, index_name):
+    return search.filter_queryset(queryset, index_name, params.get(SEARCH_PARAM, ""))
+
+
+def _icontains(queryset, params, *fields):
+    query = params.get(SEARCH_PARAM, "")
+    if not query:
+        return queryset
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f"{field}__icontains": query})
+    return queryset.filter(condition)
+
+
+def filter_users(queryset, params):
+    return _search(queryset, params, "users"), []
+
+
+def filter_employees(queryset, params):
+    return _search(queryset, params, "employees"), []
+
+
+def filter_customers(queryset, params):
+    return _search(queryset, params, "customers"), []
+
+
+def filter_rental_item_types(queryset, params):
+    return _icontains(queryset, params, "type_name"), []
+
+
+def filter_rental_items(queryset, params):
+    return _search(queryset, params, "rental_items"), []
+
+
+def filter_accessories(queryset, params):
+    return _search(queryset, params, "accessories"), []
+
+
+def filter_item_sets(queryset, params):
+    return _search(queryset, params, "item_sets"), []
+
+
+def filter_rental_transactions(queryset, params):
+    """Status, customer (name/email) and rental date range filters."""
+    errors = []
+    status_filter = params.get("status")
+    customer_filter = params.get("customer")
+    date_from_filter = params.get("date_from")
+    date_to_filter = params.get("date_to")
+
+    if status_filter:
+        queryset = queryset.filter(payment_status=status_filter)
+
+    if customer_filter:
+        queryset = queryset.filter(search.matches("rental_transactions", customer_filter))
+
+    if date_from_filter:
+        try:
+            queryset = queryset.filter(start_date__gte=_parse_date(date_from_filter))
+        except ValueError:
+            errors.append("Invalid 'Date From' format. Please use YYYY-MM-DD.")
+
+    if date_to_filter:
+        try:
+            # Rentals ENDING on or before the specified date
+            queryset = queryset.filter(end_date__lte=_parse_date(date_to_filter))
+        except ValueError:
+            errors.append("Invalid 'Date To' format. Please use YYYY-MM-DD.")
+
+    return queryset, errors
+
+
+def revenue_period(params):
+    """Returns (year, month or None, errors) for the revenue report filters."""
+    errors = []
+    current_year = timezone.now().year
+    try:
+        year = int(params.get("year", current_year))
+    except ValueError:
+        errors.append("Invalid year selected.")
+        year = current_year
+
+    month = None
+    selected_month = params.get("month", "")
+    if selected_month:
+        try:
+            month_int = int(selected_month)
+            if 1 <= month_int <= 12:
+                month = month_int
+            else:
+                errors.append("Invalid month selected.")
+        except ValueError:
+            errors.append("Invalid month format.")
+    return year, month, errors
+
+
+def filter_payments(queryset, params):
+    year, month, errors = revenue_period(params)
+    queryset = queryset.filter(transaction_date__year=year)
+    if month is not None:
+        queryset = queryset.filter(transaction_date__month=month)
+    return queryset, errors
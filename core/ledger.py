@@ -0,0 +1,105 @@
+"""
+Materialized ledger columns on RentalTransaction.
+
+rental_cost_total, amount_paid_total and balance_due are stored so that the
+returns desk can sort and filter on the outstanding balance through an index.
+They are refreshed inside the same database transaction as the change that
+affects them (signal receivers in core.signals), and can be rebuilt or verified
+with `manage.py rebuild_ledger`.
+"""
+
+import decimal
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from core.models import RentalTransaction
+
+LEDGER_FIELDS = ("rental_cost_total", "amount_paid_total", "balance_due")
+CENTS = decimal.Decimal("0.01")
+
+
+def expected_values(rental):
+    """Ledger values for a transaction fetched with with_financials()."""
+    cost = rental.total_rental_cost.quantize(CENTS)
+    paid = rental.amount_paid.quantize(CENTS)
+    return {
+        "rental_cost_total": cost,
+        "amount_paid_total": paid,
+        "balance_due": (cost + rental.total_fines - paid).quantize(CENTS),
+    }
+
+
+def stored_values(rental):
+    return {field: getattr(rental, field) for field in LEDGER_FIELDS}
+
+
+def refresh(rental_id):
+    """Recomputes and stores the ledger columns of one transaction."""
+    with transaction.atomic():
+        rental = (
+            RentalTransaction.objects.with_financials()
+            .select_for_update()
+            .filter(pk=rental_id)
+            .first()
+        )
+        if rental is None:  # Being deleted together with its details/payments
+            return None
+        values = expected_values(rental)
+        # update() rather than save() so RentalTransaction signals don't fire again
+        RentalTransaction.objects.filter(pk=rental_id).update(**values)
+        return values
+
+
+_state = threading.local()
+
+
+def schedule(rental_id):
+    """Refreshes a ledger now, or at the end of the enclosing batch() block."""
+    pending = getattr(_state, "pending", None)
+    if pending is None:
+        refresh(rental_id)
+    else:
+        pending.add(rental_id)
+
+
+@contextmanager
+def batch():
+    """
+    Defers ledger refreshes until the block exits, so a booking that writes many
+    details and payments refreshes each affected transaction only once.
+    Nothing is refreshed if the block raises; the surrounding atomic() rolls back.
+    """
+    if getattr(_state, "pending", None) is not None:  # Already inside a batch
+        yield
+        return
+
+    _state.pending = set()
+    try:
+        yield
+        pending = _state.pending
+    finally:
+        _state.pending = None
+    for rental_id in pending:
+        refresh(rental_id)
+
+
+def rebuild(check_only=False, batch_size=500):
+    """
+    Compares every transaction's stored ledger with freshly computed values.
+    Returns the ids of transactions that were out of date; fixes them unless check_only.
+    """
+    stale = []
+    for rental in (
+        RentalTransaction.objects.with_financials().order_by("pk").iterator(chunk_size=batch_size)
+    ):
+        values = expected_values(rental)
+        if stored_values(rental) != values:
+            for field, value in values.items():
+                setattr(rental, field, value)
+            stale.append(rental)
+
+    if stale and not check_only:
+        RentalTransaction.objects.bulk_update(stale, LEDGER_FIELDS, batch_size=batch_size)
+    return [rental.pk for rental in stale]
@@ -0,0 +1,92 @@
+import decimal
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import openpyxl
+from django.core.management.base import BaseCommand
+
+from core.exports import csv_lines, ndjson_lines
+from core.spreadsheets import StreamingSheet
+
+HEADERS = [
+    "Payment Date",
+    "Rental ID",
+    "Customer",
+    "Amount",
+    "Payment Type",
+    "Payment Method",
+    "Notes",
+]
+
+
+def sample_rows(count):
+    """Rows shaped like the revenue report export."""
+    started = datetime(2024, 1, 1, 9, 0)
+    for index in range(count):
+        yield [
+            (started + timedelta(minutes=index)).strftime("%Y-%m-%d %H:%M"),
+            index // 3 + 1,
+            f"Customer {index % 500}",
+            decimal.Decimal(index % 1000) + decimal.Decimal("0.50"),
+            "Rental Fee",
+            "Bank Transfer",
+            "",
+        ]
+
+
+class Command(BaseCommand):
+    help = "Compares peak memory and time of the XLSX, CSV and NDJSON export formats."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000, help="Rows to export.")
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        self.stdout.write(f"Exporting {rows} rows")
+        for label, build in (
+            ("In-memory workbook", self.build_in_memory),
+            ("Write-only workbook", self.build_write_only),
+            ("CSV", self.build_csv),
+            ("NDJSON", self.build_ndjson),
+        ):
+            # Timed and traced separately; tracemalloc slows allocation-heavy code a lot
+            with tempfile.TemporaryFile() as output:
+                started = time.perf_counter()
+                build(rows, output)
+                elapsed = time.perf_counter() - started
+                size = output.tell()
+            with tempfile.TemporaryFile() as output:
+                tracemalloc.start()
+                build(rows, output)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            self.stdout.write(
+                f"{label + ':':<21}{elapsed:6.2f} s, peak {peak / 1024 / 1024:7.1f} MiB, "
+                f"file {size / 1024 / 1024:.1f} MiB"
+            )
+
+    def build_in_memory(self, rows, output):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(HEADERS)
+        for row in sample_rows(rows):
+            sheet.append(row)
+        workbook.save(output)
+
+    def build_write_only(self, rows, output):
+        sheet = StreamingSheet("Revenue Report")
+        sheet.append(HEADERS)
+        for row in sample_rows(rows):
+            sheet.append(row)
+        sheet.save(output)
+
+    def build_csv(self, rows, output):
+        for line in csv_lines(HEADERS, sample_rows(rows)):
+            output.write(line.encode())
+
+    def build_ndjson(self, rows, output):
+        keys = [header.lower().replace(" ", "_") for header in HEADERS]
+        for line in ndjson_lines(keys, sample_rows(rows)):
+            output.write(line.encode())
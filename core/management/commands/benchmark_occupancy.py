@@ -0,0 +1,68 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import occupancy
+from core.bitmaps import OccupancyBitmap
+from core.models import ItemStatus, RentalItem, RentalItemType
+
+
+class Command(BaseCommand):
+    help = "Compares the in-process occupancy bitmaps against the ORM availability path."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=200, help="Random windows to test.")
+        parser.add_argument("--max-days", type=int, default=14, help="Longest window in days.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        today = timezone.now().date()
+        type_ids = list(RentalItemType.objects.values_list("pk", flat=True))
+        if not type_ids:
+            self.stdout.write(self.style.WARNING("No rental item types to benchmark."))
+            return
+
+        windows = []
+        for _ in range(options["queries"]):
+            start_date = today + timedelta(days=rng.randrange(0, 300))
+            end_date = start_date + timedelta(days=rng.randrange(0, options["max_days"]))
+            windows.append((rng.choice(type_ids), start_date, end_date))
+
+        started = time.perf_counter()
+        engine = OccupancyBitmap().rebuild()
+        build_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        bitmap_counts = [engine.count_free(*window) for window in windows]
+        bitmap_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        orm_counts = [self.orm_count_free(*window) for window in windows]
+        orm_ms = (time.perf_counter() - started) * 1000
+
+        mismatches = sum(1 for a, b in zip(bitmap_counts, orm_counts) if a != b)
+        queries = len(windows)
+
+        self.stdout.write(f"Items indexed:     {len(engine.bits)}")
+        self.stdout.write(f"Bitmap memory:     {engine.memory_bytes() / 1024:.1f} KiB")
+        self.stdout.write(f"Bitmap build:      {build_ms:.1f} ms")
+        self.stdout.write(
+            f"Bitmap queries:    {bitmap_ms:.1f} ms total, {bitmap_ms / queries:.3f} ms each"
+        )
+        self.stdout.write(
+            f"ORM queries:       {orm_ms:.1f} ms total, {orm_ms / queries:.3f} ms each"
+        )
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f"{mismatches} results differ from the ORM path."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Bitmap results match the ORM path."))
+
+    def orm_count_free(self, item_type_id, start_date, end_date):
+        item_ids = RentalItem.objects.filter(
+            item_type_id=item_type_id, status=ItemStatus.AVAILABLE
+        ).values_list("pk", flat=True)
+        return len(occupancy.free_item_ids(item_ids, start_date, end_date))
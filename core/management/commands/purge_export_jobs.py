@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core import export_jobs
+
+
+class Command(BaseCommand):
+    help = "Deletes finished background export jobs and their files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=7, help="Delete jobs older than this many days."
+        )
+
+    def handle(self, *args, **options):
+        count = export_jobs.purge(older_than=timedelta(days=options["days"]))
+        self.stdout.write(self.style.SUCCESS(f"Deleted {count} export job(s)."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import ledger
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the stored ledger columns (cost, paid, balance) on rental transactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only verify the stored values; exit with an error if any are out of date.",
+        )
+
+    def handle(self, *args, **options):
+        stale_ids = ledger.rebuild(check_only=options["check"])
+
+        if not stale_ids:
+            self.stdout.write(self.style.SUCCESS("All rental transaction ledgers are up to date."))
+            return
+
+        preview = ", ".join(f"#{pk}" for pk in stale_ids[:20])
+        if len(stale_ids) > 20:
+            preview += ", ..."
+        if options["check"]:
+            raise CommandError(f"{len(stale_ids)} ledger(s) out of date: {preview}")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(stale_ids)} ledger(s): {preview}"))
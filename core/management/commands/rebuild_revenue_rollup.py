@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import revenue
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the daily revenue rollup from all recorded payments."
+
+    def handle(self, *args, **options):
+        row_count = revenue.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {row_count} daily revenue row(s)."))
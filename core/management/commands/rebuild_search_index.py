@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search tables from the current data."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "indexes",
+            nargs="*",
+            help=f"Indexes to rebuild (default: all). Choices: {', '.join(search.INDEXES)}.",
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options["indexes"]) - set(search.INDEXES)
+        if unknown:
+            raise CommandError(f"Unknown search index: {', '.join(sorted(unknown))}")
+        if not search.is_available():
+            raise CommandError("Full-text search needs SQLite 3.34 or newer with FTS5.")
+
+        for name, count in search.rebuild(options["indexes"] or None).items():
+            self.stdout.write(f"{name}: {count} document(s)")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,140 @@
+"""
+Background processing of uploaded images.
+
+Resizing uploads, compressing payment slips and deleting replaced files run
+on a small in-process thread pool, queued with transaction.on_commit: the
+upload request returns as soon as its row is committed, and nothing is
+processed or deleted for a save that is rolled back.
+
+Tasks only take a storage and file names, never model instances, so a worker
+does not touch the database. Jobs on the same file run one at a time, and an
+image whose renditions are missing when a page shows it is queued once with
+`fill_in()`. Pages show the original until then; the catalogue version is
+bumped once renditions are written so its cached grid picks them up.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from core import catalog, renditions, versions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+# Longest side of a stored payment slip; still legible, a fraction of a phone photo
+MAX_SLIP_SIZE = 2048
+SLIP_QUALITY = 85
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "MEDIA_JOB_WORKERS", DEFAULT_WORKERS),
+    thread_name_prefix="media-job",
+)
+_pending = set()
+# Names with a fill_in job queued or that could not be read, and a lock per file
+_filling = set()
+_unreadable = set()
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+
+def enqueue(task, *args):
+    """Runs task(*args) on the worker pool once the current transaction commits."""
+
+    def submit():
+        future = _executor.submit(_run_in_worker, task, *args)
+        _pending.add(future)
+        future.add_done_callback(_pending.discard)
+
+    transaction.on_commit(submit)
+
+
+def _run_in_worker(task, *args):
+    try:
+        task(*args)
+    except Exception:
+        logger.exception("Media job %s%r failed", task.__name__, args)
+
+
+def drain(timeout=None):
+    """Waits for the queued jobs to finish (tests, shutdown)."""
+    wait(list(_pending), timeout=timeout)
+
+
+def _file_lock(name):
+    with _file_locks_guard:
+        return _file_locks.setdefault(name, threading.Lock())
+
+
+def _renditions_written():
+    # The catalogue grid is cached with whatever URLs were available when rendered
+    versions.bump(catalog.VERSION_NAME)
+
+
+def compress(storage, name, max_size=MAX_SLIP_SIZE):
+    """
+    Downscales the image stored as name to max_size in place, keeping its name
+    and format. Images already within max_size are left untouched.
+    """
+    with storage.open(name, "rb") as original:
+        image = Image.open(original)
+        if max(image.size) <= max_size:
+            return False
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+        buffer = BytesIO()
+        if image_format == "JPEG":
+            image.convert("RGB").save(buffer, "JPEG", quality=SLIP_QUALITY, optimize=True)
+        else:
+            image.save(buffer, image_format, optimize=True)
+    # Written beside the original and swapped in, so a failed write never loses it
+    temporary = storage.save(f"{name}.compressing", ContentFile(buffer.getvalue()))
+    os.replace(storage.path(temporary), storage.path(name))
+    return True
+
+
+def process_upload(storage, name, compress_original=False):
+    """Compresses (payment slips) and writes the renditions of a new upload."""
+    with _file_lock(name):
+        if compress_original:
+            compress(storage, name)
+        renditions.generate(storage, name, force=True)
+    _renditions_written()
+
+
+def _fill(storage, name):
+    try:
+        with _file_lock(name):
+            written = renditions.generate(storage, name)
+    except renditions.ERRORS:
+        # Keeps showing the original rather than retrying on every page view
+        _unreadable.add(name)
+        raise
+    finally:
+        _filling.discard(name)
+    if written:
+        _renditions_written()
+
+
+def fill_in(field_file):
+    """Queues writing field_file's missing renditions, unless already queued."""
+    if field_file.name not in _filling and field_file.name not in _unreadable:
+        _filling.add(field_file.name)
+        enqueue(_fill, field_file.storage, field_file.name)
+
+
+def delete_files(storage, name):
+    """Deletes a replaced or orphaned upload together with its renditions."""
+    with _file_lock(name):
+        for rendition in renditions.names(name):
+            storage.delete(rendition)
+        storage.delete(name)
+        renditions.forget(name)
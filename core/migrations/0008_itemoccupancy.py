@@ -0,0 +1,62 @@
+# Generated by Django 4.2.15 on 2026-10-18 13:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_occupancy(apps, schema_editor):
+    ItemOccupancy = apps.get_model("core", "ItemOccupancy")
+    RentalItemDetail = apps.get_model("core", "RentalItemDetail")
+    details = RentalItemDetail.objects.filter(
+        rental__payment_status__in=["pending", "paid", "partial"]
+    ).select_related("rental")
+    ItemOccupancy.objects.bulk_create(
+        [
+            ItemOccupancy(
+                detail_id=detail.pk,
+                rental_id=detail.rental_id,
+                item_id=detail.item_id,
+                start_date=detail.rental.start_date,
+                end_date=detail.rental.end_date,
+            )
+            for detail in details.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_rentaltransaction_event_location_notes_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rentalitem',
+            name='status',
+            field=models.CharField(choices=[('available', 'ຫວ່າງ'), ('under_maintenance', 'ບຳລຸງຮັກສາ'), ('retired', 'ຫມົດອາຍຸໃຊ້ງານ')], default='available', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='rentalitemtype',
+            name='type_name',
+            field=models.CharField(choices=[('tent', 'ເຕັ່ນ'), ('table', 'ໂຕະ'), ('chair', 'ຕັ່ງ'), ('fan', 'ພັດລົມ'), ('tablecloth', 'ຜ້າປູໂຕະ'), ('other', 'ອື່ນໆ')], max_length=50),
+        ),
+        migrations.CreateModel(
+            name='ItemOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('detail', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='core.rentalitemdetail')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancies', to='core.rentalitem')),
+                ('rental', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.rentaltransaction')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', 'start_date', 'end_date'], name='core_itemoc_item_id_a3f8f2_idx'), models.Index(fields=['start_date', 'end_date'], name='core_itemoc_start_d_f875e6_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.15 on 2026-10-18 13:40
+
+import decimal
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def backfill_ledger(apps, schema_editor):
+    RentalTransaction = apps.get_model("core", "RentalTransaction")
+    RentalItemDetail = apps.get_model("core", "RentalItemDetail")
+    RentalSetDetail = apps.get_model("core", "RentalSetDetail")
+    Payment = apps.get_model("core", "Payment")
+    zero = decimal.Decimal("0.00")
+    cents = decimal.Decimal("0.01")
+    line_cost = Sum(
+        F("quantity") * F("rented_price_per_day"),
+        output_field=models.DecimalField(max_digits=14, decimal_places=2),
+    )
+
+    def totals(queryset, expression):
+        rows = queryset.order_by().values("rental_id").annotate(total=expression)
+        return {row["rental_id"]: decimal.Decimal(row["total"] or 0) for row in rows}
+
+    item_costs = totals(RentalItemDetail.objects.filter(set_rental__isnull=True), line_cost)
+    set_costs = totals(RentalSetDetail.objects.all(), line_cost)
+    paid = totals(Payment.objects.all(), Sum("amount"))
+
+    rentals = list(RentalTransaction.objects.all())
+    for rental in rentals:
+        days = max(1, (rental.end_date - rental.start_date).days + 1)
+        per_day = item_costs.get(rental.pk, zero) + set_costs.get(rental.pk, zero)
+        rental.rental_cost_total = (per_day * days).quantize(cents)
+        rental.amount_paid_total = paid.get(rental.pk, zero).quantize(cents)
+        rental.balance_due = (
+            rental.rental_cost_total + rental.total_fines - rental.amount_paid_total
+        ).quantize(cents)
+    RentalTransaction.objects.bulk_update(
+        rentals, ["rental_cost_total", "amount_paid_total", "balance_due"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_itemoccupancy"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="rentaltransaction",
+            name="amount_paid_total",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name="rentaltransaction",
+            name="balance_due",
+            field=models.DecimalField(
+                db_index=True, decimal_places=2, default=0, max_digits=14
+            ),
+        ),
+        migrations.AddField(
+            model_name="rentaltransaction",
+            name="rental_cost_total",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
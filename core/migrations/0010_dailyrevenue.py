@@ -0,0 +1,89 @@
+# Generated by Django 4.2.15 on 2026-10-18 13:42
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_revenue(apps, schema_editor):
+    DailyRevenue = apps.get_model("core", "DailyRevenue")
+    Payment = apps.get_model("core", "Payment")
+    grouped = (
+        Payment.objects.order_by()
+        .annotate(day=TruncDate("transaction_date"))
+        .values("day", "payment_type", "payment_method")
+        .annotate(total=Sum("amount"), count=Count("id"))
+    )
+    DailyRevenue.objects.bulk_create(
+        [
+            DailyRevenue(
+                date=row["day"],
+                payment_type=row["payment_type"],
+                payment_method=row["payment_method"],
+                total_amount=row["total"],
+                payment_count=row["count"],
+            )
+            for row in grouped
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_rentaltransaction_ledger"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyRevenue",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("date", models.DateField()),
+                (
+                    "payment_type",
+                    models.CharField(
+                        choices=[
+                            ("deposit", "Deposit"),
+                            ("rental_fee", "Rental Fee"),
+                            ("damage_fine", "Damage Fine"),
+                            ("other", "Other"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "payment_method",
+                    models.CharField(
+                        choices=[
+                            ("bank_transfer", "Bank Transfer"),
+                            ("cash", "Cash"),
+                            ("credit_card", "Credit Card"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "total_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("payment_count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["-date", "payment_type", "payment_method"],
+                "unique_together": {("date", "payment_type", "payment_method")},
+            },
+        ),
+        migrations.RunPython(backfill_daily_revenue, migrations.RunPython.noop),
+    ]
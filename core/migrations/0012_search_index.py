@@ -0,0 +1,61 @@
+import sqlite3
+
+from django.db import migrations
+
+# name -> (app label, model, document fields); mirrors core.search.INDEXES
+SEARCH_INDEXES = {
+    "customers": ("accounts", "Customer", ("first_name", "last_name", "phone_number")),
+    "users": ("accounts", "Account", ("email",)),
+    "employees": ("accounts", "Employee", ("first_name", "last_name", "phone_number")),
+    "rental_items": ("core", "RentalItem", ("serial_number",)),
+    "accessories": ("core", "Accessory", ("accessory_name",)),
+    "item_sets": ("core", "ItemSet", ("name", "description")),
+    "rental_transactions": (
+        "core",
+        "RentalTransaction",
+        ("customer__first_name", "customer__last_name", "customer__user__email"),
+    ),
+}
+
+
+def _supports_fts(connection):
+    return connection.vendor == "sqlite" and sqlite3.sqlite_version_info >= (3, 34, 0)
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if not _supports_fts(connection):
+        return
+    with connection.cursor() as cursor:
+        for name, (app_label, model_name, fields) in SEARCH_INDEXES.items():
+            table = f"core_search_{name}"
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} "
+                "USING fts5(content, tokenize='trigram')"
+            )
+            model = apps.get_model(app_label, model_name)
+            rows = [
+                (pk, " | ".join(str(value) for value in values if value))
+                for pk, *values in model.objects.values_list("pk", *fields)
+            ]
+            cursor.executemany(f"INSERT INTO {table} (rowid, content) VALUES (%s, %s)", rows)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if not _supports_fts(connection):
+        return
+    with connection.cursor() as cursor:
+        for name in SEARCH_INDEXES:
+            cursor.execute(f"DROP TABLE IF EXISTS core_search_{name}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0002_alter_customer_address"),
+        ("core", "0011_exportjob"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
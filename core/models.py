@@ -1,12 +1,18 @@
 import decimal
 
 from django.db import models
-from django.db.models import Count, F, Sum
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.urls import reverse
 
 from accounts.models import Account, Customer
 from common.models import BaseModel
-from core.utils import item_set_storage, payment_slip_storage, rental_item_storage
+from core.utils import (
+    export_file_storage,
+    item_set_storage,
+    payment_slip_storage,
+    rental_item_storage,
+)
 
 
 class ItemStatus(models.TextChoices):
@@ -66,6 +72,13 @@ class PaymentMethod(models.TextChoices):
     CREDIT_CARD = "credit_card", "Credit Card"
 
 
+class ExportStatus(models.TextChoices):
+    PENDING = "pending", "Pending"
+    RUNNING = "running", "Running"
+    DONE = "done", "Done"
+    FAILED = "failed", "Failed"
+
+
 class RentalItemType(BaseModel):
     type_name = models.CharField(max_length=50, choices=ItemType.choices)
     description = models.TextField(blank=True)
@@ -105,6 +118,68 @@ class RentalItem(BaseModel):
         return reverse("home")  # Placeholder
 
 
+def count_possible_sets(components, available_map):
+    """
+    Number of complete sets that can be built from the available items.
+    components is an iterable of (item_type_id, quantity) pairs and
+    available_map maps item_type_id to the count of available items.
+    """
+    min_possible_sets = float("inf")  # Start with infinity
+
+    for item_type_id, required_quantity in components:
+        if required_quantity == 0:  # Avoid division by zero if quantity is somehow 0
+            continue
+        available_count = available_map.get(item_type_id, 0)
+        min_possible_sets = min(min_possible_sets, available_count // required_quantity)
+
+    # If min_possible_sets is still infinity, the set has no usable components
+    return int(min_possible_sets) if min_possible_sets != float("inf") else 0
+
+
+class ItemSetQuerySet(models.QuerySet):
+    def available_quantities(self):
+        """
+        Returns {item_set_id: available complete sets} for every set in this queryset.
+        Uses one fetch of the components and one grouped count of available items,
+        no matter how many sets there are.
+        """
+        return self._available_quantities_for(self.values_list("pk", flat=True))
+
+    def _available_quantities_for(self, set_ids):
+        components_by_set = {set_id: [] for set_id in set_ids}
+        type_ids = set()
+        for set_id, item_type_id, quantity in ItemSetComponent.objects.filter(
+            item_set_id__in=set_ids
+        ).values_list("item_set_id", "item_type_id", "quantity"):
+            components_by_set[set_id].append((item_type_id, quantity))
+            type_ids.add(item_type_id)
+
+        available_map = {}
+        if type_ids:
+            available_map = dict(
+                RentalItem.objects.filter(item_type_id__in=type_ids, status=ItemStatus.AVAILABLE)
+                .values("item_type_id")
+                .annotate(count=Count("id"))
+                .values_list("item_type_id", "count")
+            )
+
+        return {
+            set_id: count_possible_sets(components, available_map)
+            for set_id, components in components_by_set.items()
+        }
+
+    def with_available_quantity(self):
+        """
+        Evaluates the queryset and primes available_quantity on every set,
+        so reading it in a loop or template does not hit the database.
+        """
+        item_sets = list(self)
+        quantities = self._available_quantities_for([item_set.pk for item_set in item_sets])
+        for item_set in item_sets:
+            item_set._available_quantity = quantities.get(item_set.pk, 0)
+        return item_sets
+
+
 class ItemSet(BaseModel):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -112,6 +187,8 @@ class ItemSet(BaseModel):
     replacement_deposit = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to=item_set_storage, null=True, blank=True)
 
+    objects = ItemSetQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name}"
 
@@ -128,38 +205,12 @@ class ItemSet(BaseModel):
         """
         Calculate how many complete sets are currently available based on
         the availability of their components.
-        This performs database queries, use with caution in loops or list views.
-        Consider caching this value if performance becomes an issue.
+        Uses the value primed by ItemSetQuerySet.with_available_quantity() when present;
+        otherwise this performs database queries, so prefer the bulk API in loops.
         """
-        components = self.itemsetcomponent_set.select_related("item_type").all()
-        if not components.exists():
-            return 0
-
-        # Use aggregation for potentially better performance than looping N times
-        component_types = components.values_list("item_type_id", "quantity")
-        type_ids = [ct[0] for ct in component_types]
-
-        # Get counts of available items for all relevant types in one query
-        available_item_counts = (
-            RentalItem.objects.filter(item_type_id__in=type_ids, status=ItemStatus.AVAILABLE)
-            .values("item_type_id")
-            .annotate(count=Count("id"))
-        )
-
-        # Create a dictionary for easy lookup: {item_type_id: available_count}
-        available_map = {item["item_type_id"]: item["count"] for item in available_item_counts}
-
-        min_possible_sets = float("inf")  # Start with infinity
-
-        for item_type_id, required_quantity in component_types:
-            available_count = available_map.get(item_type_id, 0)
-            if required_quantity == 0:  # Avoid division by zero if quantity is somehow 0
-                continue
-            possible_sets_for_component = available_count // required_quantity
-            min_possible_sets = min(min_possible_sets, possible_sets_for_component)
-
-        # If min_possible_sets is still infinity, it means a component type was missing entirely
-        return int(min_possible_sets) if min_possible_sets != float("inf") else 0
+        if hasattr(self, "_available_quantity"):
+            return self._available_quantity
+        return ItemSet.objects.filter(pk=self.pk).available_quantities().get(self.pk, 0)
 
     def get_absolute_url(self):
         # Example: URL to view the set details or add it to selection
@@ -179,6 +230,41 @@ class ItemSetComponent(BaseModel):
         return f"{self.item_set.name} - {self.quantity} x {self.item_type}"
 
 
+MONEY_FIELD = models.DecimalField(max_digits=14, decimal_places=2)
+
+
+def _sum_subquery(queryset, expression):
+    """Correlated subquery summing expression over queryset, 0 when there are no rows."""
+    total = (
+        queryset.order_by()
+        .values("rental")
+        .annotate(total=Sum(expression, output_field=MONEY_FIELD))
+        .values("total")
+    )
+    return Coalesce(Subquery(total), Value(decimal.Decimal("0.00")), output_field=MONEY_FIELD)
+
+
+class RentalTransactionQuerySet(models.QuerySet):
+    def with_financials(self):
+        """
+        Annotates the per-day rental cost and the amount paid through subqueries,
+        so total_rental_cost and amount_paid need no extra queries.
+        """
+        line_cost = F("quantity") * F("rented_price_per_day")
+        return self.annotate(
+            annotated_item_cost_per_day=_sum_subquery(
+                RentalItemDetail.objects.filter(rental=OuterRef("pk"), set_rental__isnull=True),
+                line_cost,
+            ),
+            annotated_set_cost_per_day=_sum_subquery(
+                RentalSetDetail.objects.filter(rental=OuterRef("pk")), line_cost
+            ),
+            annotated_amount_paid=_sum_subquery(
+                Payment.objects.filter(rental=OuterRef("pk")), F("amount")
+            ),
+        )
+
+
 class RentalTransaction(BaseModel):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
     start_date = models.DateField()
@@ -191,6 +277,12 @@ class RentalTransaction(BaseModel):
     event_location_notes = models.TextField(
         blank=True, null=True, help_text="Address or notes about the event location."
     )
+    # Ledger columns, maintained by core.ledger whenever details, payments or fines change
+    rental_cost_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    amount_paid_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    balance_due = models.DecimalField(max_digits=14, decimal_places=2, default=0, db_index=True)
+
+    objects = RentalTransactionQuerySet.as_manager()
 
     class Meta:
         ordering = ["-start_date", "-created_at"]  # Order by start date descending
@@ -211,6 +303,10 @@ class RentalTransaction(BaseModel):
         total_cost = decimal.Decimal("0.00")
         duration = self.total_rental_days
 
+        # Use the values annotated by with_financials() when available
+        if hasattr(self, "annotated_item_cost_per_day"):
+            return (self.annotated_item_cost_per_day + self.annotated_set_cost_per_day) * duration
+
         # Sum cost from individual items
         item_cost = self.rentalitemdetail_set.filter(set_rental__isnull=True).aggregate(
             total=Sum(F("quantity") * F("rented_price_per_day"))
@@ -228,18 +324,14 @@ class RentalTransaction(BaseModel):
     @property
     def amount_paid(self):
         """Calculate the total amount paid for this rental (excluding cancelled/refunded)."""
+        if hasattr(self, "annotated_amount_paid"):
+            return self.annotated_amount_paid
         return self.payment_set.filter(
             rental=self,
             # Exclude potentially reversed payments if needed
             # payment_type__in=[PaymentType.DEPOSIT, PaymentType.RENTAL_FEE, PaymentType.DAMAGE_FINE]
         ).aggregate(total=Sum("amount"))["total"] or decimal.Decimal("0.00")
 
-    @property
-    def balance_due(self):
-        """Calculate the remaining balance."""
-        # This is a simplified balance; real calculation might depend on payment types, fines, etc.
-        return (self.total_rental_cost + self.total_fines) - self.amount_paid
-
 
 class RentalSetDetail(BaseModel):
     rental = models.ForeignKey(RentalTransaction, on_delete=models.CASCADE)
@@ -277,6 +369,32 @@ class RentalItemDetail(BaseModel):
             return f"Rental #{self.rental.id} - {self.item} (Individual)"
 
 
+class ItemOccupancy(BaseModel):
+    """
+    Denormalized booked interval for one rented item.
+    Mirrors RentalItemDetail rows of transactions that still block the item,
+    so availability checks can hit a single indexed table instead of joining
+    through RentalTransaction. Kept in sync by core.signals / core.occupancy.
+    """
+
+    detail = models.OneToOneField(
+        RentalItemDetail, on_delete=models.CASCADE, related_name="occupancy"
+    )
+    rental = models.ForeignKey(RentalTransaction, on_delete=models.CASCADE)
+    item = models.ForeignKey(RentalItem, on_delete=models.CASCADE, related_name="occupancies")
+    start_date = models.DateField()
+    end_date = models.DateField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["item", "start_date", "end_date"]),
+            models.Index(fields=["start_date", "end_date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.item} booked {self.start_date} - {self.end_date} (Rental #{self.rental_id})"
+
+
 class Accessory(BaseModel):
     item_type = models.ForeignKey(RentalItemType, on_delete=models.CASCADE)
     accessory_name = models.CharField(max_length=100)
@@ -373,3 +491,105 @@ class Payment(BaseModel):
 
     def __str__(self):
         return f"Payment #{self.id} ({self.amount} via {self.get_payment_method_display()}) for Rental #{self.rental.id}"
+
+
+class DailyRevenue(BaseModel):
+    """
+    Payments rolled up per local calendar day, payment type and method.
+    Maintained by core.revenue on every Payment save/delete; rebuilt by
+    `manage.py rebuild_revenue_rollup`.
+    """
+
+    date = models.DateField()
+    payment_type = models.CharField(max_length=20, choices=PaymentType.choices)
+    payment_method = models.CharField(max_length=20, choices=PaymentMethod.choices)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payment_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("date", "payment_type", "payment_method")
+        ordering = ["-date", "payment_type", "payment_method"]
+
+    def __str__(self):
+        return f"{self.date} {self.get_payment_type_display()} / {self.get_payment_method_display()}: {self.total_amount}"
+
+
+class ExportJob(BaseModel):
+    """
+    An export built in the background by core.export_jobs. Jobs with the same
+    fingerprint (dataset, format, filters and data version) share one file.
+    """
+
+    dataset = models.CharField(max_length=50)
+    export_format = models.CharField(max_length=10)
+    params = models.JSONField(default=dict, blank=True)
+    fingerprint = models.CharField(max_length=40, db_index=True)
+    status = models.CharField(
+        max_length=20, choices=ExportStatus.choices, default=ExportStatus.PENDING
+    )
+    rows_written = models.PositiveIntegerField(default=0)
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    file = models.FileField(upload_to=export_file_storage, null=True, blank=True)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(
+        Account, on_delete=models.SET_NULL, null=True, blank=True, related_name="export_jobs"
+    )
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return (
+            f"Export #{self.id} ({self.dataset}.{self.export_format}) - {self.get_status_display()}"
+        )
+
+    @property
+    def progress(self):
+        """Percentage of rows written, 0-100."""
+        if self.status == ExportStatus.DONE:
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(99, self.rows_written * 100 // self.total_rows)
+
+
+class Cart(BaseModel):
+    """
+    A user's booking selection, kept in the database (see core.carts) so it is
+    not rewritten into the session on every change and follows the user across
+    devices.
+    """
+
+    user = models.OneToOneField(Account, on_delete=models.CASCADE, related_name="cart")
+    # Total quantity over the lines, shown in the navbar; maintained by core.carts
+    line_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Cart of {self.user} ({self.line_count})"
+
+
+class CartLine(BaseModel):
+    """One selected item or set in a Cart; exactly one of item and item_set is set."""
+
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name="lines")
+    item = models.ForeignKey(RentalItem, on_delete=models.CASCADE, null=True, blank=True)
+    item_set = models.ForeignKey(ItemSet, on_delete=models.CASCADE, null=True, blank=True)
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        ordering = ["created_at"]
+        constraints = [
+            # Plain (not partial) unique constraints so adds can upsert with ON CONFLICT;
+            # NULLs never conflict, so item lines and set lines don't collide.
+            models.UniqueConstraint(fields=["cart", "item"], name="unique_cart_item"),
+            models.UniqueConstraint(fields=["cart", "item_set"], name="unique_cart_item_set"),
+            models.CheckConstraint(
+                check=models.Q(item__isnull=False, item_set__isnull=True)
+                | models.Q(item__isnull=True, item_set__isnull=False),
+                name="cart_line_item_or_set",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.item or self.item_set}"
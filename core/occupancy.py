@@ -0,0 +1,129 @@
+"""
+Occupancy index helpers.
+
+Every RentalItemDetail that belongs to a transaction which still blocks its
+item (pending, paid or partial) has a matching ItemOccupancy row holding the
+booked interval. Availability checks then become one indexed query over
+ItemOccupancy regardless of how many items are in the cart.
+"""
+
+from django.utils import timezone
+
+from core.models import ItemOccupancy, PaymentStatus, RentalItemDetail
+
+# Transactions in these states keep their items booked for the rental dates.
+BLOCKING_STATUSES = (
+    PaymentStatus.PENDING,
+    PaymentStatus.PAID,
+    PaymentStatus.PARTIAL,
+)
+
+
+def is_blocking(rental):
+    return rental.payment_status in BLOCKING_STATUSES
+
+
+def overlapping(start_date, end_date):
+    """Occupancy rows whose interval overlaps [start_date, end_date] (inclusive)."""
+    return ItemOccupancy.objects.filter(start_date__lte=end_date, end_date__gte=start_date)
+
+
+def booked_item_ids(item_ids, start_date, end_date, exclude_rental=None):
+    """Returns the subset of item_ids that are booked between the given dates."""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return set()
+    occupancies = overlapping(start_date, end_date).filter(item_id__in=item_ids)
+    if exclude_rental is not None:
+        occupancies = occupancies.exclude(rental=exclude_rental)
+    return set(occupancies.values_list("item_id", flat=True).distinct())
+
+
+def free_item_ids(item_ids, start_date, end_date, exclude_rental=None):
+    """Returns the subset of item_ids that are free between the given dates."""
+    item_ids = set(item_ids)
+    return item_ids - booked_item_ids(item_ids, start_date, end_date, exclude_rental)
+
+
+def is_item_free(item, start_date, end_date):
+    return not overlapping(start_date, end_date).filter(item=item).exists()
+
+
+def index_details(details, rental=None):
+    """
+    Creates occupancy rows for freshly created RentalItemDetail objects.
+    Needed after bulk_create(), which does not send post_save signals.
+    """
+    details = list(details)
+    if not details:
+        return []
+    rental = rental or details[0].rental
+    if not is_blocking(rental):
+        return []
+    return ItemOccupancy.objects.bulk_create(
+        [
+            ItemOccupancy(
+                detail=detail,
+                rental=rental,
+                item_id=detail.item_id,
+                start_date=rental.start_date,
+                end_date=rental.end_date,
+            )
+            for detail in details
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def sync_detail(detail):
+    """Creates, updates or drops the occupancy row of a single detail."""
+    rental = detail.rental
+    if not is_blocking(rental):
+        ItemOccupancy.objects.filter(detail=detail).delete()
+        return
+    ItemOccupancy.objects.update_or_create(
+        detail=detail,
+        defaults={
+            "rental": rental,
+            "item_id": detail.item_id,
+            "start_date": rental.start_date,
+            "end_date": rental.end_date,
+        },
+    )
+
+
+def sync_transaction(rental):
+    """
+    Brings the occupancy rows of a transaction in line with its dates and status.
+    Cancelled, completed and refunded rentals release their items.
+    """
+    if not is_blocking(rental):
+        ItemOccupancy.objects.filter(rental=rental).delete()
+        return
+
+    ItemOccupancy.objects.filter(rental=rental).exclude(
+        start_date=rental.start_date, end_date=rental.end_date
+    ).update(start_date=rental.start_date, end_date=rental.end_date, updated_at=timezone.now())
+
+    missing_details = RentalItemDetail.objects.filter(rental=rental, occupancy__isnull=True)
+    index_details(missing_details, rental=rental)
+
+
+def rebuild():
+    """Rebuilds the whole index from RentalItemDetail. Returns the number of rows."""
+    ItemOccupancy.objects.all().delete()
+    details = RentalItemDetail.objects.filter(
+        rental__payment_status__in=BLOCKING_STATUSES
+    ).select_related("rental")
+    rows = [
+        ItemOccupancy(
+            detail=detail,
+            rental=detail.rental,
+            item_id=detail.item_id,
+            start_date=detail.rental.start_date,
+            end_date=detail.rental.end_date,
+        )
+        for detail in details.iterator(chunk_size=2000)
+    ]
+    ItemOccupancy.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
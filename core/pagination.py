@@ -0,0 +1,191 @@
+"""
+Keyset (cursor) pagination for large listings.
+
+Django's Paginator runs COUNT(*) over the filtered queryset and then uses
+OFFSET, which gets slower the deeper the page. Keyset pagination instead
+remembers the sort key of the last row shown and asks for the rows after it,
+which the database answers from an index at any depth. Cursors are opaque,
+URL-safe tokens; the total is only available as a cached approximation.
+"""
+
+import base64
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Q
+
+CURSOR_PARAM = "cursor"
+# Tables with more rows than this switch from page numbers to cursors
+DEFAULT_THRESHOLD = 5000
+COUNT_CACHE_TIMEOUT = 5 * 60
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _field_name(key):
+    return key.lstrip("-")
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({"v": values, "d": direction}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, model, keys):
+    """Returns (values, direction) with values converted back to Python types."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        raw_values, direction = payload["v"], payload["d"]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("Malformed cursor.")
+    if direction not in ("next", "prev") or len(raw_values) != len(keys):
+        raise InvalidCursor("Malformed cursor.")
+    fields = [
+        model._meta.pk if _field_name(key) == "pk" else model._meta.get_field(_field_name(key))
+        for key in keys
+    ]
+    try:
+        return [field.to_python(value) for field, value in zip(fields, raw_values)], direction
+    except Exception:
+        raise InvalidCursor("Malformed cursor.")
+
+
+def _key_values(obj, keys):
+    values = []
+    for key in keys:
+        value = getattr(obj, _field_name(key))
+        if hasattr(value, "isoformat"):
+            value = value.isoformat()
+        elif not isinstance(value, (int, str, type(None))):
+            value = str(value)  # e.g. Decimal; to_python() parses it back
+        values.append(value)
+    return values
+
+
+def _after(keys, values, reverse=False):
+    """
+    Q object selecting rows strictly after the given key values in the ordering
+    described by keys (or strictly before them when reverse is True).
+    """
+    condition = Q()
+    for index, key in enumerate(keys):
+        descending = key.startswith("-") != reverse
+        lookup = "lt" if descending else "gt"
+        clause = Q(**{f"{_field_name(key)}__{lookup}": values[index]})
+        for previous_key, previous_value in zip(keys[:index], values[:index]):
+            clause &= Q(**{_field_name(previous_key): previous_value})
+        condition |= clause
+    return condition
+
+
+def _reverse_keys(keys):
+    return [key[1:] if key.startswith("-") else f"-{key}" for key in keys]
+
+
+def approximate_count(queryset, timeout=COUNT_CACHE_TIMEOUT):
+    """COUNT(*) of a queryset, cached for a few minutes per distinct query."""
+    digest = hashlib.sha1(str(queryset.query).encode()).hexdigest()
+    return cache.get_or_set(f"core:approx-count:{digest}", queryset.count, timeout)
+
+
+class KeysetPage:
+    """A page of results navigated with cursors instead of page numbers."""
+
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor, count_queryset):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self._count_queryset = count_queryset
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def approximate_count(self):
+        return approximate_count(self._count_queryset)
+
+
+def keyset_page(queryset, keys, per_page, cursor=None):
+    """
+    Returns the KeysetPage after/before the cursor. keys must end with a unique
+    field (normally "pk" or "-pk") so every row has a distinct position.
+    """
+    ordered = queryset.order_by(*keys)
+    direction = "next"
+    if cursor:
+        values, direction = decode_cursor(cursor, queryset.model, keys)
+        if direction == "next":
+            ordered = ordered.filter(_after(keys, values))
+        else:
+            ordered = queryset.order_by(*_reverse_keys(keys)).filter(
+                _after(keys, values, reverse=True)
+            )
+
+    rows = list(ordered[: per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == "prev":
+        rows.reverse()
+
+    if not rows:
+        return KeysetPage([], None, None, queryset)
+
+    if direction == "next":
+        has_next, has_previous = has_more, cursor is not None
+    else:
+        has_next, has_previous = True, has_more
+
+    next_cursor = encode_cursor(_key_values(rows[-1], keys), "next") if has_next else None
+    previous_cursor = encode_cursor(_key_values(rows[0], keys), "prev") if has_previous else None
+    return KeysetPage(rows, next_cursor, previous_cursor, queryset)
+
+
+def use_keyset(request, model):
+    """Cursor mode once the table is large, or whenever a cursor was supplied."""
+    if request.GET.get(CURSOR_PARAM):
+        return True
+    threshold = getattr(settings, "KEYSET_PAGINATION_THRESHOLD", DEFAULT_THRESHOLD)
+    return approximate_count(model._default_manager.all()) > threshold
+
+
+def paginate(request, queryset, keys, per_page):
+    """
+    Paginates a listing with cursors for large tables and page numbers otherwise.
+    Both page types are iterable and understood by the pagination partial.
+    """
+    if use_keyset(request, queryset.model):
+        try:
+            return keyset_page(queryset, keys, per_page, request.GET.get(CURSOR_PARAM))
+        except InvalidCursor:
+            return keyset_page(queryset, keys, per_page)
+
+    paginator = Paginator(queryset.order_by(*keys), per_page)
+    page_number = request.GET.get("page")
+    try:
+        return paginator.page(page_number)
+    except PageNotAnInteger:
+        # If page is not an integer, deliver first page.
+        return paginator.page(1)
+    except EmptyPage:
+        # If page is out of range (e.g. 9999), deliver last page of results.
+        return paginator.page(paginator.num_pages)
@@ -0,0 +1,170 @@
+"""
+Pricing of a booking selection.
+
+A selection is a tuple of (kind, pk, quantity) lines, kind being "item" or
+"set". The items, sets and set components it references are loaded with at
+most three queries and priced into an immutable Quote.
+
+`quote()` is for display: it is memoised per (selection, dates, catalogue
+data version), so re-rendering the same selection (e.g. after a form error)
+costs the one query that reads the version. The version comes from the
+database (see core.catalog.data_version), so prices changed by another process
+are picked up. Bookings price with `locked_quote()`, which loads the rows
+afresh inside the booking's transaction, locks them and refuses a selection
+whose items or sets no longer exist.
+
+Every booking path prices through here, so the figures shown on the
+selection page are the ones charged:
+
+* rental per day: the item type's daily price, or the set's base price,
+  times the quantity;
+* deposit: 30% of an item's daily price and the full base price of a set,
+  per unit, with a minimum of MINIMUM_DEPOSIT for the booking.
+"""
+
+import decimal
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.db.models import Prefetch
+
+from core import catalog
+from core.models import ItemSet, ItemSetComponent, RentalItem
+
+ITEM_DEPOSIT_RATE = decimal.Decimal("0.30")
+SET_DEPOSIT_RATE = decimal.Decimal("1.00")
+MINIMUM_DEPOSIT = decimal.Decimal("20.00")
+CACHE_SIZE = 256
+
+
+class QuoteError(ValueError):
+    """Raised when a booked selection references an item or set that no longer exists."""
+
+
+@dataclass(frozen=True)
+class QuoteLine:
+    kind: str
+    # The RentalItem or ItemSet (with its components prefetched)
+    obj: object
+    quantity: int
+    unit_price_per_day: decimal.Decimal
+    price_per_day: decimal.Decimal
+    deposit: decimal.Decimal
+
+
+@dataclass(frozen=True)
+class Quote:
+    lines: tuple
+    start_date: object
+    end_date: object
+    duration_days: int
+    total_price_per_day: decimal.Decimal
+    rental_total: decimal.Decimal
+    deposit: decimal.Decimal
+
+    @property
+    def item_lines(self):
+        return [line for line in self.lines if line.kind == "item"]
+
+    @property
+    def set_lines(self):
+        return [line for line in self.lines if line.kind == "set"]
+
+    def __bool__(self):
+        return bool(self.lines)
+
+
+def normalize(selection):
+    """The canonical, hashable form of a selection: quantities merged, sorted by (kind, pk)."""
+    quantities = {}
+    for kind, pk, quantity in selection:
+        quantities[kind, pk] = quantities.get((kind, pk), 0) + quantity
+    return tuple(
+        (kind, pk, quantity) for (kind, pk), quantity in sorted(quantities.items()) if quantity > 0
+    )
+
+
+def duration_days(start_date, end_date):
+    """Days charged for a rental, counting both ends; at least one."""
+    if start_date is None or end_date is None:
+        return 1
+    return max(1, (end_date - start_date).days + 1)
+
+
+def _load(selection, lock=False):
+    item_ids = [pk for kind, pk, _ in selection if kind == "item"]
+    set_ids = [pk for kind, pk, _ in selection if kind == "set"]
+    items = RentalItem.objects.select_related("item_type")
+    item_sets = ItemSet.objects.all()
+    if lock:
+        items = items.select_for_update(of=("self",))
+        item_sets = item_sets.select_for_update()
+    items = items.in_bulk(item_ids) if item_ids else {}
+    item_sets = (
+        item_sets.prefetch_related(
+            Prefetch(
+                "itemsetcomponent_set",
+                queryset=ItemSetComponent.objects.select_related("item_type"),
+            )
+        ).in_bulk(set_ids)
+        if set_ids
+        else {}
+    )
+    return {"item": items, "set": item_sets}
+
+
+def _line(kind, obj, quantity):
+    if kind == "item":
+        unit_price = obj.item_type.rental_price_per_day
+        deposit_rate = ITEM_DEPOSIT_RATE
+    else:
+        unit_price = obj.base_price
+        deposit_rate = SET_DEPOSIT_RATE
+    price = unit_price * quantity
+    return QuoteLine(kind, obj, quantity, unit_price, price, price * deposit_rate)
+
+
+def _build(selection, start_date, end_date, lock=False, strict=False):
+    loaded = _load(selection, lock)
+    missing = [(kind, pk) for kind, pk, _ in selection if pk not in loaded[kind]]
+    if strict and missing:
+        kind, pk = missing[0]
+        label = "Item" if kind == "item" else "Item Set"
+        raise QuoteError(f"Selected {label} (ID: {pk}) not found.")
+    # For display, lines whose item or set no longer exists are left out
+    lines = tuple(
+        _line(kind, loaded[kind][pk], quantity)
+        for kind, pk, quantity in selection
+        if pk in loaded[kind]
+    )
+    total_price_per_day = sum((line.price_per_day for line in lines), decimal.Decimal("0.00"))
+    days = duration_days(start_date, end_date)
+    deposit = sum((line.deposit for line in lines), decimal.Decimal("0.00"))
+    return Quote(
+        lines=lines,
+        start_date=start_date,
+        end_date=end_date,
+        duration_days=days,
+        total_price_per_day=total_price_per_day,
+        rental_total=total_price_per_day * days,
+        deposit=max(deposit, MINIMUM_DEPOSIT) if lines else decimal.Decimal("0.00"),
+    )
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _quote(selection, start_date, end_date, version):
+    return _build(selection, start_date, end_date)
+
+
+def quote(selection, start_date=None, end_date=None):
+    """The Quote of selection for the given dates (one day when no dates are given)."""
+    return _quote(normalize(selection), start_date, end_date, catalog.data_version())
+
+
+def locked_quote(selection, start_date=None, end_date=None):
+    """
+    The Quote of selection from rows read (and locked for update) in the current
+    transaction, for making a booking. Raises QuoteError when a line's item or
+    set no longer exists.
+    """
+    return _build(normalize(selection), start_date, end_date, lock=True, strict=True)
@@ -0,0 +1,124 @@
+"""
+Downscaled JPEG/WebP renditions of uploaded images.
+
+Item, set and payment slip images are stored as uploaded, often multi-megabyte
+phone photos. For each of them a fixed set of renditions (WIDTHS x FORMATS,
+never upscaled) is written next to the original (see
+core.utils.rendition_storage) by core.media_jobs once an upload is committed,
+and the templates show those through the `rendition_url` / `rendition_srcset`
+tags instead of the original.
+
+Renditions are only ever written by the media workers. Until an image's
+renditions exist (its upload is still being processed, it was uploaded before
+this existed, a write failed) the tags show the original and ask the workers to
+fill them in. Names known to exist are remembered per process, so repeat
+renders do not touch the storage.
+"""
+
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from core.models import ItemSet, Payment, RentalItem
+from core.utils import rendition_storage
+
+WIDTHS = (160, 320, 640)
+DEFAULT_WIDTH = 320
+# format name: (file extension, Pillow format, save options)
+FORMATS = {
+    "webp": ("webp", "WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("jpg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+# Image field of each model that gets renditions
+IMAGE_FIELDS = {RentalItem: "image", ItemSet: "image", Payment: "payment_slip"}
+
+# Raised for uploads that cannot be read as an image
+ERRORS = (OSError, UnidentifiedImageError, Image.DecompressionBombError)
+
+_known = set()
+
+
+def rendition_name(name, width, fmt):
+    return rendition_storage(name, width, FORMATS[fmt][0])
+
+
+def _flatten(image):
+    """The image upright and in RGB, transparent areas on white."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def _encode(image, width, fmt):
+    _, pil_format, options = FORMATS[fmt]
+    resized = image.copy()
+    resized.thumbnail((width, width * 4), Image.LANCZOS)
+    buffer = BytesIO()
+    resized.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def names(name):
+    """Storage names of every rendition of the file stored as name."""
+    return [rendition_name(name, width, fmt) for width in WIDTHS for fmt in FORMATS]
+
+
+def generate(storage, name, force=False):
+    """
+    Writes the renditions of the image stored as name that are missing (all of
+    them when force is set) and returns their names. The original is decoded once.
+    """
+    targets = {
+        (width, fmt): rendition_name(name, width, fmt) for width in WIDTHS for fmt in FORMATS
+    }
+    if not force:
+        targets = {key: target for key, target in targets.items() if not storage.exists(target)}
+    if targets:
+        with storage.open(name, "rb") as original:
+            image = _flatten(Image.open(original))
+        for (width, fmt), target in targets.items():
+            if storage.exists(target):
+                storage.delete(target)
+            saved = storage.save(target, ContentFile(_encode(image, width, fmt)))
+            if saved != target:
+                # Another writer got there first; don't leave an unreferenced copy
+                storage.delete(saved)
+    _known.update(names(name))
+    return list(targets.values())
+
+
+def forget(name):
+    """Drops the renditions of name from the per-process record, e.g. once deleted."""
+    _known.difference_update(names(name))
+
+
+def ready(field_file):
+    """True when every rendition of field_file exists. Never writes anything."""
+    if not field_file:
+        return False
+    targets = names(field_file.name)
+    if _known.issuperset(targets):
+        return True
+    if all(field_file.storage.exists(target) for target in targets):
+        _known.update(targets)
+        return True
+    return False
+
+
+def url(field_file, width=DEFAULT_WIDTH, fmt="jpeg"):
+    """URL of the rendition of field_file closest to width; check ready() first."""
+    width = min(WIDTHS, key=lambda candidate: abs(candidate - width))
+    return field_file.storage.url(rendition_name(field_file.name, width, fmt))
+
+
+def srcset(field_file, fmt="jpeg"):
+    """srcset attribute value listing every width of field_file's renditions."""
+    return ", ".join(
+        f"{field_file.storage.url(rendition_name(field_file.name, width, fmt))} {width}w"
+        for width in WIDTHS
+    )
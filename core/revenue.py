@@ -0,0 +1,90 @@
+"""
+Daily revenue rollup.
+
+Reports and dashboard tiles read DailyRevenue (one row per day, payment type
+and payment method) instead of aggregating the whole Payment table. A day's
+rows are recomputed from its payments whenever one of them is saved or deleted;
+a payment moved to another date refreshes the day it left as well.
+"""
+
+import decimal
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.models import DailyRevenue, Payment
+
+
+def day_bounds(day):
+    """Aware datetimes delimiting a local calendar day."""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def _rollup_rows(payments):
+    """Groups payments into unsaved DailyRevenue rows by local date, type and method."""
+    grouped = (
+        payments.order_by()
+        .annotate(day=TruncDate("transaction_date"))
+        .values("day", "payment_type", "payment_method")
+        .annotate(total=Sum("amount"), count=Count("id"))
+    )
+    return [
+        DailyRevenue(
+            date=row["day"],
+            payment_type=row["payment_type"],
+            payment_method=row["payment_method"],
+            total_amount=row["total"],
+            payment_count=row["count"],
+        )
+        for row in grouped
+    ]
+
+
+def refresh_day(day):
+    """Recomputes the rollup rows of one local calendar day."""
+    start, end = day_bounds(day)
+    with transaction.atomic():
+        DailyRevenue.objects.filter(date=day).delete()
+        DailyRevenue.objects.bulk_create(
+            _rollup_rows(
+                Payment.objects.filter(transaction_date__gte=start, transaction_date__lt=end)
+            )
+        )
+
+
+def refresh_for_payment(payment, previous_date=None):
+    """Refreshes the day of payment and, when it was moved, the day it was on before."""
+    dates = {payment.transaction_date, previous_date} - {None}
+    for day in sorted({timezone.localdate(value) for value in dates}):
+        refresh_day(day)
+
+
+def rebuild():
+    """Rebuilds the whole rollup from Payment. Returns the number of rows written."""
+    with transaction.atomic():
+        DailyRevenue.objects.all().delete()
+        rows = _rollup_rows(Payment.objects.all())
+        DailyRevenue.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def total(year=None, month=None, since=None):
+    """Revenue for a year, a month of a year, and/or from a date onwards."""
+    rows = DailyRevenue.objects.all()
+    if year is not None:
+        rows = rows.filter(date__year=year)
+    if month is not None:
+        rows = rows.filter(date__month=month)
+    if since is not None:
+        rows = rows.filter(date__gte=since)
+    return rows.aggregate(total=Sum("total_amount"))["total"] or decimal.Decimal("0.00")
+
+
+def first_year(default):
+    """Year of the earliest recorded payment, or default when there are none."""
+    first_date = DailyRevenue.objects.aggregate(first=Min("date"))["first"]
+    return first_date.year if first_date else default
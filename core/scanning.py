@@ -0,0 +1,85 @@
+"""
+Serial-number lookups for barcode scanning at check-out and check-in.
+
+Scanned serials are matched against the unique index on
+RentalItem.serial_number: exact matches with `=`/`IN`, and partial scans with a
+range (serial >= prefix AND serial < prefix + U+10FFFF) rather than LIKE, which
+SQLite's case-insensitive LIKE cannot answer from the index. A whole order's
+scans are resolved with a single IN query.
+"""
+
+import re
+
+from core.models import RentalItem
+
+MAX_BATCH_SIZE = 1000
+MAX_PREFIX_RESULTS = 20
+MIN_PREFIX_LENGTH = 3
+# Scanners usually send one code per line; pasted lists may use commas or spaces
+SEPARATORS = re.compile(r"[\s,;]+")
+# Sorts after every character a serial can contain
+PREFIX_END = "\U0010ffff"
+
+
+def normalize(serial):
+    # Serials are matched case-sensitively, exactly as stored and printed on the label
+    return serial.strip()
+
+
+def split_serials(values):
+    """Normalised, de-duplicated serials from raw scanner input, in scan order."""
+    serials = []
+    for value in values:
+        serials.extend(normalize(part) for part in SEPARATORS.split(value) if part)
+    return list(dict.fromkeys(serials))
+
+
+def _items():
+    return RentalItem.objects.select_related("item_type")
+
+
+def find_by_prefix(prefix, limit=MAX_PREFIX_RESULTS):
+    """Items whose serial starts with prefix, in serial order."""
+    prefix = normalize(prefix)
+    if len(prefix) < MIN_PREFIX_LENGTH:
+        return []
+    return list(
+        _items()
+        .filter(serial_number__gte=prefix, serial_number__lt=prefix + PREFIX_END)
+        .order_by("serial_number")[:limit]
+    )
+
+
+def lookup(serial):
+    """
+    Returns (exact item or None, prefix matches). Prefix matches are only looked
+    up when there is no exact match, for partial or manually typed codes.
+    """
+    serial = normalize(serial)
+    item = _items().filter(serial_number=serial).first()
+    if item is not None:
+        return item, []
+    return None, find_by_prefix(serial)
+
+
+def resolve(serials):
+    """
+    Resolves a batch of serials with one query.
+    Returns ({serial: item} in scan order, [serials with no item]).
+    """
+    serials = list(dict.fromkeys(normalize(serial) for serial in serials))
+    found = {item.serial_number: item for item in _items().filter(serial_number__in=serials)}
+    resolved = {serial: found[serial] for serial in serials if serial in found}
+    missing = [serial for serial in serials if serial not in found]
+    return resolved, missing
+
+
+def item_payload(item):
+    return {
+        "id": item.pk,
+        "serial_number": item.serial_number,
+        "item_type": str(item.item_type),
+        "item_type_id": item.item_type_id,
+        "status": item.status,
+        "status_display": item.get_status_display(),
+    }
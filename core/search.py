@@ -0,0 +1,266 @@
+"""
+Full-text search for the dashboard lists, backed by SQLite FTS5.
+
+Every searchable model has an FTS5 table (core_search_<name>) holding one
+document per row, keyed by the row's primary key, with the text of the fields
+the list view searches. The tables use the trigram tokenizer, so a query
+matches any substring of three or more characters, the same results as the
+icontains chains it replaces, including Lao names, which have no spaces to
+split words on. They are kept in sync by core.signals and can be rebuilt with
+`manage.py rebuild_search_index`.
+
+A query of several words matches the documents containing every word, such as
+a customer's first and last name. Words shorter than three characters, and
+every word on databases without FTS5, are matched on their own with icontains
+lookups over the same fields, so "Bo Vongsa" still uses the index for "Vongsa".
+"""
+
+import sqlite3
+from itertools import islice
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from accounts.models import Account, Customer, Employee
+from core.models import Accessory, ItemSet, RentalItem, RentalTransaction
+
+MIN_QUERY_LENGTH = 3  # Shortest string the trigram tokenizer can match
+FIELD_SEPARATOR = " | "
+BATCH_SIZE = 1000
+# Matches ordered by relevance in ranked lists; the rest keep the list's own ordering
+RANKED_RESULTS = 100
+
+
+class SearchIndex:
+    def __init__(self, name, model, fields, dependencies=None):
+        self.name = name
+        self.model = model
+        self.fields = fields
+        # {related model: lookup from model to it}; documents embed the related
+        # model's fields, so its changes re-index the rows that point at it
+        self.dependencies = dependencies or {}
+
+    @property
+    def table(self):
+        return f"core_search_{self.name}"
+
+    def documents(self, queryset):
+        for pk, *values in queryset.values_list("pk", *self.fields).iterator(chunk_size=BATCH_SIZE):
+            yield pk, FIELD_SEPARATOR.join(str(value) for value in values if value)
+
+    def fallback(self, query):
+        condition = Q()
+        for field in self.fields:
+            condition |= Q(**{f"{field}__icontains": query})
+        return condition
+
+
+INDEXES = {
+    index.name: index
+    for index in (
+        SearchIndex("customers", Customer, ("first_name", "last_name", "phone_number")),
+        SearchIndex("users", Account, ("email",)),
+        SearchIndex("employees", Employee, ("first_name", "last_name", "phone_number")),
+        SearchIndex("rental_items", RentalItem, ("serial_number",)),
+        SearchIndex("accessories", Accessory, ("accessory_name",)),
+        SearchIndex("item_sets", ItemSet, ("name", "description")),
+        SearchIndex(
+            "rental_transactions",
+            RentalTransaction,
+            ("customer__first_name", "customer__last_name", "customer__user__email"),
+            dependencies={Customer: "customer", Account: "customer__user"},
+        ),
+    )
+}
+
+_available = None
+
+
+def is_available():
+    """True when the database supports FTS5 with the trigram tokenizer (SQLite >= 3.34)."""
+    global _available
+    if _available is None:
+        if connection.vendor != "sqlite":
+            _available = False
+        else:
+            _available = sqlite3.sqlite_version_info >= (3, 34, 0)
+    return _available
+
+
+def _fts_query(words):
+    # Every word must match, so "first last" finds a name split across fields.
+    # Words are quoted so operators and punctuation are matched literally.
+    return " ".join('"' + word.replace('"', '""') + '"' for word in words)
+
+
+def _split(query):
+    """(words matched through the index, words matched with icontains) of query."""
+    words = query.split()
+    if not is_available():
+        return [], words
+    return (
+        [word for word in words if len(word) >= MIN_QUERY_LENGTH],
+        [word for word in words if len(word) < MIN_QUERY_LENGTH],
+    )
+
+
+def _fallback(index, words):
+    condition = Q()
+    for word in words:
+        condition &= index.fallback(word)
+    return condition
+
+
+# --- Queries ---
+
+
+def matches(name, query):
+    """Q object selecting the rows of index `name` that match query."""
+    index = INDEXES[name]
+    indexed, other = _split(query)
+    condition = _fallback(index, other)
+    if indexed:
+        condition &= Q(
+            pk__in=RawSQL(
+                f"SELECT rowid FROM {index.table} WHERE {index.table} MATCH %s",
+                [_fts_query(indexed)],
+            )
+        )
+    return condition
+
+
+def search(name, query, limit=20):
+    """Primary keys of the best matches for query, best first."""
+    index = INDEXES[name]
+    indexed, other = _split(query)
+    others = index.model._default_manager.filter(_fallback(index, other))
+    if not indexed:
+        return list(others.order_by("pk").values_list("pk", flat=True)[:limit])
+    sql = f"SELECT rowid FROM {index.table} WHERE {index.table} MATCH %s"
+    params = [_fts_query(indexed)]
+    if other:
+        subquery, subquery_params = others.values("pk").query.sql_with_params()
+        sql += f" AND rowid IN ({subquery})"
+        params.extend(subquery_params)
+    with connection.cursor() as cursor:
+        cursor.execute(f"{sql} ORDER BY rank LIMIT %s", [*params, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def filter_queryset(queryset, name, query, ranked=True):
+    """
+    Narrows queryset to the rows matching query. When ranked, the RANKED_RESULTS
+    most relevant matches come first and the rest keep the queryset's ordering.
+    """
+    query = query.strip()
+    if not query:
+        return queryset
+    queryset = queryset.filter(matches(name, query))
+    if not ranked or not _split(query)[0]:
+        return queryset
+
+    best = search(name, query, limit=RANKED_RESULTS)
+    if not best:
+        return queryset
+    # Ranking every match with a correlated subquery is far slower on broad queries
+    rank = Case(
+        *[When(pk=pk, then=Value(position)) for position, pk in enumerate(best)],
+        default=Value(len(best)),
+        output_field=IntegerField(),
+    )
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    return queryset.annotate(search_rank=rank).order_by("search_rank", *ordering)
+
+
+# --- Maintenance ---
+
+
+def _write(index, pks, documents):
+    """Deletes the documents of pks, then inserts (pk, content) pairs from documents."""
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), BATCH_SIZE):
+            batch = pks[start : start + BATCH_SIZE]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(f"DELETE FROM {index.table} WHERE rowid IN ({placeholders})", batch)
+        documents = iter(documents)
+        while batch := list(islice(documents, BATCH_SIZE)):
+            cursor.executemany(f"INSERT INTO {index.table} (rowid, content) VALUES (%s, %s)", batch)
+
+
+def reindex(name, pks):
+    """Rewrites the documents of the given rows; rows that no longer exist are removed."""
+    if not is_available():
+        return
+    index = INDEXES[name]
+    pks = list(pks)
+    if pks:
+        _write(index, pks, index.documents(index.model._default_manager.filter(pk__in=pks)))
+
+
+def remove(name, pks):
+    if is_available() and pks:
+        _write(INDEXES[name], list(pks), [])
+
+
+def indexes_for_model(model):
+    """(index, lookup) pairs affected by model; lookup is None for the index's own model."""
+    for index in INDEXES.values():
+        if index.model is model:
+            yield index, None
+        elif model in index.dependencies:
+            yield index, index.dependencies[model]
+
+
+def dependent_pks(instance):
+    """{index name: pks} of documents that embed instance's fields through a relation."""
+    return {
+        index.name: list(
+            index.model._default_manager.filter(**{lookup: instance.pk}).values_list(
+                "pk", flat=True
+            )
+        )
+        for index, lookup in indexes_for_model(type(instance))
+        if lookup is not None
+    }
+
+
+def sync_instance(instance, deleted=False, dependents=None):
+    """
+    Updates every document that embeds instance's fields (called from core.signals).
+    On delete, pass the dependents collected before the delete: by then SET_NULL
+    relations have already been cleared and can no longer be followed.
+    """
+    for index, lookup in indexes_for_model(type(instance)):
+        if lookup is None:
+            if deleted:
+                remove(index.name, [instance.pk])
+            else:
+                reindex(index.name, [instance.pk])
+    if dependents is None:
+        dependents = dependent_pks(instance)
+    for name, pks in dependents.items():
+        reindex(name, pks)
+
+
+def models():
+    """Every model whose changes affect a search document."""
+    result = set()
+    for index in INDEXES.values():
+        result.add(index.model)
+        result.update(index.dependencies)
+    return result
+
+
+def rebuild(names=None):
+    """Recreates the documents of the given indexes (all by default). Returns {name: count}."""
+    if not is_available():
+        return {}
+    counts = {}
+    for name in names or INDEXES:
+        index = INDEXES[name]
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {index.table}")
+        _write(index, [], index.documents(index.model._default_manager.all()))
+        counts[name] = index.model._default_manager.count()
+    return counts
@@ -1,10 +1,33 @@
 import uuid
 
-from django.db.models.signals import pre_delete, pre_save
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 
-from core.models import ItemSet, RentalItem
+from core import (
+    availability,
+    catalog,
+    dashboard_stats,
+    ledger,
+    media_jobs,
+    occupancy,
+    renditions,
+    revenue,
+    search,
+)
+from core.models import (
+    ItemSet,
+    ItemSetComponent,
+    Payment,
+    RentalItem,
+    RentalItemDetail,
+    RentalItemType,
+    RentalSetDetail,
+    RentalTransaction,
+)
+
+# What a login saves on the Account
+LOGIN_FIELDS = {"last_login", "updated_at"}
 
 
 @receiver(pre_save, sender=RentalItem)
@@ -29,7 +52,10 @@ def handle_item_image_on_update(sender, instance, **kwargs):
             old_instance = sender.objects.only("image").get(pk=instance.pk)
             image_changed = old_instance.image != instance.image
             if image_changed and old_instance.image:
-                old_instance.image.delete(save=False)
+                # Deleted in the background once the new image is committed
+                media_jobs.enqueue(
+                    media_jobs.delete_files, old_instance.image.storage, old_instance.image.name
+                )
                 print("Signals: update rental item image.")
         except sender.DoesNotExist:
             pass  # Old instance does not exist, this must be a new instance
@@ -38,7 +64,7 @@ def handle_item_image_on_update(sender, instance, **kwargs):
 @receiver(pre_delete, sender=RentalItem)
 def delete_item_image_on_delete(sender, instance, **kwargs):
     if instance.image:
-        instance.image.delete(save=False)
+        media_jobs.enqueue(media_jobs.delete_files, instance.image.storage, instance.image.name)
         print("Signals: delete rental item image.")
 
 
@@ -54,7 +80,10 @@ def handle_item_set_image_on_update(sender, instance, **kwargs):
             old_instance = sender.objects.only("image").get(pk=instance.pk)
             image_changed = old_instance.image != instance.image
             if image_changed and old_instance.image:
-                old_instance.image.delete(save=False)
+                # Deleted in the background once the new image is committed
+                media_jobs.enqueue(
+                    media_jobs.delete_files, old_instance.image.storage, old_instance.image.name
+                )
                 print("Signals: update item set image.")
         except sender.DoesNotExist:
             pass  # Old instance does not exist, this must be a new instance
@@ -63,5 +92,139 @@ def handle_item_set_image_on_update(sender, instance, **kwargs):
 @receiver(pre_delete, sender=ItemSet)
 def delete_item_set_image_on_delete(sender, instance, **kwargs):
     if instance.image:
-        instance.image.delete(save=False)
+        media_jobs.enqueue(media_jobs.delete_files, instance.image.storage, instance.image.name)
         print("Signals: delete item set image.")
+
+
+@receiver(post_save, sender=RentalItemDetail)
+def index_rental_item_detail(sender, instance, **kwargs):
+    occupancy.sync_detail(instance)
+
+
+@receiver(post_save, sender=RentalTransaction)
+def sync_rental_transaction_occupancy(sender, instance, created, **kwargs):
+    # A brand new transaction has no details yet; they index themselves.
+    if not created:
+        occupancy.sync_transaction(instance)
+
+
+@receiver(post_save, sender=RentalTransaction)
+@receiver(post_delete, sender=RentalTransaction)
+@receiver(post_save, sender=RentalItemDetail)
+@receiver(post_delete, sender=RentalItemDetail)
+@receiver(post_save, sender=RentalItem)
+@receiver(post_delete, sender=RentalItem)
+@receiver(post_save, sender=RentalItemType)
+@receiver(post_delete, sender=RentalItemType)
+@receiver(post_save, sender=ItemSet)
+@receiver(post_delete, sender=ItemSet)
+@receiver(post_save, sender=ItemSetComponent)
+@receiver(post_delete, sender=ItemSetComponent)
+def invalidate_availability_calendar(sender, **kwargs):
+    availability.invalidate()
+
+
+@receiver(post_save, sender=RentalTransaction)
+@receiver(post_delete, sender=RentalTransaction)
+@receiver(post_save, sender=RentalItem)
+@receiver(post_delete, sender=RentalItem)
+@receiver(post_save, sender=RentalItemType)
+@receiver(post_delete, sender=RentalItemType)
+@receiver(post_save, sender=ItemSet)
+@receiver(post_delete, sender=ItemSet)
+@receiver(post_save, sender=ItemSetComponent)
+@receiver(post_delete, sender=ItemSetComponent)
+def invalidate_catalog(sender, **kwargs):
+    catalog.invalidate()
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender=RentalItemDetail)
+@receiver(post_delete, sender=RentalItemDetail)
+@receiver(post_save, sender=RentalSetDetail)
+@receiver(post_delete, sender=RentalSetDetail)
+def refresh_rental_ledger(sender, instance, **kwargs):
+    ledger.schedule(instance.rental_id)
+
+
+@receiver(post_save, sender=RentalTransaction)
+def refresh_rental_ledger_on_change(sender, instance, created, update_fields=None, **kwargs):
+    # Fines or rental dates may have changed; new transactions start with an empty ledger.
+    if created or (update_fields and set(update_fields) <= set(ledger.LEDGER_FIELDS)):
+        return
+    ledger.schedule(instance.pk)
+
+
+@receiver(pre_save, sender=Payment)
+def remember_payment_date(sender, instance, update_fields=None, **kwargs):
+    # A payment moved to another day leaves that day's rollup to refresh too
+    instance._previous_transaction_date = None
+    if instance.pk and (update_fields is None or "transaction_date" in update_fields):
+        instance._previous_transaction_date = (
+            sender.objects.filter(pk=instance.pk).values_list("transaction_date", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def refresh_daily_revenue(sender, instance, **kwargs):
+    revenue.refresh_for_payment(instance, getattr(instance, "_previous_transaction_date", None))
+
+
+def invalidate_dashboard_tiles(sender, update_fields=None, **kwargs):
+    # Logging in only updates last_login, which no tile shows
+    if update_fields and set(update_fields) <= LOGIN_FIELDS:
+        return
+    dashboard_stats.invalidate_model(sender)
+
+
+for dashboard_model in dashboard_stats.models():
+    post_save.connect(invalidate_dashboard_tiles, sender=dashboard_model)
+    post_delete.connect(invalidate_dashboard_tiles, sender=dashboard_model)
+
+
+def sync_search_index(sender, instance, update_fields=None, **kwargs):
+    # Logging in only updates last_login, which no document contains
+    if update_fields and set(update_fields) <= LOGIN_FIELDS:
+        return
+    search.sync_instance(instance)
+
+
+def collect_search_dependents(sender, instance, **kwargs):
+    instance._search_dependents = search.dependent_pks(instance)
+
+
+def remove_from_search_index(sender, instance, **kwargs):
+    search.sync_instance(
+        instance, deleted=True, dependents=getattr(instance, "_search_dependents", None)
+    )
+
+
+for search_model in search.models():
+    post_save.connect(sync_search_index, sender=search_model)
+    pre_delete.connect(collect_search_dependents, sender=search_model)
+    post_delete.connect(remove_from_search_index, sender=search_model)
+
+
+def mark_image_upload(sender, instance, **kwargs):
+    # The file of a new upload is only written while the row is saved
+    field_file = getattr(instance, renditions.IMAGE_FIELDS[sender])
+    instance._image_uploaded = bool(field_file) and not field_file._committed
+
+
+def process_image_upload(sender, instance, **kwargs):
+    if getattr(instance, "_image_uploaded", False):
+        instance._image_uploaded = False
+        field_file = getattr(instance, renditions.IMAGE_FIELDS[sender])
+        media_jobs.enqueue(
+            media_jobs.process_upload,
+            field_file.storage,
+            field_file.name,
+            sender is Payment,  # Slips are also compressed
+        )
+
+
+for image_model in renditions.IMAGE_FIELDS:
+    pre_save.connect(mark_image_upload, sender=image_model)
+    post_save.connect(process_image_upload, sender=image_model)
@@ -0,0 +1,45 @@
+"""
+Write-only XLSX workbooks for the dashboard exports.
+
+openpyxl's default Workbook keeps every cell object in memory until save(),
+so exporting a year of payments grows the worker by hundreds of megabytes.
+A write-only workbook serialises each row as it is appended, and the finished
+file is spooled to a temporary file and streamed back in chunks, so memory
+stays flat no matter how many rows are exported. Feed it from
+queryset.iterator(chunk_size=CHUNK_SIZE) so the rows aren't cached either.
+"""
+
+import tempfile
+
+import openpyxl
+from django.http import FileResponse
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CHUNK_SIZE = 2000
+# Files up to this size stay in memory before spilling to disk
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+class StreamingSheet:
+    """A single-sheet write-only workbook returned as a streaming download."""
+
+    def __init__(self, title):
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(title)
+        self.row_count = 0
+
+    def append(self, row):
+        self.sheet.append(row)
+        self.row_count += 1
+
+    def save(self, output):
+        self.workbook.save(output)
+
+    def as_response(self, filename):
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        self.save(output)
+        output.seek(0)
+        # FileResponse streams the file in blocks and closes it when done
+        return FileResponse(
+            output, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE
+        )
@@ -1,7 +1,7 @@
 # core/templatetags/core_tags.py
 from django import template
 
-from core.views import get_booking_selection  # Import helper function
+from core import carts, media_jobs, renditions
 
 register = template.Library()
 
@@ -10,22 +10,55 @@ register = template.Library()
 def get_selection_count(context):
     """Returns the total number of items/sets in the booking selection."""
     request = context.get("request")
-    if request:
-        selection = get_booking_selection(request.session)
-        item_count = sum(data["quantity"] for data in selection.get("items", {}).values())
-        set_count = sum(data["quantity"] for data in selection.get("sets", {}).values())
-        return item_count + set_count
+    if request and request.user.is_authenticated:
+        # The count stored on the cart's row by core.carts; no session read
+        return carts.count(request.user)
     return 0
 
 
 @register.simple_tag(takes_context=True)
 def get_selection_items(context):
-    """Returns detailed items from the booking selection (use carefully)."""
-    # This could be used to display a mini-cart, but might be slow.
-    # It's generally better to just show the count in the header.
+    """Returns the rendered mini-cart of the booking selection."""
     request = context.get("request")
-    if request:
-        # Add logic similar to view_booking_selection to fetch item details
-        # Be mindful of performance implications here.
-        pass
-    return []
+    if request and request.user.is_authenticated:
+        # Cached per user by core.carts; a single cache lookup per page
+        return carts.render_summary(request.user)
+    return ""
+
+
+@register.simple_tag
+def rendition_url(image, width=renditions.DEFAULT_WIDTH, fmt="jpeg"):
+    """URL of a downscaled copy of an image field, e.g. {% rendition_url item.image 320 %}."""
+    if not image:
+        return ""
+    if renditions.ready(image):
+        return renditions.url(image, width, fmt)
+    # Never resized in the request: show the original until a worker has done it
+    media_jobs.fill_in(image)
+    return image.url
+
+
+@register.simple_tag
+def rendition_srcset(image, fmt="jpeg"):
+    """srcset of every downscaled copy of an image field, e.g. {% rendition_srcset item.image "webp" %}."""
+    if not image:
+        return ""
+    if renditions.ready(image):
+        return renditions.srcset(image, fmt)
+    media_jobs.fill_in(image)
+    return ""
+
+
+@register.simple_tag(takes_context=True)
+def query_replace(context, **params):
+    """
+    Returns the current querystring with the given parameters replaced.
+    Parameters passed as None are removed, e.g. {% query_replace cursor=c page=None %}.
+    """
+    query = context["request"].GET.copy()
+    for key, value in params.items():
+        if value is None:
+            query.pop(key, None)
+        else:
+            query[key] = value
+    return query.urlencode()
@@ -1,3 +1,1354 @@
-from django.test import TestCase
+import decimal
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from accounts.models import Account, Customer
+from core import (
+    allocation,
+    autocomplete,
+    availability,
+    bitmaps,
+    carts,
+    catalog,
+    conditional,
+    dashboard_stats,
+    export_jobs,
+    exports,
+    ledger,
+    media_jobs,
+    occupancy,
+    pagination,
+    quotes,
+    renditions,
+    revenue,
+    scanning,
+    search,
+    versions,
+)
+from core.models import (
+    Cart,
+    CartLine,
+    DailyRevenue,
+    ExportJob,
+    ItemOccupancy,
+    ItemSet,
+    ItemSetComponent,
+    ItemStatus,
+    Payment,
+    PaymentMethod,
+    PaymentStatus,
+    PaymentType,
+    RentalItem,
+    RentalItemDetail,
+    RentalItemType,
+    RentalSetDetail,
+    RentalTransaction,
+)
+from core.templatetags import core_tags
+
+
+def create_tent_type():
+    """The "tent" item type (10.00 a day, 100.00 to replace) most tests book."""
+    return RentalItemType.objects.create(
+        type_name="tent",
+        rental_price_per_day=decimal.Decimal("10.00"),
+        replacement_cost=decimal.Decimal("100.00"),
+    )
+
+
+def create_rental(customer, start_date=date(2026, 1, 1), end_date=date(2026, 1, 2)):
+    """A pending rental of customer without a deposit."""
+    return RentalTransaction.objects.create(
+        customer=customer,
+        start_date=start_date,
+        end_date=end_date,
+        total_deposit=decimal.Decimal("0.00"),
+    )
+
+
+class RentalTransactionExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = Account.objects.create_user("customer@example.com", "password")
+        cls.customer = Customer.objects.create(
+            first_name="Somchai", last_name="Phom", phone_number="020", user=user
+        )
+        cls.tent_type = create_tent_type()
+        cls.item_set = ItemSet.objects.create(
+            name="Party Set",
+            base_price=decimal.Decimal("50.00"),
+            replacement_deposit=decimal.Decimal("20.00"),
+        )
+
+    def setUp(self):
+        self.serials = []
+
+    def create_transactions(self, count):
+        for _ in range(count):
+            rental = create_rental(self.customer)
+            single = RentalItem.objects.create(
+                item_type=self.tent_type, serial_number=f"RI-SINGLE-{len(self.serials)}"
+            )
+            component = RentalItem.objects.create(
+                item_type=self.tent_type, serial_number=f"RI-COMPONENT-{len(self.serials)}"
+            )
+            self.serials.append(single.serial_number)
+            set_detail = RentalSetDetail.objects.create(
+                rental=rental, item_set=self.item_set, rented_price_per_day=decimal.Decimal("50")
+            )
+            RentalItemDetail.objects.create(
+                rental=rental, item=single, rented_price_per_day=decimal.Decimal("10")
+            )
+            RentalItemDetail.objects.create(
+                rental=rental,
+                item=component,
+                rented_price_per_day=decimal.Decimal("0"),
+                set_rental=set_detail,
+            )
+            Payment.objects.create(
+                rental=rental,
+                amount=decimal.Decimal("30.00"),
+                payment_method=PaymentMethod.CASH,
+                payment_type=PaymentType.DEPOSIT,
+            )
+
+    def export_rows(self):
+        return list(exports.RentalTransactionExport({}).rows())
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.create_transactions(3)
+        # Transactions with annotated financials, then one prefetch each for sets and items
+        with self.assertNumQueries(3):
+            self.export_rows()
+
+        self.create_transactions(20)
+        with self.assertNumQueries(3):
+            rows = self.export_rows()
+        self.assertEqual(len(rows), 23)
+
+    def test_rows_list_sets_and_individual_items(self):
+        self.create_transactions(1)
+        dataset = exports.RentalTransactionExport({})
+        row = dict(zip(dataset.keys(), next(dataset.rows())))
+
+        # Set components are listed through their set, not as separate items
+        self.assertEqual(row["items_rented"], f"1 x Party Set (Set); 1 x ເຕັ່ນ ({self.serials[0]})")
+        self.assertEqual(row["total_rental_cost"], decimal.Decimal("120.00"))
+        self.assertEqual(row["amount_paid"], decimal.Decimal("30.00"))
+
+
+class ExportFormatTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = Account.objects.create_user("noy@example.com", "password")
+        somchai = Customer.objects.create(first_name="Somchai", last_name="Phom")
+        noy = Customer.objects.create(first_name="Noy", last_name="Somsak", user=user)
+        cls.paid = create_rental(somchai)
+        RentalTransaction.objects.filter(pk=cls.paid.pk).update(payment_status=PaymentStatus.PAID)
+        cls.pending = create_rental(somchai, date(2026, 2, 1), date(2026, 2, 3))
+        cls.other = create_rental(noy)
+        cls.staff = Account.objects.create_user("staff@example.com", "password")
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def export(self, **params):
+        return self.client.get("/dashboard/rental-transactions/export/", params)
+
+    def content(self, response):
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_streams_headers_then_rows(self):
+        response = self.export(format="csv")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(
+            response["Content-Disposition"],
+            'attachment; filename="rental_transactions_export.csv"',
+        )
+        lines = self.content(response).splitlines()
+        self.assertEqual(lines[0].split(","), exports.RentalTransactionExport({}).headers())
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].startswith(f"{self.pending.pk},Somchai Phom,N/A,"))
+
+    def test_ndjson_streams_one_object_per_row(self):
+        response = self.export(format="ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        self.assertEqual(
+            response["Content-Disposition"],
+            'attachment; filename="rental_transactions_export.ndjson"',
+        )
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(list(rows[0]), exports.RentalTransactionExport({}).keys())
+        self.assertEqual(rows[0]["transaction_id"], self.pending.pk)
+        self.assertEqual(rows[0]["rental_dates"], "01/02/2026 - 03/02/2026")
+        self.assertEqual(rows[0]["total_deposit"], "0.00")
+
+    def test_unknown_formats_are_rejected(self):
+        response = self.export(format="pdf")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.json())
+
+    def test_exports_apply_the_list_view_filters(self):
+        for params in (
+            {"status": PaymentStatus.PENDING},
+            {"customer": "somchai"},
+            {"status": PaymentStatus.PENDING, "customer": "noy@example"},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get("/dashboard/rental-transactions/", params)
+                listed = [rental.pk for rental in response.context["transactions"]]
+                exported = [
+                    json.loads(line)["transaction_id"]
+                    for line in self.content(self.export(format="ndjson", **params)).splitlines()
+                ]
+                self.assertTrue(listed)
+                self.assertEqual(exported, listed)
+
+
+class SerialScanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tent_type = create_tent_type()
+        for serial in ("RI-20260101-001", "RI-20260101-002", "RI-20260102-001"):
+            RentalItem.objects.create(item_type=tent_type, serial_number=serial)
+
+    def test_batch_resolves_in_one_query(self):
+        scanned = scanning.split_serials(["RI-20260102-001\nRI-20260101-001, RI-MISSING\n"])
+        with self.assertNumQueries(1):
+            resolved, missing = scanning.resolve(scanned)
+        self.assertEqual(list(resolved), ["RI-20260102-001", "RI-20260101-001"])
+        self.assertEqual(missing, ["RI-MISSING"])
+
+    def test_lookup_falls_back_to_prefix(self):
+        item, matches = scanning.lookup(" RI-20260101-001 ")
+        self.assertEqual(item.serial_number, "RI-20260101-001")
+        self.assertEqual(matches, [])
+
+        item, matches = scanning.lookup("RI-20260101")
+        self.assertIsNone(item)
+        self.assertEqual(
+            [match.serial_number for match in matches], ["RI-20260101-001", "RI-20260101-002"]
+        )
+
+
+class CustomerAutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = Account.objects.create_user("phet@example.com", "password")
+        Customer.objects.create(first_name="Somchai", last_name="Phom", phone_number="020")
+        Customer.objects.create(first_name="Noy", last_name="Somsak", phone_number="021", user=user)
+
+    def setUp(self):
+        autocomplete._suggest.cache_clear()
+
+    def names(self, query):
+        return [result["name"] for result in autocomplete.suggest(query)]
+
+    def test_matches_name_and_email_prefixes(self):
+        self.assertEqual(self.names("SOM"), ["Somchai Phom", "Noy Somsak"])
+        self.assertEqual(self.names("phet"), ["Noy Somsak"])
+        self.assertEqual(self.names("somchai ph"), ["Somchai Phom"])
+        self.assertEqual(self.names("chai"), [])
+        self.assertEqual(self.names("s"), [])
+
+    def test_changes_invalidate_cached_suggestions(self):
+        self.assertEqual(self.names("noy"), ["Noy Somsak"])
+        with self.captureOnCommitCallbacks(execute=True):
+            Customer.objects.filter(first_name="Noy").get().delete()
+        self.assertEqual(self.names("noy"), [])
+
+    def test_changes_from_other_processes_reach_cached_suggestions(self):
+        self.assertEqual(self.names("somchai"), ["Somchai Phom"])
+        # A memo hit reads only the data version
+        with self.assertNumQueries(1):
+            self.assertEqual(self.names("somchai"), ["Somchai Phom"])
+
+        # Changed with no signals, as if by another worker
+        Customer.objects.filter(first_name="Somchai").update(
+            last_name="Vongsa", updated_at=timezone.now()
+        )
+        self.assertEqual(self.names("somchai"), ["Somchai Vongsa"])
+        Customer.objects.bulk_create([Customer(first_name="Somsri", last_name="Kham")])
+        self.assertEqual(self.names("soms"), ["Somsri Kham", "Noy Somsak"])
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tent_type = create_tent_type()
+        cls.item = RentalItem.objects.create(item_type=tent_type, serial_number="RI-CATALOG-1")
+
+    def setUp(self):
+        versions.bump(catalog.VERSION_NAME)
+        self.request = RequestFactory().get("/")
+
+    def test_repeat_renders_are_served_from_cache(self):
+        html = catalog.render_catalog(self.request)
+        self.assertIn("RI-CATALOG-1", html)
+        self.assertNotIn(catalog.CSRF_PLACEHOLDER, html)
+        self.assertIn("csrfmiddlewaretoken", html)
+        # Only the data version is read
+        with self.assertNumQueries(1):
+            self.assertIn("RI-CATALOG-1", catalog.render_catalog(self.request))
+
+    def test_inventory_changes_invalidate_the_catalog(self):
+        self.assertIn("RI-CATALOG-1", catalog.render_catalog(self.request))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.status = ItemStatus.RETIRED
+            self.item.save()
+        self.assertNotIn("RI-CATALOG-1", catalog.render_catalog(self.request))
+
+    def test_changes_from_other_processes_reach_the_catalog(self):
+        self.client.force_login(Account.objects.create_user("customer@example.com", "password"))
+        response = self.client.get("/")
+        self.assertContains(response, "RI-CATALOG-1")
+
+        # No signals and no on_commit bump in this process, as if retired by another worker
+        RentalItem.objects.filter(pk=self.item.pk).update(
+            status=ItemStatus.RETIRED, updated_at=timezone.now()
+        )
+        response = self.client.get("/", headers={"if-none-match": response["ETag"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "RI-CATALOG-1")
+        repeat = self.client.get("/", headers={"if-none-match": response["ETag"]})
+        self.assertEqual(repeat.status_code, 304)
+
+
+class SetAvailabilityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tent_type = create_tent_type()
+        chair_type = RentalItemType.objects.create(
+            type_name="chair",
+            rental_price_per_day=decimal.Decimal("2.00"),
+            replacement_cost=decimal.Decimal("20.00"),
+        )
+        table_type = RentalItemType.objects.create(
+            type_name="table",
+            rental_price_per_day=decimal.Decimal("5.00"),
+            replacement_cost=decimal.Decimal("50.00"),
+        )
+        for i in range(5):
+            RentalItem.objects.create(item_type=tent_type, serial_number=f"RI-SET-TENT-{i}")
+        RentalItem.objects.create(
+            item_type=tent_type, serial_number="RI-SET-TENT-RETIRED", status=ItemStatus.RETIRED
+        )
+        for i in range(3):
+            RentalItem.objects.create(item_type=chair_type, serial_number=f"RI-SET-CHAIR-{i}")
+
+        cls.expected = {}
+        for name, components, expected in (
+            # min(5 tents // 2, 3 chairs // 1)
+            ("Tent Pair", [(tent_type, 2), (chair_type, 1)], 2),
+            # min(5 tents // 1, 3 chairs // 2)
+            ("Chair Pair", [(tent_type, 1), (chair_type, 2)], 1),
+            ("Banquet", [(tent_type, 1), (table_type, 1)], 0),
+            ("Empty", [], 0),
+        ):
+            item_set = ItemSet.objects.create(
+                name=name,
+                base_price=decimal.Decimal("50.00"),
+                replacement_deposit=decimal.Decimal("20.00"),
+            )
+            for item_type, quantity in components:
+                ItemSetComponent.objects.create(
+                    item_set=item_set, item_type=item_type, quantity=quantity
+                )
+            cls.expected[item_set.pk] = expected
+
+    def test_sets_are_limited_by_their_scarcest_component(self):
+        # The sets, their components, then the available items per type
+        with self.assertNumQueries(3):
+            self.assertEqual(ItemSet.objects.available_quantities(), self.expected)
+
+    def test_quantities_are_primed_in_a_fixed_number_of_queries(self):
+        with self.assertNumQueries(3):
+            item_sets = ItemSet.objects.order_by("name").with_available_quantity()
+            quantities = {item_set.pk: item_set.available_quantity for item_set in item_sets}
+        self.assertEqual(quantities, self.expected)
+
+        for i in range(10):
+            ItemSet.objects.create(
+                name=f"Extra {i}",
+                base_price=decimal.Decimal("50.00"),
+                replacement_deposit=decimal.Decimal("20.00"),
+            )
+        with self.assertNumQueries(3):
+            item_sets = ItemSet.objects.with_available_quantity()
+            self.assertEqual(sum(item_set.available_quantity for item_set in item_sets), 3)
+
+    def test_sets_without_components_have_none_available(self):
+        empty = ItemSet.objects.get(name="Empty")
+        # No components, so no items to count
+        with self.assertNumQueries(2):
+            self.assertEqual(
+                ItemSet.objects.filter(pk=empty.pk).available_quantities(), {empty.pk: 0}
+            )
+        self.assertEqual(empty.available_quantity, 0)
+
+
+class DashboardStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = Account.objects.create_user("customer@example.com", "password")
+        customer = Customer.objects.create(
+            first_name="Somchai", last_name="Phom", phone_number="020", user=user
+        )
+        cls.rental = create_rental(customer)
+
+    def setUp(self):
+        versions.bump(*(tile.version_name for tile in dashboard_stats.TILES.values()))
+
+    def test_changes_only_recompute_affected_tiles(self):
+        stats = dashboard_stats.get_stats()
+        self.assertEqual(stats["pending_approvals_count"], 1)
+        with self.assertNumQueries(0):
+            dashboard_stats.get_stats()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(
+                rental=self.rental,
+                amount=decimal.Decimal("30.00"),
+                payment_method=PaymentMethod.CASH,
+                payment_type=PaymentType.DEPOSIT,
+            )
+        # Recent bookings (amount paid) and monthly revenue; the rest stay cached
+        with self.assertNumQueries(2):
+            dashboard_stats.get_stats()
+
+
+class ConditionalPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Account.objects.create_user("customer@example.com", "password")
+        cls.tent_type = create_tent_type()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_unchanged_home_page_is_not_modified(self):
+        etag = self.client.get("/")["ETag"]
+        response = self.client.get("/", headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        RentalItem.objects.create(item_type=self.tent_type, serial_number="RI-NEW-1")
+        response = self.client.get("/", headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_swapping_cart_lines_changes_the_etag(self):
+        first = RentalItem.objects.create(item_type=self.tent_type, serial_number="RI-SWAP-1")
+        second = RentalItem.objects.create(item_type=self.tent_type, serial_number="RI-SWAP-2")
+        with self.captureOnCommitCallbacks(execute=True):
+            carts.set_line(self.user, 1, item=first)
+        etag = self.client.get("/")["ETag"]
+
+        # Same cart size, different contents
+        with self.captureOnCommitCallbacks(execute=True):
+            carts.remove_line(self.user, item_id=first.pk)
+            carts.set_line(self.user, 1, item=second)
+        response = self.client.get("/", headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_summaries_tell_the_querysets_apart(self):
+        RentalItem.objects.create(item_type=self.tent_type, serial_number="RI-SUM-1")
+        unnamed_sets = ItemSet.objects.filter(name="")
+        summary = conditional.summarize([RentalItem.objects.all(), unnamed_sets])
+        self.assertEqual([(source, count) for source, count, _ in summary], [(0, 1), (1, 0)])
+        self.assertNotEqual(
+            summary, conditional.summarize([unnamed_sets, RentalItem.objects.all()])
+        )
+
+
+class CartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = Account.objects.create_user("customer@example.com", "password")
+        tent_type = create_tent_type()
+        cls.item = RentalItem.objects.create(item_type=tent_type, serial_number="RI-CART-1")
+        cls.item_set = ItemSet.objects.create(
+            name="Party Set",
+            base_price=decimal.Decimal("50.00"),
+            replacement_deposit=decimal.Decimal("20.00"),
+        )
+
+    def setUp(self):
+        quotes._quote.cache_clear()
+
+    def test_lines_are_upserted_and_counted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            carts.set_line(self.user, 1, item=self.item)
+            carts.set_line(self.user, 2, item_set=self.item_set)
+            carts.set_line(self.user, 3, item_set=self.item_set)
+        self.assertEqual(CartLine.objects.count(), 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(carts.count(self.user), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(
+                carts.remove_line(self.user, **carts.line_lookup("set", self.item_set.pk))
+            )
+        self.assertEqual(carts.count(self.user), 1)
+
+    def test_count_follows_changes_from_other_processes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            carts.set_line(self.user, 1, item=self.item)
+        self.assertEqual(carts.count(self.user), 1)
+        # Another worker's change: nothing in this process hears of it
+        Cart.objects.filter(user=self.user).update(line_count=3)
+        self.assertEqual(carts.count(self.user), 3)
+
+    def test_mini_cart_is_cached_until_the_cart_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            carts.set_line(self.user, 2, item_set=self.item_set)
+        html = carts.render_summary(self.user)
+        self.assertIn("Party Set", html)
+        self.assertIn("100.00", html)
+        # The cart and catalogue data version only
+        with self.assertNumQueries(1):
+            self.assertEqual(carts.render_summary(self.user), html)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            carts.set_line(self.user, 1, item=self.item)
+        self.assertIn("LAK110.00", carts.render_summary(self.user))
+
+        # A price change made elsewhere, with no signal or cache bump, re-renders it too
+        ItemSet.objects.filter(pk=self.item_set.pk).update(
+            base_price=decimal.Decimal("60.00"), updated_at=timezone.now()
+        )
+        self.assertIn("LAK130.00", carts.render_summary(self.user))
+
+        CartLine.objects.filter(cart__user=self.user, item=self.item).delete()
+        self.assertIn("LAK120.00", carts.render_summary(self.user))
+
+
+class QuoteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tent_type = create_tent_type()
+        cls.items = [
+            RentalItem.objects.create(item_type=tent_type, serial_number=f"RI-QUOTE-{i}")
+            for i in range(3)
+        ]
+        cls.item_set = ItemSet.objects.create(
+            name="Party Set",
+            base_price=decimal.Decimal("50.00"),
+            replacement_deposit=decimal.Decimal("20.00"),
+        )
+        ItemSetComponent.objects.create(item_set=cls.item_set, item_type=tent_type, quantity=2)
+
+    def setUp(self):
+        quotes._quote.cache_clear()
+
+    def test_selection_is_priced_with_a_fixed_number_of_queries(self):
+        selection = [("item", item.pk, 1) for item in self.items] + [("set", self.item_set.pk, 2)]
+        # The catalogue data version, then the items, sets and components
+        with self.assertNumQueries(4):
+            quote = quotes.quote(selection, date(2024, 7, 1), date(2024, 7, 3))
+            components = list(quote.set_lines[0].obj.itemsetcomponent_set.all())
+            self.assertEqual(components[0].item_type.rental_price_per_day, 10)
+
+        self.assertEqual(quote.total_price_per_day, decimal.Decimal("130.00"))
+        self.assertEqual(quote.duration_days, 3)
+        self.assertEqual(quote.rental_total, decimal.Decimal("390.00"))
+        # 30% of each item's daily price, the full base price of each set
+        self.assertEqual(quote.deposit, decimal.Decimal("109.00"))
+
+        # Same selection in another order: memoised
+        with self.assertNumQueries(1):
+            self.assertIs(quotes.quote(selection[::-1], date(2024, 7, 1), date(2024, 7, 3)), quote)
+
+    def test_minimum_deposit(self):
+        quote = quotes.quote([("item", self.items[0].pk, 1)])
+        self.assertEqual(quote.duration_days, 1)
+        self.assertEqual(quote.deposit, quotes.MINIMUM_DEPOSIT)
+        self.assertEqual(quotes.quote([]).deposit, 0)
+
+    def test_bookings_price_from_fresh_rows(self):
+        selection = [("item", self.items[0].pk, 1)]
+        self.assertEqual(quotes.quote(selection).total_price_per_day, 10)
+        # Changed without moving updated_at, which the display memo cannot see
+        RentalItemType.objects.update(rental_price_per_day=decimal.Decimal("12.00"))
+        self.assertEqual(quotes.quote(selection).total_price_per_day, 10)
+        self.assertEqual(quotes.locked_quote(selection).total_price_per_day, 12)
+
+    def test_display_prices_follow_changes_from_other_processes(self):
+        selection = [("item", self.items[0].pk, 1)]
+        self.assertEqual(quotes.quote(selection).total_price_per_day, 10)
+        # No signals and no on_commit bump in this process
+        RentalItemType.objects.update(
+            rental_price_per_day=decimal.Decimal("12.00"), updated_at=timezone.now()
+        )
+        self.assertEqual(quotes.quote(selection).total_price_per_day, 12)
+
+    def test_bookings_refuse_missing_items(self):
+        selection = [("item", self.items[0].pk, 1), ("set", self.item_set.pk + 100, 1)]
+        self.assertEqual(len(quotes.quote(selection).lines), 1)
+        with self.assertRaisesMessage(quotes.QuoteError, "not found"):
+            quotes.locked_quote(selection)
+
+    def test_finalize_checks_the_current_item_status(self):
+        user = Account.objects.create_user("customer@example.com", "password")
+        Customer.objects.create(first_name="Somchai", last_name="Phan", user=user)
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            carts.set_line(user, 1, item=self.items[0])
+        # Memoised as available for the booked dates
+        quotes.quote(carts.selection(user), date(2030, 1, 1), date(2030, 1, 2))
+        RentalItem.objects.filter(pk=self.items[0].pk).update(status=ItemStatus.RETIRED)
+
+        self.client.post(
+            "/booking/finalize/",
+            {
+                "start_date": "2030-01-01",
+                "end_date": "2030-01-02",
+                "payment_method": PaymentMethod.CASH,
+                "event_location_notes": "Hall",
+            },
+        )
+        self.assertFalse(RentalTransaction.objects.exists())
+
+
+def jpeg_upload(name, size=(2000, 1500)):
+    buffer = BytesIO()
+    Image.new("RGB", size, "green").save(buffer, "JPEG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+
+class MediaTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        renditions._known.clear()
+        self.item_type = create_tent_type()
+
+
+class RenditionTests(MediaTestCase):
+    def test_uploads_get_downscaled_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = RentalItem.objects.create(
+                item_type=self.item_type, image=jpeg_upload("photo.jpg")
+            )
+        media_jobs.drain()
+        storage = item.image.storage
+        for width in renditions.WIDTHS:
+            for fmt in renditions.FORMATS:
+                name = renditions.rendition_name(item.image.name, width, fmt)
+                with storage.open(name) as rendition:
+                    self.assertEqual(Image.open(rendition).size, (width, width * 3 // 4))
+                self.assertLess(storage.size(name), storage.size(item.image.name))
+
+        srcset = renditions.srcset(item.image, "webp")
+        self.assertIn("/renditions/", srcset)
+        self.assertTrue(srcset.endswith(".webp 640w"))
+
+    def test_missing_renditions_are_queued_not_made_in_the_request(self):
+        item = RentalItem.objects.create(item_type=self.item_type, image=jpeg_upload("photo.jpg"))
+        storage = item.image.storage
+        name = renditions.rendition_name(item.image.name, 320, "jpeg")
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(core_tags.rendition_url(item.image, 300), item.image.url)
+            self.assertEqual(core_tags.rendition_srcset(item.image), "")
+        self.assertFalse(storage.exists(name))
+        self.assertEqual(len(callbacks), 1)  # Queued once
+
+        for callback in callbacks:
+            callback()
+        media_jobs.drain()
+        self.assertEqual(core_tags.rendition_url(item.image, 300), storage.url(name))
+        # Only the expected files, no copies under other names
+        _, files = storage.listdir("rental_item/images/renditions")
+        self.assertCountEqual(
+            files, [os.path.basename(path) for path in renditions.names(item.image.name)]
+        )
+
+    def test_unreadable_images_fall_back_to_the_original(self):
+        item = RentalItem.objects.create(
+            item_type=self.item_type,
+            image=SimpleUploadedFile("broken.jpg", b"not an image", content_type="image/jpeg"),
+        )
+        with self.assertLogs("core.media_jobs", "ERROR"):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(core_tags.rendition_url(item.image), item.image.url)
+            media_jobs.drain()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(core_tags.rendition_url(item.image), item.image.url)
+        self.assertEqual(callbacks, [])
+
+
+class MediaJobTests(MediaTestCase):
+    def test_replaced_images_are_deleted_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = RentalItem.objects.create(
+                item_type=self.item_type, image=jpeg_upload("photo.jpg")
+            )
+        media_jobs.drain()
+        storage = item.image.storage
+        old_names = [item.image.name, *renditions.names(item.image.name)]
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            item.image = jpeg_upload("new.jpg")
+            item.save()
+        # Nothing is deleted before the new image is committed
+        self.assertTrue(all(storage.exists(name) for name in old_names))
+
+        for callback in callbacks:
+            callback()
+        media_jobs.drain()
+        self.assertFalse(any(storage.exists(name) for name in old_names))
+        self.assertTrue(storage.exists(renditions.rendition_name(item.image.name, 640, "webp")))
+
+    def test_payment_slips_are_compressed(self):
+        customer = Customer.objects.create(first_name="Somchai", last_name="Phan")
+        rental = create_rental(customer, date(2024, 7, 1), date(2024, 7, 2))
+        with self.captureOnCommitCallbacks(execute=True):
+            payment = Payment.objects.create(
+                rental=rental,
+                amount=decimal.Decimal("20.00"),
+                payment_method=PaymentMethod.CASH,
+                payment_type=PaymentType.DEPOSIT,
+                payment_slip=jpeg_upload("slip.jpg", size=(4000, 3000)),
+            )
+        media_jobs.drain()
+        with payment.payment_slip.open() as slip:
+            self.assertEqual(Image.open(slip).size, (2048, 1536))
+        _, files = payment.payment_slip.storage.listdir("payment_slip/images")
+        self.assertEqual(files, [os.path.basename(payment.payment_slip.name)])
+
+
+class OccupancyBitmapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tent_type = create_tent_type()
+        cls.type_id = tent_type.pk
+        cls.items = [
+            RentalItem.objects.create(item_type=tent_type, serial_number=f"RI-PLAN-{i}")
+            for i in range(3)
+        ]
+        customer = Customer.objects.create(first_name="Somchai", last_name="Phan")
+        cls.start = date.today() + timedelta(days=10)
+        cls.rental = create_rental(customer, cls.start, cls.start + timedelta(days=2))
+        RentalItemDetail.objects.create(
+            rental=cls.rental, item=cls.items[0], rented_price_per_day=decimal.Decimal("10.00")
+        )
+        cls.user = Account.objects.create_user("staff@example.com", "password")
+
+    def setUp(self):
+        bitmaps.engine.snapshot = None
+        self.client.force_login(self.user)
+
+    def free_items(self, start, end):
+        return self.client.get(
+            "/dashboard/planning/free-items/",
+            {"item_type": self.type_id, "start": start.isoformat(), "end": end.isoformat()},
+        ).json()
+
+    def test_free_items_over_a_window(self):
+        result = self.free_items(self.start - timedelta(days=1), self.start + timedelta(days=1))
+        self.assertEqual(result["free_count"], 2)
+        self.assertEqual(result["free_item_ids"], [self.items[1].pk, self.items[2].pk])
+        self.assertEqual(result["free_per_day"], [3, 2, 2])
+
+    def test_bad_parameters_are_rejected(self):
+        url = "/dashboard/planning/free-items/"
+        start = self.start.isoformat()
+        for params in (
+            {"start": start},
+            {"item_type": self.type_id, "start": "soon"},
+            {"item_type": self.type_id, "start": start, "end": "2000-01-01"},
+            {"item_type": self.type_id, "start": "2000-01-01"},
+        ):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn("error", response.json())
+
+    def test_changes_made_elsewhere_are_picked_up(self):
+        self.assertEqual(self.free_items(self.start, self.start)["free_count"], 2)
+        # As if another process cancelled the booking: no signals reach this engine
+        ItemOccupancy.objects.all().delete()
+        self.assertEqual(self.free_items(self.start, self.start)["free_count"], 3)
+
+        RentalItem.objects.filter(pk=self.items[2].pk).update(
+            status=ItemStatus.RETIRED, updated_at=timezone.now()
+        )
+        self.assertEqual(self.free_items(self.start, self.start)["free_count"], 2)
+
+    def test_booking_writes_do_no_bitmap_work(self):
+        with self.assertNumQueries(1):
+            RentalTransaction.objects.filter(pk=self.rental.pk).update(event_location_notes="Hall")
+        engine = bitmaps.current()
+        with self.assertNumQueries(1):
+            # Unchanged data: only the fingerprint query
+            bitmaps.current()
+        self.assertEqual(engine.count_free(self.type_id, self.start, self.start), 2)
+
+    def test_changes_reload_only_the_affected_items(self):
+        before = bitmaps.current()
+        detail = RentalItemDetail.objects.create(
+            rental=self.rental, item=self.items[1], rented_price_per_day=decimal.Decimal("10.00")
+        )
+        with mock.patch.object(bitmaps.engine, "rebuild") as rebuild:
+            # Fingerprint, changed bookings and items, then the affected items and their bookings
+            with self.assertNumQueries(5):
+                after = bitmaps.current()
+            self.assertEqual(
+                after.free_items_of_type(self.type_id, self.start, self.start), {self.items[2].pk}
+            )
+
+            # A booking moved to another item frees the item it left
+            detail.item = self.items[2]
+            detail.save()
+            self.assertEqual(
+                bitmaps.current().free_items_of_type(self.type_id, self.start, self.start),
+                {self.items[1].pk},
+            )
+
+            # Check-out flips the status of an item
+            RentalItem.objects.filter(pk=self.items[1].pk).update(
+                status=ItemStatus.UNDER_MAINTENANCE, updated_at=timezone.now()
+            )
+            self.assertEqual(bitmaps.current().count_free(self.type_id, self.start, self.start), 0)
+            rebuild.assert_not_called()
+        # Snapshots handed out earlier are never changed under their readers
+        self.assertEqual(before.count_free(self.type_id, self.start, self.start), 2)
+
+    def test_deletions_rebuild_everything(self):
+        bitmaps.current()
+        RentalItemDetail.objects.create(
+            rental=self.rental, item=self.items[1], rented_price_per_day=decimal.Decimal("10.00")
+        )
+        # One row added, one deleted: the count alone would not move
+        ItemOccupancy.objects.filter(item=self.items[0]).delete()
+        with mock.patch.object(bitmaps.engine, "rebuild", wraps=bitmaps.engine.rebuild) as rebuild:
+            snapshot = bitmaps.current()
+        rebuild.assert_called_once()
+        self.assertEqual(
+            snapshot.free_items_of_type(self.type_id, self.start, self.start),
+            {self.items[0].pk, self.items[2].pk},
+        )
+
+
+class ExportJobTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(Account.objects.create_user("staff@example.com", "password"))
+
+    def download(self, **headers):
+        return self.client.get(
+            "/dashboard/rental-item-types/export/", {"format": "csv"}, headers=headers
+        )
+
+    def test_unchanged_export_is_not_modified(self):
+        response = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"100.00", b"".join(response.streaming_content))
+
+        self.assertEqual(self.download(if_none_match=response["ETag"]).status_code, 304)
+        repeat = self.download()
+        self.assertEqual(repeat["ETag"], response["ETag"])
+        self.assertEqual(ExportJob.objects.count(), 1)
+
+    def test_changes_rebuild_the_export(self):
+        etag = self.download()["ETag"]
+        # Written without signals, as another process would: only the data tells
+        RentalItemType.objects.filter(pk=self.item_type.pk).update(
+            replacement_cost=decimal.Decimal("250.00"), updated_at=timezone.now()
+        )
+        response = self.download(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertIn(b"250.00", b"".join(response.streaming_content))
+
+        etag = response["ETag"]
+        RentalItemType.objects.create(
+            type_name="table",
+            rental_price_per_day=decimal.Decimal("5.00"),
+            replacement_cost=decimal.Decimal("50.00"),
+        )
+        self.assertEqual(self.download(if_none_match=etag).status_code, 200)
+        self.assertEqual(ExportJob.objects.count(), 3)
+
+    def start_job(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post("/dashboard/exports/rental_item_types/jobs/?format=csv")
+        return response, len(callbacks)
+
+    def test_identical_requests_share_a_job(self):
+        first, queued = self.start_job()
+        self.assertEqual((first.status_code, queued), (202, 1))
+        repeat, queued = self.start_job()
+        self.assertEqual((repeat.status_code, queued), (200, 0))
+        self.assertEqual(repeat.json()["id"], first.json()["id"])
+
+        export_jobs.run(first.json()["id"])
+        self.assertEqual(self.start_job()[0].json()["id"], first.json()["id"])
+        RentalItemType.objects.filter(pk=self.item_type.pk).update(updated_at=timezone.now())
+        changed, queued = self.start_job()
+        self.assertEqual((changed.status_code, queued), (202, 1))
+
+    def test_progress_is_reported(self):
+        response, _ = self.start_job()
+        job = ExportJob.objects.get(pk=response.json()["id"])
+        ExportJob.objects.filter(pk=job.pk).update(total_rows=10)
+        with mock.patch.object(export_jobs, "CHUNK_SIZE", 2):
+            rows = export_jobs._counted(iter(range(10)), job.pk)
+            for _ in range(5):
+                next(rows)
+        status = self.client.get(response.json()["status_url"]).json()
+        self.assertEqual((status["rows_written"], status["progress"]), (4, 40))
+
+        export_jobs.run(job.pk)
+        status = self.client.get(response.json()["status_url"]).json()
+        self.assertEqual((status["status"], status["progress"]), ("done", 100))
+        download = self.client.get(status["download_url"])
+        self.assertIn(b"100.00", b"".join(download.streaming_content))
+
+    def test_failed_jobs_are_reported_and_not_reused(self):
+        response, _ = self.start_job()
+        with mock.patch.object(exports, "write_file", side_effect=OSError("Disk full")):
+            with self.assertLogs("core.export_jobs", "ERROR"):
+                export_jobs.run(response.json()["id"])
+        status = self.client.get(response.json()["status_url"]).json()
+        self.assertEqual((status["status"], status["error"]), ("failed", "Disk full"))
+        self.assertNotIn("download_url", status)
+
+        retry, queued = self.start_job()
+        self.assertEqual((retry.status_code, queued), (202, 1))
+        self.assertNotEqual(retry.json()["id"], response.json()["id"])
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.somchai = Customer.objects.create(first_name="Somchai", last_name="Phanthavong")
+        cls.bo = Customer.objects.create(first_name="Bo", last_name="Vongsa")
+        cls.lao = Customer.objects.create(first_name="ສົມໃຈ", last_name="ແກ້ວມະນີ")
+
+    def find(self, query):
+        return list(search.filter_queryset(Customer.objects.order_by("pk"), "customers", query))
+
+    def test_words_match_substrings_across_fields(self):
+        self.assertEqual(self.find("chai phan"), [self.somchai])
+        self.assertEqual(self.find("ແກ້ວ"), [self.lao])
+        self.assertCountEqual(self.find("vong"), [self.somchai, self.bo])
+        self.assertEqual(search.search("customers", "vongsa"), [self.bo.pk])
+
+    def test_short_words_fall_back_on_their_own(self):
+        self.assertEqual(self.find("bo vong"), [self.bo])
+        self.assertEqual(self.find("so phan"), [self.somchai])
+        self.assertEqual(self.find("bo phan"), [])
+        self.assertEqual(search.search("customers", "vong bo"), [self.bo.pk])
+
+    def test_icontains_without_fts(self):
+        with mock.patch.object(search, "_available", False):
+            self.assertEqual(self.find("chai phan"), [self.somchai])
+            self.assertEqual(self.find("bo vong"), [self.bo])
+            self.assertEqual(search.search("customers", "vong"), [self.somchai.pk, self.bo.pk])
+
+    def test_index_follows_changes(self):
+        self.bo.last_name = "Keomany"
+        self.bo.save()
+        self.assertEqual(self.find("vongsa"), [])
+        self.assertEqual(self.find("keoma"), [self.bo])
+        self.somchai.delete()
+        self.assertEqual(self.find("vong"), [])
+
+    def test_logins_do_not_reindex(self):
+        account = Account.objects.create_user("somchai@example.com", "password")
+        with mock.patch.object(search, "sync_instance") as sync_instance:
+            self.client.force_login(account)
+            sync_instance.assert_not_called()
+            account.email = "somchai.p@example.com"
+            account.save()
+            sync_instance.assert_called_once_with(account)
+
+
+class RevenueRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(first_name="Somchai", last_name="Phan")
+        cls.rental = create_rental(customer, date(2030, 1, 1), date(2030, 1, 2))
+
+    def rollup(self):
+        return list(DailyRevenue.objects.order_by("date").values_list("date", "total_amount"))
+
+    def pay(self, amount):
+        return Payment.objects.create(
+            rental=self.rental,
+            amount=decimal.Decimal(amount),
+            payment_method=PaymentMethod.CASH,
+            payment_type=PaymentType.RENTAL_FEE,
+        )
+
+    def test_rollup_follows_saves_and_deletes(self):
+        today = timezone.localdate()
+        first = self.pay("30.00")
+        second = self.pay("20.00")
+        self.assertEqual(self.rollup(), [(today, decimal.Decimal("50.00"))])
+
+        first.amount = decimal.Decimal("40.00")
+        first.save()
+        self.assertEqual(self.rollup(), [(today, decimal.Decimal("60.00"))])
+
+        second.delete()
+        self.assertEqual(self.rollup(), [(today, decimal.Decimal("40.00"))])
+        first.delete()
+        self.assertEqual(self.rollup(), [])
+
+    def test_moving_a_payment_refreshes_both_days(self):
+        today = timezone.localdate()
+        payment = self.pay("30.00")
+        self.pay("5.00")
+        payment.transaction_date -= timedelta(days=1)
+        payment.save()
+        self.assertEqual(
+            self.rollup(),
+            [
+                (today - timedelta(days=1), decimal.Decimal("30.00")),
+                (today, decimal.Decimal("5.00")),
+            ],
+        )
+        self.assertEqual(revenue.rebuild(), 2)
+        self.assertEqual(len(self.rollup()), 2)
+
+
+class OccupancyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tent_type = create_tent_type()
+        cls.items = [
+            RentalItem.objects.create(item_type=tent_type, serial_number=f"RI-OCC-{i}")
+            for i in range(2)
+        ]
+        cls.customer = Customer.objects.create(first_name="Somchai", last_name="Phan")
+
+    def book(self):
+        rental = create_rental(self.customer, date(2030, 5, 1), date(2030, 5, 3))
+        for item in self.items:
+            RentalItemDetail.objects.create(
+                rental=rental, item=item, rented_price_per_day=decimal.Decimal("10.00")
+            )
+        return rental
+
+    def booked(self, start_date=date(2030, 5, 2), end_date=date(2030, 5, 2)):
+        return occupancy.booked_item_ids([item.pk for item in self.items], start_date, end_date)
+
+    def test_bookings_block_their_items_for_their_dates(self):
+        rental = self.book()
+        self.assertEqual(self.booked(), {item.pk for item in self.items})
+        self.assertEqual(self.booked(date(2030, 5, 4), date(2030, 5, 9)), set())
+
+        rental.end_date = date(2030, 5, 6)
+        rental.save()
+        self.assertEqual(len(self.booked(date(2030, 5, 5), date(2030, 5, 5))), 2)
+
+    def test_cancelled_and_completed_bookings_release_their_items(self):
+        for status in (PaymentStatus.CANCELLED, PaymentStatus.COMPLETED):
+            with self.subTest(status=status):
+                rental = self.book()
+                rental.payment_status = status
+                rental.save()
+                self.assertEqual(self.booked(), set())
+                self.assertFalse(ItemOccupancy.objects.filter(rental=rental).exists())
+
+    def test_reopened_bookings_block_their_items_again(self):
+        rental = self.book()
+        rental.payment_status = PaymentStatus.CANCELLED
+        rental.save()
+        rental.payment_status = PaymentStatus.PAID
+        rental.save()
+        self.assertEqual(self.booked(), {item.pk for item in self.items})
+        self.assertEqual(occupancy.rebuild(), 2)
+
+
+class AvailabilityCalendarTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tent_type = create_tent_type()
+        chair_type = RentalItemType.objects.create(
+            type_name="chair",
+            rental_price_per_day=decimal.Decimal("2.00"),
+            replacement_cost=decimal.Decimal("20.00"),
+        )
+        cls.tent_id, cls.chair_id = tent_type.pk, chair_type.pk
+        tents = [
+            RentalItem.objects.create(item_type=tent_type, serial_number=f"RI-CAL-TENT-{i}")
+            for i in range(3)
+        ]
+        chairs = [
+            RentalItem.objects.create(item_type=chair_type, serial_number=f"RI-CAL-CHAIR-{i}")
+            for i in range(2)
+        ]
+        cls.item_set = ItemSet.objects.create(
+            name="Party Set",
+            base_price=decimal.Decimal("50.00"),
+            replacement_deposit=decimal.Decimal("20.00"),
+        )
+        ItemSetComponent.objects.create(item_set=cls.item_set, item_type=tent_type, quantity=2)
+        ItemSetComponent.objects.create(item_set=cls.item_set, item_type=chair_type, quantity=2)
+        cls.empty_set = ItemSet.objects.create(
+            name="Empty Set",
+            base_price=decimal.Decimal("10.00"),
+            replacement_deposit=decimal.Decimal("0.00"),
+        )
+
+        cls.customer = Customer.objects.create(first_name="Somchai", last_name="Phan")
+        cls.start = date(2030, 5, 10)
+        # Starts before the window and ends inside it
+        cls.book(date(2030, 5, 8), date(2030, 5, 11), tents[0])
+        # Starts inside the window and ends after it
+        cls.book(date(2030, 5, 13), date(2030, 5, 20), tents[1], chairs[0])
+        cls.spare_tent = tents[2]
+        cls.user = Account.objects.create_user("staff@example.com", "password")
+
+    @classmethod
+    def book(cls, start_date, end_date, *items):
+        rental = create_rental(cls.customer, start_date, end_date)
+        for item in items:
+            RentalItemDetail.objects.create(
+                rental=rental, item=item, rented_price_per_day=decimal.Decimal("10.00")
+            )
+
+    def setUp(self):
+        versions.bump(availability.VERSION_NAME)
+        self.client.force_login(self.user)
+
+    def availability_of(self, entries, pk):
+        return next(entry["available"] for entry in entries if entry["id"] == pk)
+
+    def test_bookings_are_clipped_to_the_window(self):
+        data = self.client.get(
+            "/availability/calendar/", {"start": self.start.isoformat(), "days": 5}
+        ).json()
+        self.assertEqual(data["dates"][0], "2030-05-10")
+        self.assertEqual(data["dates"][-1], "2030-05-14")
+        self.assertEqual(self.availability_of(data["item_types"], self.tent_id), [2, 2, 3, 2, 2])
+        self.assertEqual(self.availability_of(data["item_types"], self.chair_id), [2, 2, 2, 1, 1])
+
+    def test_sets_are_limited_by_their_scarcest_component(self):
+        data = availability.compute_calendar(self.start, 5)
+        # min(tents // 2, chairs // 2) on each day
+        self.assertEqual(self.availability_of(data["item_sets"], self.item_set.pk), [1, 1, 1, 0, 0])
+        self.assertEqual(self.availability_of(data["item_sets"], self.empty_set.pk), [0] * 5)
+
+    def test_queries_do_not_grow_with_the_window(self):
+        for days in (1, availability.MAX_WINDOW_DAYS):
+            with self.subTest(days=days), self.assertNumQueries(5):
+                availability.compute_calendar(self.start, days)
+
+    def test_bad_parameters_are_rejected(self):
+        for params in (
+            {"start": "soon"},
+            {"start": "2030-02-30"},
+            {"days": "week"},
+            {"days": 0},
+            {"days": availability.MAX_WINDOW_DAYS + 1},
+        ):
+            response = self.client.get("/availability/calendar/", params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn("error", response.json())
+
+    def test_cached_calendars_are_invalidated_on_commit(self):
+        tents = self.availability_of(
+            availability.get_calendar(self.start, 5)["item_types"], self.tent_id
+        )
+        self.assertEqual(tents, [2, 2, 3, 2, 2])
+        with self.assertNumQueries(0):
+            availability.get_calendar(self.start, 5)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.book(date(2030, 5, 12), date(2030, 5, 12), self.spare_tent)
+        # Not committed yet: the cached calendar is still served
+        calendar = availability.get_calendar(self.start, 5)
+        self.assertEqual(self.availability_of(calendar["item_types"], self.tent_id), tents)
+
+        for callback in callbacks:
+            callback()
+        calendar = availability.get_calendar(self.start, 5)
+        self.assertEqual(
+            self.availability_of(calendar["item_types"], self.tent_id), [2, 2, 2, 2, 2]
+        )
+
+
+class AllocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tent_type = create_tent_type()
+        cls.items = [
+            RentalItem.objects.create(item_type=cls.tent_type, serial_number=f"RI-ALLOC-{i}")
+            for i in range(3)
+        ]
+        item_set = ItemSet.objects.create(
+            name="Party Set",
+            base_price=decimal.Decimal("50.00"),
+            replacement_deposit=decimal.Decimal("20.00"),
+        )
+        ItemSetComponent.objects.create(item_set=item_set, item_type=cls.tent_type, quantity=2)
+        cls.customer = Customer.objects.create(first_name="Somchai", last_name="Phan")
+
+    def set_requests(self, quantity):
+        item_set = ItemSet.objects.prefetch_related("itemsetcomponent_set__item_type").get()
+        return [(item_set, quantity)]
+
+    def test_components_get_distinct_free_items(self):
+        RentalItem.objects.filter(pk=self.items[0].pk).update(status=ItemStatus.RETIRED)
+        requests = self.set_requests(1)
+        with self.assertNumQueries(1):
+            picked = allocation.allocate(requests, date(2030, 5, 1), date(2030, 5, 2))
+        (assigned,) = picked.values()
+        self.assertEqual(sorted(pk for _, pk in assigned), [self.items[1].pk, self.items[2].pk])
+
+    def test_shortfall_raises_allocation_error(self):
+        rental = create_rental(self.customer, date(2030, 5, 2), date(2030, 5, 4))
+        RentalItemDetail.objects.create(
+            rental=rental, item=self.items[0], rented_price_per_day=decimal.Decimal("10.00")
+        )
+        # Two are free, four are needed
+        with self.assertRaisesMessage(allocation.AllocationError, "(need 4, 2 free)"):
+            allocation.allocate(self.set_requests(2), date(2030, 5, 1), date(2030, 5, 2))
+        with self.assertRaises(allocation.AllocationError):
+            allocation.allocate(
+                self.set_requests(1),
+                date(2030, 5, 1),
+                date(2030, 5, 2),
+                exclude_item_ids=[self.items[1].pk],
+            )
+        self.assertEqual(
+            len(allocation.allocate(self.set_requests(1), date(2030, 5, 1), date(2030, 5, 2))), 1
+        )
+
+
+class LedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tent_type = create_tent_type()
+        cls.items = [
+            RentalItem.objects.create(item_type=tent_type, serial_number=f"RI-LEDGER-{i}")
+            for i in range(2)
+        ]
+        customer = Customer.objects.create(first_name="Somchai", last_name="Phan")
+        cls.rental = create_rental(customer, date(2030, 5, 1), date(2030, 5, 3))
+
+    def stored(self):
+        self.rental.refresh_from_db()
+        return ledger.stored_values(self.rental)
+
+    def book(self, item):
+        RentalItemDetail.objects.create(
+            rental=self.rental, item=item, rented_price_per_day=decimal.Decimal("10.00")
+        )
+
+    def pay(self, amount):
+        Payment.objects.create(
+            rental=self.rental,
+            amount=decimal.Decimal(amount),
+            payment_method=PaymentMethod.CASH,
+            payment_type=PaymentType.RENTAL_FEE,
+        )
+
+    def test_changes_refresh_the_ledger(self):
+        self.book(self.items[0])
+        self.pay("20.00")
+        self.assertEqual(
+            self.stored(),
+            {
+                "rental_cost_total": decimal.Decimal("30.00"),
+                "amount_paid_total": decimal.Decimal("20.00"),
+                "balance_due": decimal.Decimal("10.00"),
+            },
+        )
+        self.rental.total_fines = decimal.Decimal("5.00")
+        self.rental.save()
+        self.assertEqual(self.stored()["balance_due"], decimal.Decimal("15.00"))
+
+    def test_batch_refreshes_each_ledger_once_at_the_end(self):
+        with mock.patch.object(ledger, "refresh", wraps=ledger.refresh) as refresh:
+            with ledger.batch():
+                for item in self.items:
+                    self.book(item)
+                self.pay("20.00")
+                self.assertEqual(self.stored()["rental_cost_total"], decimal.Decimal("0.00"))
+            refresh.assert_called_once_with(self.rental.pk)
+        self.assertEqual(self.stored()["balance_due"], decimal.Decimal("40.00"))
+
+    def test_rebuild_ledger_check(self):
+        self.book(self.items[0])
+        out = StringIO()
+        call_command("rebuild_ledger", "--check", stdout=out)
+        self.assertIn("up to date", out.getvalue())
+
+        RentalTransaction.objects.filter(pk=self.rental.pk).update(balance_due=0)
+        with self.assertRaisesMessage(CommandError, f"1 ledger(s) out of date: #{self.rental.pk}"):
+            call_command("rebuild_ledger", "--check")
+        self.assertEqual(self.stored()["balance_due"], decimal.Decimal("0.00"))
+
+        call_command("rebuild_ledger", stdout=StringIO())
+        self.assertEqual(self.stored()["balance_due"], decimal.Decimal("30.00"))
+
+
+class KeysetPaginationTests(TestCase):
+    keys = ["-start_date", "-pk"]
+
+    @classmethod
+    def setUpTestData(cls):
+        customer = Customer.objects.create(first_name="Somchai", last_name="Phan")
+        # Several rentals share a start date, so the pk breaks the ties
+        for offset in range(7):
+            create_rental(customer, date(2030, 5, 1 + offset // 3), date(2030, 5, 9))
+        cls.ordered = list(RentalTransaction.objects.order_by(*cls.keys))
+
+    def setUp(self):
+        cache.clear()
+
+    def page(self, cursor=None):
+        return pagination.keyset_page(RentalTransaction.objects.all(), self.keys, 3, cursor)
+
+    def test_cursors_round_trip(self):
+        pages = [self.page()]
+        while pages[-1].has_next():
+            pages.append(self.page(pages[-1].next_cursor))
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual([rental for page in pages for rental in page], self.ordered)
+        self.assertFalse(pages[0].has_previous())
+
+        back = self.page(pages[2].previous_cursor)
+        self.assertEqual(back.object_list, pages[1].object_list)
+        self.assertEqual(self.page(back.previous_cursor).object_list, pages[0].object_list)
+        with self.assertRaises(pagination.InvalidCursor):
+            self.page("not-a-cursor")
+
+    def paginate(self, **params):
+        request = RequestFactory().get("/", params)
+        return pagination.paginate(request, RentalTransaction.objects.all(), self.keys, 3)
+
+    def test_large_tables_switch_to_cursors(self):
+        with override_settings(KEYSET_PAGINATION_THRESHOLD=7):
+            page = self.paginate(page=2)
+            self.assertFalse(getattr(page, "is_keyset", False))
+            self.assertEqual(page.object_list[0], self.ordered[3])
+        cache.clear()
+        with override_settings(KEYSET_PAGINATION_THRESHOLD=6):
+            page = self.paginate(page=2)
+            self.assertTrue(page.is_keyset)
+            self.assertEqual(page.object_list, self.ordered[:3])
+            self.assertEqual(page.approximate_count, 7)
+            self.assertEqual(self.paginate(cursor="garbled").object_list, self.ordered[:3])
+        # A cursor keeps cursor mode whatever the table size
+        self.assertTrue(self.paginate(cursor=page.next_cursor).is_keyset)
@@ -11,6 +11,11 @@ urlpatterns = [
     path("about/", core_views.about, name="about"),
     path("contact/", core_views.contact, name="contact"),
     path("item/<int:pk>/", core_views.item_detail_view, name="item_detail"),
+    path(
+        "availability/calendar/",
+        core_views.availability_calendar_view,
+        name="availability_calendar",
+    ),
     # NOTE: Old Single Item Booking (Keep for reference or specific use cases, but primary flow changes)
     path("booking/item/<int:item_pk>/", core_views.create_booking_view, name="create_booking"),
     # NOTE: Booking Selection (Cart) Flow
@@ -57,6 +62,12 @@ urlpatterns = [
     ),
     # NOTE: Dashboard Pages
     path("dashboard/", core_views.dashboard, name="dashboard"),
+    path("dashboard/stats/cache/", core_views.dashboard_cache_stats, name="dashboard_cache_stats"),
+    path(
+        "dashboard/planning/free-items/",
+        core_views.planning_free_items,
+        name="planning_free_items",
+    ),
     # Users
     path("accounts/", include("accounts.urls")),
     path("dashboard/profile", core_views.manage_profile, name="manage-profile"),
@@ -82,6 +93,11 @@ urlpatterns = [
         core_views.delete_customer,
         name="delete-customer",
     ),
+    path(
+        "dashboard/manage-customers/autocomplete/",
+        core_views.customer_autocomplete,
+        name="customer-autocomplete",
+    ),
     # Rental item type
     path(
         "dashboard/manage-rental-item-types/",
@@ -114,6 +130,11 @@ urlpatterns = [
         core_views.delete_rental_item,
         name="delete-rental-item",
     ),
+    path(
+        "dashboard/manage-rental-items/scan/",
+        core_views.scan_rental_items,
+        name="scan-rental-items",
+    ),
     # Item Set (NEW)
     path("dashboard/manage-item-sets/", core_views.manage_item_sets, name="manage-item-sets"),
     path(
@@ -207,4 +228,20 @@ urlpatterns = [
         core_views.export_revenue_report_excel,
         name="export_revenue_report_excel",
     ),
+    # Background export jobs
+    path(
+        "dashboard/exports/<str:dataset>/jobs/",
+        core_views.start_export_job,
+        name="start_export_job",
+    ),
+    path(
+        "dashboard/exports/jobs/<int:pk>/",
+        core_views.export_job_status,
+        name="export_job_status",
+    ),
+    path(
+        "dashboard/exports/jobs/<int:pk>/download/",
+        core_views.download_export_job,
+        name="download_export_job",
+    ),
 ]
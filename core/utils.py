@@ -27,3 +27,14 @@ def payment_slip_storage(instance, filename):
     ext = filename.split(".")[-1]
     new_filename = f"payment_slip_{payment_slip_id}_image_{datetime.now()}.{ext}"
     return os.path.join("payment_slip/images/", new_filename)
+
+
+def export_file_storage(instance, filename):
+    return os.path.join("exports/", filename)
+
+
+def rendition_storage(name, width, extension):
+    # Renditions sit in a "renditions" folder next to the original upload
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, "renditions", f"{stem}_{width}w.{extension}")
@@ -0,0 +1,48 @@
+"""
+Named data versions stored in the cache.
+
+Cached results embed the version of the data they were built from in their
+cache key; bumping the version makes every older entry unreachable, so there
+is no need to track and delete individual keys.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+KEY_PREFIX = "core:version:"
+
+
+def get_version(name):
+    """Returns the current version number of the named dataset."""
+    # Seed with a timestamp rather than 1 so an evicted counter never restarts at a
+    # value that older cache entries were built with.
+    return cache.get_or_set(KEY_PREFIX + name, time.time_ns, timeout=None)
+
+
+def bump(*names):
+    """Invalidates everything cached against the given datasets."""
+    for name in names:
+        key = KEY_PREFIX + name
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Key missing or evicted: start again from a fresh timestamp.
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def bump_on_commit(*names):
+    """
+    Bumps the versions once the current transaction commits, so readers never
+    cache data computed from a snapshot that predates the change.
+    """
+    transaction.on_commit(lambda: bump(*names))
+
+
+def versioned_key(prefix, *names, **params):
+    """Builds a cache key that changes whenever one of the named datasets changes."""
+    parts = [prefix]
+    parts.extend(f"{name}.{get_version(name)}" for name in names)
+    parts.extend(f"{key}={params[key]}" for key in sorted(params))
+    return ":".join(parts)
@@ -1,25 +1,43 @@
 import decimal
 import uuid
-from collections import defaultdict
-from datetime import date, timedelta
+from datetime import date
 
-import openpyxl
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.hashers import make_password
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.db import transaction
-from django.db.models import Prefetch, Q, Sum
-from django.http import Http404, HttpResponse, JsonResponse, QueryDict
+from django.db.models import Prefetch, Q
+from django.http import FileResponse, Http404, JsonResponse, QueryDict
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
 from django.views.decorators.http import require_POST
-from openpyxl.utils import get_column_letter
 
 from accounts.models import Account, Customer, Employee
+from core import (
+    allocation,
+    autocomplete,
+    availability,
+    bitmaps,
+    carts,
+    catalog,
+    conditional,
+    dashboard_stats,
+    export_jobs,
+    exports,
+    filters,
+    ledger,
+    occupancy,
+    pagination,
+    quotes,
+    revenue,
+    scanning,
+    search,
+)
 from core.models import (
     Accessory,
+    ExportJob,
+    ExportStatus,
     ItemSet,
     ItemSetComponent,
     ItemStatus,
@@ -53,24 +71,15 @@ def custom_404_view(request, exception):
 
 
 # NOTE: Home
+def _catalog_querysets(request):
+    return catalog.querysets()
+
+
 @login_required
+@conditional.conditional_page(_catalog_querysets)
 def home(request):
-    rental_items = RentalItem.objects.filter(status=ItemStatus.AVAILABLE).order_by("-updated_at")
-    item_sets = ItemSet.objects.all().order_by("name")  # Consider adding availability check later
-
-    # Calculate available quantity for sets (can be slow if many sets/items)
-    # You might want to optimize this or calculate on demand
-    available_sets = []
-    for item_set in item_sets:
-        if item_set.available_quantity > 0:
-            available_sets.append(item_set)
-            print("Available sets - inside: ", available_sets)
-    print("Available sets - outside: ", available_sets)
-
-    context = {
-        "rental_items": rental_items,
-        "item_sets": item_sets,
-    }
+    # The item and set grid is rendered once per inventory change (see core.catalog)
+    context = {"catalog": catalog.render_catalog(request)}
     return render(request, "core/clients/pages/home.html", context)
 
 
@@ -82,6 +91,11 @@ def contact(request):
     return render(request, "core/clients/pages/contact.html")
 
 
+def _item_detail_querysets(request, pk):
+    return [RentalItem.objects.filter(pk=pk), RentalItemType.objects.filter(rentalitem=pk)]
+
+
+@conditional.conditional_page(_item_detail_querysets)
 def item_detail_view(request, pk):
     # Can show details for RentalItem or ItemSet based on a type parameter or separate URLs
     # For now, assuming it's for RentalItem
@@ -90,6 +104,37 @@ def item_detail_view(request, pk):
     return render(request, "core/clients/pages/item_detail.html", context)
 
 
+@login_required
+def availability_calendar_view(request):
+    """
+    JSON per-day availability for every item type and set.
+    Query params: start (YYYY-MM-DD, defaults to today) and days (1-90, defaults to 30).
+    """
+    start_param = request.GET.get("start")
+    days_param = request.GET.get("days", str(availability.DEFAULT_WINDOW_DAYS))
+
+    try:
+        start_date = (
+            timezone.datetime.strptime(start_param, "%Y-%m-%d").date()
+            if start_param
+            else timezone.now().date()
+        )
+    except ValueError:
+        return JsonResponse({"error": "Invalid 'start' date. Use YYYY-MM-DD."}, status=400)
+
+    try:
+        days = int(days_param)
+    except ValueError:
+        return JsonResponse({"error": "'days' must be a number."}, status=400)
+    if not 1 <= days <= availability.MAX_WINDOW_DAYS:
+        return JsonResponse(
+            {"error": f"'days' must be between 1 and {availability.MAX_WINDOW_DAYS}."},
+            status=400,
+        )
+
+    return JsonResponse(availability.get_calendar(start_date, days))
+
+
 @login_required  # Ensure only logged-in users can book
 def create_booking_view(request, item_pk):
     item_to_book = get_object_or_404(RentalItem, pk=item_pk)
@@ -109,16 +154,8 @@ def create_booking_view(request, item_pk):
             payment_method = form.cleaned_data["payment_method"]
 
             # --- Data Validation & Calculation ---
-            # Check for overlapping bookings for THIS specific item (simple check)
-            overlapping_rentals = RentalItemDetail.objects.filter(
-                item=item_to_book,
-                rental__end_date__gte=start_date,  # Rental ends on or after new start
-                rental__start_date__lte=end_date,  # Rental starts on or before new end
-            ).exclude(
-                rental__payment_status=PaymentStatus.CANCELLED
-            )  # Optional: exclude cancelled
-
-            if overlapping_rentals.exists():
+            # Check for overlapping bookings for THIS specific item via the occupancy index
+            if not occupancy.is_item_free(item_to_book, start_date, end_date):
                 messages.error(
                     request,
                     f"'{item_to_book.item_type}' is already booked during the selected dates. Please choose different dates.",
@@ -127,24 +164,17 @@ def create_booking_view(request, item_pk):
                 context = {"form": form, "item": item_to_book}
                 return render(request, "core/clients/pages/booking_form.html", context)
 
-            # Calculate rental duration (inclusive of start and end day)
-            duration_days = (end_date - start_date).days + 1
-            if duration_days <= 0:
-                duration_days = 1  # Minimum 1 day rental
-
-            # Calculate total rental cost
-            price_per_day = item_to_book.item_type.rental_price_per_day
-            total_rental_cost = price_per_day * decimal.Decimal(duration_days)
-
-            # Calculate deposit (Example: 20% of total rental or minimum $20)
-            deposit_percentage = decimal.Decimal("0.20")
-            calculated_deposit = total_rental_cost * deposit_percentage
-            minimum_deposit = decimal.Decimal("20.00")
-            total_deposit = max(calculated_deposit, minimum_deposit)
-
             # --- Database Operations (Use a transaction) ---
             try:
-                with transaction.atomic():
+                with transaction.atomic(), ledger.batch():
+                    # Price and deposit by the same rules as the booking selection,
+                    # from the item as it is now (core.quotes)
+                    quote = quotes.locked_quote(
+                        [("item", item_to_book.pk, 1)], start_date, end_date
+                    )
+                    price_per_day = quote.lines[0].unit_price_per_day
+                    total_deposit = quote.deposit
+
                     # Get the customer profile associated with the logged-in user
                     customer = get_object_or_404(Customer, user=request.user)
 
@@ -209,24 +239,6 @@ def create_booking_view(request, item_pk):
     return render(request, "core/clients/pages/booking_form.html", context)
 
 
-# --- Helper Function for Session Management ---
-def get_booking_selection(session):
-    """Gets the booking selection from the session, initializing if needed."""
-    selection = session.get("booking_selection", {"items": {}, "sets": {}})
-    # Ensure keys exist
-    if "items" not in selection:
-        selection["items"] = {}
-    if "sets" not in selection:
-        selection["sets"] = {}
-    return selection
-
-
-def clear_booking_selection(session):
-    """Clears the booking selection from the session."""
-    if "booking_selection" in session:
-        del session["booking_selection"]
-
-
 # --- Booking Selection (Cart) Views ---
 
 
@@ -241,25 +253,16 @@ def add_to_booking_selection(request):
         messages.error(request, "Quantity must be positive.")
         return redirect(request.META.get("HTTP_REFERER", "home"))  # Redirect back
 
-    selection = get_booking_selection(request.session)
     item_name = ""
 
     if item_id:
         try:
             item = get_object_or_404(RentalItem, pk=item_id, status=ItemStatus.AVAILABLE)
-            item_pk_str = str(item.pk)
             item_name = str(item.item_type)
 
-            # Check if adding this quantity exceeds available stock (simple check)
-            # Note: Real availability check happens at finalize_booking
-            current_quantity = selection["items"].get(item_pk_str, {}).get("quantity", 0)
-            # A more robust check would query the DB for available count, but can be slow here.
-            # Let's assume we allow adding for now and check properly at finalization.
-
-            selection["items"][item_pk_str] = {
-                "quantity": current_quantity + quantity,
-                "type": "item",
-            }
+            # Real availability check happens at finalize_booking.
+            # An item is one physical unit, so adding it again replaces its line.
+            carts.set_line(request.user, quantity, item=item)
             messages.success(request, f"Added {quantity} x '{item_name}' to your selection.")
 
         except Http404:
@@ -272,7 +275,6 @@ def add_to_booking_selection(request):
     elif set_id:
         try:
             item_set = get_object_or_404(ItemSet, pk=set_id)
-            set_pk_str = str(item_set.pk)
             item_name = item_set.name
 
             # Check available quantity for the set
@@ -290,11 +292,7 @@ def add_to_booking_selection(request):
             #     # if quantity == 0: return redirect(...) # etc.
             #     return redirect(request.META.get("HTTP_REFERER", "home"))
 
-            selection["sets"][set_pk_str] = {
-                # "quantity": current_quantity + quantity,
-                "quantity": quantity,
-                "type": "set",
-            }
+            carts.set_line(request.user, quantity, item_set=item_set)
             messages.success(request, f"Added {quantity} x '{item_name}' set to your selection.")
 
         except Http404:
@@ -308,155 +306,62 @@ def add_to_booking_selection(request):
         messages.error(request, "No item or set specified.")
         return redirect(request.META.get("HTTP_REFERER", "home"))
 
-    request.session["booking_selection"] = selection
-    request.session.modified = True  # Ensure session is saved
-
     # Redirect to the selection page or back where they came from
     return redirect(reverse("view_booking_selection"))
 
 
 @login_required
 def view_booking_selection(request):
-    selection = get_booking_selection(request.session)
-    items_in_selection = []
-    sets_in_selection = []
-    total_price_per_day = decimal.Decimal("0.00")
-    total_deposit_estimate = decimal.Decimal("0.00")  # Placeholder for deposit calculation
-
-    # Get item details
-    item_ids = [int(pk) for pk in selection["items"].keys()]
-    if item_ids:
-        items = RentalItem.objects.filter(pk__in=item_ids).select_related("item_type")
-        item_map = {item.pk: item for item in items}
-        for pk_str, data in selection["items"].items():
-            pk = int(pk_str)
-            if pk in item_map:
-                item = item_map[pk]
-                quantity = data["quantity"]
-                price = item.item_type.rental_price_per_day * quantity
-                items_in_selection.append(
-                    {"item": item, "quantity": quantity, "price_per_day": price}
-                )
-                total_price_per_day += price
-                # Add item replacement cost to deposit estimate (example logic)
-                total_deposit_estimate += (
-                    item.item_type.rental_price_per_day * quantity * decimal.Decimal("0.3")
-                )  # e.g., 30% of replacement
-
-    # Get set details
-    set_ids = [int(pk) for pk in selection["sets"].keys()]
-    if set_ids:
-        item_sets = ItemSet.objects.filter(pk__in=set_ids)
-        set_map = {s.pk: s for s in item_sets}
-        for pk_str, data in selection["sets"].items():
-            pk = int(pk_str)
-            if pk in set_map:
-                item_set = set_map[pk]
-                quantity = data["quantity"]
-                price = item_set.base_price * quantity
-                sets_in_selection.append(
-                    {"set": item_set, "quantity": quantity, "price_per_day": price}
-                )
-                total_price_per_day += price
-                # Add set deposit to estimate
-                total_deposit_estimate += (
-                    item_set.base_price * quantity * decimal.Decimal("0.3")
-                )  # e.g., 30% of replacement
-
-    # Use the existing BookingForm for dates and payment method
     # The form action will point to 'finalize_booking'
-    if request.method == "POST":
-        # This view doesn't handle the final booking POST, finalize_booking does.
-        # But you might handle quantity updates here if not using separate views/AJAX.
-        form = BookingForm()
-        pass  # Or handle quantity updates if form submitted here
-    else:
-        form = BookingForm()  # For dates/payment method
-
-    context = {
-        "items_in_selection": items_in_selection,
-        "sets_in_selection": sets_in_selection,
-        "total_price_per_day": total_price_per_day,
-        "total_deposit_estimate": total_deposit_estimate,  # Pass estimate to template
-        "form": form,  # Date/Payment form
-    }
+    form = BookingForm()  # For dates/payment method
+    context = get_selection_context_for_render(request, form)
     return render(request, "core/clients/pages/booking_selection.html", context)
 
 
 @require_POST
 @login_required
 def remove_from_selection(request, item_type, pk):
-    selection = get_booking_selection(request.session)
-    pk_str = str(pk)
-    removed = False
-
-    if item_type == "item" and pk_str in selection["items"]:
-        del selection["items"][pk_str]
-        removed = True
-        messages.success(request, "Item removed from selection.")
-    elif item_type == "set" and pk_str in selection["sets"]:
-        del selection["sets"][pk_str]
-        removed = True
-        messages.success(request, "Set removed from selection.")
+    lookup = carts.line_lookup(item_type, pk)
+
+    if lookup and carts.remove_line(request.user, **lookup):
+        if item_type == "item":
+            messages.success(request, "Item removed from selection.")
+        else:
+            messages.success(request, "Set removed from selection.")
     else:
         messages.error(request, "Item or set not found in selection.")
 
-    if removed:
-        request.session["booking_selection"] = selection
-        request.session.modified = True
-
     return redirect(reverse("view_booking_selection"))
 
 
 @require_POST
 @login_required
 def update_selection_quantity(request, item_type, pk):
-    selection = get_booking_selection(request.session)
-    pk_str = str(pk)
     new_quantity = int(request.POST.get("quantity", 0))
 
     if new_quantity <= 0:
         # Treat as removal if quantity is zero or less
         return remove_from_selection(request, item_type, pk)
 
-    updated = False
-    if item_type == "item" and pk_str in selection["items"]:
-        # Add check against available stock if needed here (complex without dates)
-        selection["items"][pk_str]["quantity"] = new_quantity
-        updated = True
-        messages.success(request, "Item quantity updated.")
-    elif item_type == "set" and pk_str in selection["sets"]:
-        try:
-            item_set = ItemSet.objects.get(pk=pk)
-            # if new_quantity > item_set.available_quantity:
-            #     messages.error(
-            #         request,
-            #         f"Only {item_set.available_quantity} of '{item_set.name}' set(s) available.",
-            #     )
-            # else:
-            selection["sets"][pk_str]["quantity"] = new_quantity
-            updated = True
+    # Add check against available stock if needed here (complex without dates)
+    lookup = carts.line_lookup(item_type, pk)
+    if lookup and carts.update_quantity(request.user, new_quantity, **lookup):
+        if item_type == "item":
+            messages.success(request, "Item quantity updated.")
+        else:
             messages.success(request, "Set quantity updated.")
-        except ItemSet.DoesNotExist:
-            messages.error(request, "Set not found.")
-
     else:
         messages.error(request, "Item or set not found in selection.")
 
-    if updated:
-        request.session["booking_selection"] = selection
-        request.session.modified = True
-
     return redirect(reverse("view_booking_selection"))
 
 
 @require_POST  # Final booking should be a POST request
 @login_required
 def finalize_booking(request):
-    selection = get_booking_selection(request.session)
     form = BookingForm(request.POST, request.FILES)
 
-    if not selection["items"] and not selection["sets"]:
+    if not carts.count(request.user):
         messages.error(request, "Your booking selection is empty.")
         return redirect(reverse("view_booking_selection"))
 
@@ -467,203 +372,86 @@ def finalize_booking(request):
         payment_slip_file = form.cleaned_data.get("payment_slip")  # Use .get() as it might be None
         event_location_notes = form.cleaned_data.get("event_location_notes", "")
 
-        # --- Data Validation & Calculation ---
-        duration_days = max(1, (end_date - start_date).days + 1)
-        total_rental_cost = decimal.Decimal("0.00")
-        total_deposit = decimal.Decimal("0.00")
-        items_to_book_details = []  # Store details for RentalItemDetail creation
-        sets_to_book_details = []  # Store details for RentalSetDetail creation
         customer = get_object_or_404(Customer, user=request.user)
+        quote = None
 
         # --- Transaction for atomicity ---
         try:
-            with transaction.atomic():
+            with transaction.atomic(), ledger.batch():
                 # == Availability Check and Cost Calculation ==
 
-                # 1. Check Item Sets First (as they consume individual items)
-                set_ids = [int(pk) for pk in selection["sets"].keys()]
-                required_item_counts = defaultdict(int)  # Track total required count per item type
+                # Prices, deposit and item status read afresh and locked for this
+                # booking; raises if an item or set has been deleted (see core.quotes)
+                quote = quotes.locked_quote(carts.selection(request.user), start_date, end_date)
 
-                if set_ids:
-                    item_sets = ItemSet.objects.filter(pk__in=set_ids).prefetch_related(
-                        "itemsetcomponent_set__item_type"
-                    )
-                    set_map = {s.pk: s for s in item_sets}
-                    for pk_str, data in selection["sets"].items():
-                        pk = int(pk_str)
-                        if pk not in set_map:
-                            raise ValueError(
-                                f"Selected Item Set (ID: {pk}) not found."
-                            )  # Abort transaction
-
-                        item_set = set_map[pk]
-                        quantity_needed = data["quantity"]
-
-                        # Check overall set availability for the dates (complex - requires checking components)
-                        # Simplified check: Assume ItemSet.available_quantity was checked earlier.
-                        # A full check iterates components and checks RentalItem availability.
-                        # For now, rely on the earlier check in add/update.
-
-                        # Calculate cost and deposit for the set
-                        set_price_per_day = item_set.base_price
-                        total_rental_cost += set_price_per_day * quantity_needed
-                        total_deposit += item_set.base_price * quantity_needed
-
-                        sets_to_book_details.append(
-                            {
-                                "item_set": item_set,
-                                "quantity": quantity_needed,
-                                "rented_price_per_day": set_price_per_day,
-                            }
-                        )
-
-                        # Aggregate required item types for conflict checking later
-                        for component in item_set.itemsetcomponent_set.all():
-                            required_item_counts[component.item_type.pk] += (
-                                component.quantity * quantity_needed
-                            )
-
-                # 2. Check Individual Items
-                item_ids = [int(pk) for pk in selection["items"].keys()]
+                # 1. Check Individual Items
+                item_ids = [line.obj.pk for line in quote.item_lines]
                 if item_ids:
-                    items = RentalItem.objects.filter(pk__in=item_ids).select_related("item_type")
-                    item_map = {item.pk: item for item in items}
-                    for pk_str, data in selection["items"].items():
-                        pk = int(pk_str)
-                        if pk not in item_map:
-                            raise ValueError(f"Selected Item (ID: {pk}) not found.")  # Abort
-
-                        item = item_map[pk]
-                        quantity_needed = data["quantity"]  # Should always be 1 for specific items
-
-                        # if quantity_needed > 1:
-                        #     # This flow assumes adding specific items, so quantity should be 1
-                        #     # If you allow adding multiple of the *same* specific item, logic needs change
-                        #     raise ValueError(
-                        #         f"Invalid quantity ({quantity_needed}) for specific item {item.pk}."
-                        #     )
+                    # One indexed lookup for the whole cart instead of one query per item
+                    booked_ids = occupancy.booked_item_ids(item_ids, start_date, end_date)
+                    for line in quote.item_lines:
+                        item = line.obj
 
                         # Check availability for THIS specific item
                         if item.status != ItemStatus.AVAILABLE:
                             raise ValueError(f"Item '{item}' is no longer available.")
 
-                        overlapping = RentalItemDetail.objects.filter(
-                            item=item,
-                            rental__end_date__gte=start_date,
-                            rental__start_date__lte=end_date,
-                            rental__payment_status__in=[
-                                PaymentStatus.PAID,
-                                PaymentStatus.PENDING,
-                                PaymentStatus.PARTIAL,
-                            ],  # Check active/pending rentals
-                        ).exists()
-
-                        if overlapping:
+                        if item.pk in booked_ids:
                             raise ValueError(
                                 f"Item '{item}' is already booked for the selected dates."
                             )
 
-                        # Calculate cost and deposit for the item
-                        item_price_per_day = item.item_type.rental_price_per_day
-                        total_rental_cost += item_price_per_day * quantity_needed
-                        # Example deposit logic for individual items (e.g., 30% of replacement)
-                        total_deposit += (
-                            item.item_type.rental_price_per_day
-                            * quantity_needed
-                            * decimal.Decimal("0.30")
-                        )
-
-                        items_to_book_details.append(
-                            {
-                                "item": item,
-                                "quantity": quantity_needed,
-                                "rented_price_per_day": item_price_per_day,
-                            }
-                        )
-
-                        # Add to required item counts if needed for complex availability checks
-                        # required_item_counts[item.item_type.pk] += 1
+                # 2. Allocate concrete items for all set components in one pass.
+                # Individually selected items are excluded so they are not allocated twice.
+                set_allocation = allocation.allocate(
+                    [(line.obj, line.quantity) for line in quote.set_lines],
+                    start_date,
+                    end_date,
+                    exclude_item_ids=item_ids,
+                )
 
                 # --- Create Database Records ---
 
                 # a. Create RentalTransaction
-                # Note: total_rental_cost here is per day. Multiply by duration for full cost.
-                # The deposit calculation might need refinement (e.g., min deposit)
-                final_total_deposit = max(
-                    total_deposit, decimal.Decimal("20.00")
-                )  # Example minimum deposit
-
                 rental_transaction = RentalTransaction.objects.create(
                     customer=customer,
                     start_date=start_date,
                     end_date=end_date,
-                    total_deposit=final_total_deposit,
+                    total_deposit=quote.deposit,
                     event_location_notes=event_location_notes,
                     payment_status=PaymentStatus.PENDING,
                 )
 
                 # b. Create RentalSetDetail records (if any sets were selected)
                 created_set_details = {}  # To link items to their set rental
-                for set_detail_data in sets_to_book_details:
+                for line in quote.set_lines:
                     set_detail = RentalSetDetail.objects.create(
                         rental=rental_transaction,
-                        item_set=set_detail_data["item_set"],
-                        quantity=set_detail_data["quantity"],
-                        rented_price_per_day=set_detail_data["rented_price_per_day"],
+                        item_set=line.obj,
+                        quantity=line.quantity,
+                        rented_price_per_day=line.unit_price_per_day,
                     )
-                    created_set_details[set_detail_data["item_set"].pk] = set_detail
-
-                    # --- Allocate specific items for the set components ---
-                    # This is the complex part: finding available items of the required types.
-                    item_set = set_detail_data["item_set"]
-                    set_quantity = set_detail_data["quantity"]
-                    for component in item_set.itemsetcomponent_set.all():
-                        items_needed_for_component = component.quantity * set_quantity
-                        # Find available items of this type NOT already booked for these dates
-                        available_items = RentalItem.objects.filter(
-                            item_type=component.item_type, status=ItemStatus.AVAILABLE
-                        ).exclude(  # Exclude items booked in the date range
-                            rentalitemdetail__rental__end_date__gte=start_date,
-                            rentalitemdetail__rental__start_date__lte=end_date,
-                            rentalitemdetail__rental__payment_status__in=[
-                                PaymentStatus.PAID,
-                                PaymentStatus.PENDING,
-                                PaymentStatus.PARTIAL,
-                            ],
-                        )[
-                            :items_needed_for_component
-                        ]  # Limit to the number needed
-
-                        # if len(available_items) < items_needed_for_component:
-                        #     raise ValueError(
-                        #         f"Not enough available '{component.item_type}' items for the '{item_set.name}' set for the selected dates."
-                        #     )
-
-                        # Create RentalItemDetail for each allocated item and link to set detail
-                        for allocated_item in available_items:
-                            RentalItemDetail.objects.create(
-                                rental=rental_transaction,
-                                item=allocated_item,
-                                quantity=quantity_needed,  # Each detail is for one specific item instance
-                                rented_price_per_day=component.item_type.rental_price_per_day,  # Or use a set-component specific price?
-                                set_rental=set_detail,  # Link back to the set detail
-                            )
+                    created_set_details[line.obj.pk] = set_detail
+
+                # Link the allocated items to their set rental with a single bulk insert
+                allocation.create_component_details(
+                    rental_transaction, created_set_details, set_allocation
+                )
 
                 # c. Create RentalItemDetail records for individually selected items
-                for item_detail_data in items_to_book_details:
-                    item = item_detail_data["item"]
+                for line in quote.item_lines:
                     RentalItemDetail.objects.create(
                         rental=rental_transaction,
-                        item=item,
-                        quantity=item_detail_data["quantity"],
-                        rented_price_per_day=item_detail_data["rented_price_per_day"],
+                        item=line.obj,
+                        quantity=line.quantity,
+                        rented_price_per_day=line.unit_price_per_day,
                         set_rental=None,  # Not part of a set rental
                     )
 
                 # d. Create Initial Payment Record (for the deposit)
                 Payment.objects.create(
                     rental=rental_transaction,
-                    amount=final_total_deposit,
+                    amount=quote.deposit,
                     payment_method=payment_method,
                     payment_type=PaymentType.DEPOSIT,
                     payment_slip=payment_slip_file,
@@ -671,7 +459,7 @@ def finalize_booking(request):
                 )
 
                 # --- Success ---
-                clear_booking_selection(request.session)  # Clear the cart/selection
+                carts.clear(request.user)  # Clear the cart/selection
                 messages.success(
                     request,
                     "Booking created successfully! Please complete payment if required.",
@@ -684,13 +472,13 @@ def finalize_booking(request):
             # Handle specific validation errors (like availability)
             messages.error(request, f"Booking failed: {ve}")
             # Re-render selection page with form errors
-            context = get_selection_context_for_render(request, form)  # Helper to get context
+            context = get_selection_context_for_render(request, form, quote)
             return render(request, "core/clients/pages/booking_selection.html", context)
 
         except Exception as e:
             # Handle unexpected errors during transaction
             messages.error(request, f"An unexpected error occurred while creating the booking: {e}")
-            context = get_selection_context_for_render(request, form)  # Helper to get context
+            context = get_selection_context_for_render(request, form, quote)
             return render(request, "core/clients/pages/booking_selection.html", context)
 
     else:
@@ -700,54 +488,26 @@ def finalize_booking(request):
         return render(request, "core/clients/pages/booking_selection.html", context)
 
 
-def get_selection_context_for_render(request, form):
-    """Helper to rebuild context for rendering the selection page after errors."""
-    selection = get_booking_selection(request.session)
-    items_in_selection = []
-    sets_in_selection = []
-    total_price_per_day = decimal.Decimal("0.00")
-    total_deposit_estimate = decimal.Decimal("0.00")
-
-    item_ids = [int(pk) for pk in selection["items"].keys()]
-    if item_ids:
-        items = RentalItem.objects.filter(pk__in=item_ids).select_related("item_type")
-        item_map = {item.pk: item for item in items}
-        for pk_str, data in selection["items"].items():
-            pk = int(pk_str)
-            if pk in item_map:
-                item = item_map[pk]
-                quantity = data["quantity"]
-                price = item.item_type.rental_price_per_day * quantity
-                items_in_selection.append(
-                    {"item": item, "quantity": quantity, "price_per_day": price}
-                )
-                total_price_per_day += price
-                total_deposit_estimate += (
-                    item.item_type.rental_price_per_day * quantity * decimal.Decimal("0.3")
-                )
-
-    set_ids = [int(pk) for pk in selection["sets"].keys()]
-    if set_ids:
-        item_sets = ItemSet.objects.filter(pk__in=set_ids)
-        set_map = {s.pk: s for s in item_sets}
-        for pk_str, data in selection["sets"].items():
-            pk = int(pk_str)
-            if pk in set_map:
-                item_set = set_map[pk]
-                quantity = data["quantity"]
-                price = item_set.base_price * quantity
-                sets_in_selection.append(
-                    {"set": item_set, "quantity": quantity, "price_per_day": price}
-                )
-                total_price_per_day += price
-                total_deposit_estimate += item_set.base_price * quantity * decimal.Decimal("0.3")
+def get_selection_context_for_render(request, form, quote=None):
+    """
+    Helper to build the selection page's context (also after errors).
+    quote is the selection's core.quotes Quote when the caller already has it.
+    """
+    if quote is None:
+        quote = quotes.quote(carts.selection(request.user))
 
     return {
-        "items_in_selection": items_in_selection,
-        "sets_in_selection": sets_in_selection,
-        "total_price_per_day": total_price_per_day,
-        "total_deposit_estimate": total_deposit_estimate,
-        "form": form,
+        "items_in_selection": [
+            {"item": line.obj, "quantity": line.quantity, "price_per_day": line.price_per_day}
+            for line in quote.item_lines
+        ],
+        "sets_in_selection": [
+            {"set": line.obj, "quantity": line.quantity, "price_per_day": line.price_per_day}
+            for line in quote.set_lines
+        ],
+        "total_price_per_day": quote.total_price_per_day,
+        "total_deposit_estimate": quote.deposit,  # Deposit charged when the booking is made
+        "form": form,  # Date/Payment form
     }
 
 
@@ -755,7 +515,7 @@ def get_selection_context_for_render(request, form):
 def booking_success_view(request, transaction_pk):
     # Retrieve the transaction and related details
     rental_transaction = get_object_or_404(
-        RentalTransaction.objects.prefetch_related(
+        RentalTransaction.objects.with_financials().prefetch_related(
             "rentalitemdetail_set__item__item_type",  # Get item details
             "rentalsetdetail_set__item_set",  # Get set details
         ),
@@ -783,87 +543,57 @@ def booking_success_view(request, transaction_pk):
 @login_required
 def dashboard(request):
     """Displays the main admin dashboard with summary statistics."""
-    today = timezone.now().date()
-    current_month_start = today.replace(day=1)
-
-    # Summary Counts
-    pending_approvals_count = RentalTransaction.objects.filter(
-        payment_status=PaymentStatus.PENDING
-    ).count()
-    active_rentals_count = RentalTransaction.objects.filter(
-        payment_status=PaymentStatus.PAID, start_date__lte=today, end_date__gte=today
-    ).count()
-    total_customers_count = Customer.objects.count()
-    total_items_count = RentalItem.objects.count()
-    available_items_count = RentalItem.objects.filter(status=ItemStatus.AVAILABLE).count()
-    total_sets_count = ItemSet.objects.count()
-
-    available_sets_count = 0
-    # This loop can be inefficient for many sets. Consider optimizing if performance is an issue.
-    for item_set_obj in ItemSet.objects.all():
-        if item_set_obj.available_quantity > 0:
-            available_sets_count += 1
-
-    # New Data for Dashboard:
-    # 1. Upcoming Returns (e.g., in the next 7 days)
-    upcoming_return_date_limit = today + timedelta(days=7)
-    upcoming_returns = (
-        RentalTransaction.objects.filter(
-            end_date__gte=today,
-            end_date__lte=upcoming_return_date_limit,
-            payment_status__in=[PaymentStatus.PAID, PaymentStatus.PARTIAL],  # Active rentals
-        )
-        .select_related("customer__user")
-        .order_by("end_date")[:5]
-    )  # Limit to 5 for display
+    # Tiles are cached and invalidated individually (see core.dashboard_stats)
+    context = dashboard_stats.get_stats()
+    return render(request, "core/dashboard/pages/dashboard.html", context)
 
-    # 2. Overdue Rentals
-    overdue_rentals = (
-        RentalTransaction.objects.filter(
-            end_date__lt=today,
-            payment_status__in=[
-                PaymentStatus.PAID,
-                PaymentStatus.PARTIAL,
-            ],  # Was active, now overdue
+
+@login_required
+def dashboard_cache_stats(request):
+    """JSON hit/miss counts of the dashboard tile cache."""
+    return JsonResponse({"tiles": dashboard_stats.cache_stats()})
+
+
+@login_required
+def planning_free_items(request):
+    """
+    JSON free items of one item type over a date window, for planning.
+    Query params: item_type (id), start and end (YYYY-MM-DD; end defaults to start).
+    """
+    try:
+        item_type_id = int(request.GET.get("item_type", ""))
+    except ValueError:
+        return JsonResponse({"error": "'item_type' must be an item type id."}, status=400)
+
+    try:
+        start_date = timezone.datetime.strptime(request.GET.get("start", ""), "%Y-%m-%d").date()
+        end_param = request.GET.get("end")
+        end_date = (
+            timezone.datetime.strptime(end_param, "%Y-%m-%d").date() if end_param else start_date
         )
-        .select_related("customer__user")
-        .order_by("end_date")[:5]
-    )  # Limit to 5
-
-    # 3. Recent Bookings
-    recent_bookings = RentalTransaction.objects.select_related("customer__user").order_by(
-        "-created_at"
-    )[:5]
-
-    # A more accurate way to get revenue would be from actual payments made for completed/ongoing rentals.
-    # For simplicity, let's sum `amount_paid` for transactions created this month.
-    # This is still an approximation as `amount_paid` could include deposits.
-    revenue_this_month_approx = Payment.objects.filter(
-        rental__created_at__gte=current_month_start,
-        # rental__payment_status__in=[PaymentStatus.PAID, PaymentStatus.PARTIAL] # Consider status
-    ).aggregate(total=Sum("amount"))["total"] or decimal.Decimal("0.00")
-
-    total_deposits_held = RentalTransaction.objects.filter(
-        payment_status__in=[PaymentStatus.PAID, PaymentStatus.PARTIAL],
-        end_date__gte=today,  # Active rentals
-    ).aggregate(total_deposits=Sum("total_deposit"))["total_deposits"] or decimal.Decimal("0.00")
+    except ValueError:
+        return JsonResponse({"error": "Invalid 'start' or 'end' date. Use YYYY-MM-DD."}, status=400)
+    if end_date < start_date:
+        return JsonResponse({"error": "'end' must not be before 'start'."}, status=400)
 
-    context = {
-        "pending_approvals_count": pending_approvals_count,
-        "active_rentals_count": active_rentals_count,
-        "total_customers_count": total_customers_count,
-        "total_items_count": total_items_count,
-        "available_items_count": available_items_count,
-        "total_sets_count": total_sets_count,
-        "available_sets_count": available_sets_count,
-        # New context variables
-        "upcoming_returns": upcoming_returns,
-        "overdue_rentals": overdue_rentals,
-        "recent_bookings": recent_bookings,
-        "revenue_this_month_approx": revenue_this_month_approx,
-        "total_deposits_held": total_deposits_held,
-    }
-    return render(request, "core/dashboard/pages/dashboard.html", context)
+    # One snapshot of the in-process bitmaps, brought up to date first (see core.bitmaps)
+    snapshot = bitmaps.current()
+    try:
+        free_ids = snapshot.free_items_of_type(item_type_id, start_date, end_date)
+        free_per_day = snapshot.free_per_day(item_type_id, start_date, end_date)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    return JsonResponse(
+        {
+            "item_type": item_type_id,
+            "start": start_date.isoformat(),
+            "end": end_date.isoformat(),
+            "free_count": len(free_ids),
+            "free_item_ids": sorted(free_ids),
+            "free_per_day": free_per_day,
+        }
+    )
 
 
 def manage_profile(request):
@@ -871,12 +601,7 @@ def manage_profile(request):
 
 
 def manage_users(request):
-    query = request.GET.get("search", "")
-    users = Account.objects.all().order_by("-date_joined")
-
-    if query:
-        # Search across multiple fields
-        users = users.filter(Q(email__icontains=query))
+    users, _ = filters.filter_users(Account.objects.all().order_by("-date_joined"), request.GET)
 
     msg = "Are you sure you want to delete this user?"
     context = {
@@ -899,16 +624,9 @@ def delete_user(request, pk):
 
 def manage_employees(request):
     # employee = Employee.objects.get(user=request.user)
-    query = request.GET.get("search", "")
-    employees = Employee.objects.all().order_by("-updated_at")
-
-    if query:
-        # Search across multiple fields
-        employees = employees.filter(
-            Q(first_name__icontains=query)
-            | Q(last_name__icontains=query)
-            | Q(phone_number__icontains=query)
-        )
+    employees, _ = filters.filter_employees(
+        Employee.objects.all().order_by("-updated_at"), request.GET
+    )
 
     if request.method == "POST":
         form = EmployeeForm(request.POST)
@@ -975,16 +693,9 @@ def delete_employee(request, pk):
 
 
 def manage_customers(request):
-    query = request.GET.get("search", "")
-    customers = Customer.objects.all().order_by("-updated_at")
-
-    if query:
-        # Search across multiple fields
-        customers = customers.filter(
-            Q(first_name__icontains=query)
-            | Q(last_name__icontains=query)
-            | Q(phone__icontains=query)
-        )
+    customers, _ = filters.filter_customers(
+        Customer.objects.all().order_by("-updated_at"), request.GET
+    )
 
     if request.method == "POST":
         form = CustomerForm(request.POST)
@@ -1045,15 +756,22 @@ def delete_customer(request, pk):
     return render(request, "core/dashboard/pages/manage-customers.html")
 
 
+@login_required
+def customer_autocomplete(request):
+    """JSON customer suggestions. Query params: q (name or email prefix) and limit (1-20)."""
+    try:
+        limit = int(request.GET.get("limit", autocomplete.DEFAULT_LIMIT))
+    except ValueError:
+        return JsonResponse({"error": "'limit' must be a number."}, status=400)
+    return JsonResponse({"results": list(autocomplete.suggest(request.GET.get("q", ""), limit))})
+
+
 def manage_rental_item_types(request):
-    query = request.GET.get("search", "")
-    rental_item_types = RentalItemType.objects.all().order_by("-updated_at")
+    rental_item_types, _ = filters.filter_rental_item_types(
+        RentalItemType.objects.all().order_by("-updated_at"), request.GET
+    )
     rental_item_type_choices = ItemType.choices
 
-    if query:
-        # Search across multiple fields
-        rental_item_types = RentalItemType.filter(Q(type_name__icontain=query))
-
     if request.method == "POST":
         form = RentalItemTypeForm(request.POST)
 
@@ -1104,8 +822,9 @@ def delete_rental_item_type(request, pk):
 
 
 def manage_rental_items(request):
-    query = request.GET.get("search", "")
-    rental_items = RentalItem.objects.all().order_by("-updated_at")
+    rental_items, _ = filters.filter_rental_items(
+        RentalItem.objects.all().order_by("-updated_at"), request.GET
+    )
     rental_item_types = RentalItemType.objects.all().order_by("-updated_at")
     rental_item_status_choices = ItemStatus.choices
 
@@ -1113,10 +832,6 @@ def manage_rental_items(request):
     date_str = timezone.now().strftime("%Y%m%d")
     sequence = str(uuid.uuid4().int)[-3:]
 
-    if query:
-        # Search across multiple fields
-        rental_items = rental_items.filter(Q(serial_number__icontains=query))
-
     if request.method == "POST":
         form = RentalItemForm(request.POST, request.FILES)
 
@@ -1168,16 +883,49 @@ def delete_rental_item(request, pk):
     return render(request, "core/dashboard/pages/manage-rental-items.html")
 
 
+@login_required
+def scan_rental_items(request):
+    """
+    Serial-number lookup for barcode scanners.
+    GET ?serial=<code>: the exact item, or the items whose serial starts with the code.
+    POST serials=<codes>: resolves a whole batch (one code per line) in one query.
+    """
+    if request.method == "POST":
+        serials = scanning.split_serials(request.POST.getlist("serials"))
+        if not serials:
+            return JsonResponse({"error": "No serial numbers were scanned."}, status=400)
+        if len(serials) > scanning.MAX_BATCH_SIZE:
+            return JsonResponse(
+                {"error": f"Scan at most {scanning.MAX_BATCH_SIZE} serial numbers at once."},
+                status=400,
+            )
+        resolved, missing = scanning.resolve(serials)
+        return JsonResponse(
+            {
+                "items": [scanning.item_payload(item) for item in resolved.values()],
+                "missing": missing,
+            }
+        )
+
+    serial = scanning.normalize(request.GET.get("serial", ""))
+    if not serial:
+        return JsonResponse({"error": "'serial' is required."}, status=400)
+    item, matches = scanning.lookup(serial)
+    return JsonResponse(
+        {
+            "item": scanning.item_payload(item) if item is not None else None,
+            "matches": [scanning.item_payload(match) for match in matches],
+        }
+    )
+
+
 def manage_accessories(request):
-    query = request.GET.get("search", "")
-    accessories = Accessory.objects.all().order_by("-updated_at")
+    accessories, _ = filters.filter_accessories(
+        Accessory.objects.all().order_by("-updated_at"), request.GET
+    )
     rental_item_types = RentalItemType.objects.all().order_by("-updated_at")
     rental_item_status_choices = ItemStatus.choices
 
-    if query:
-        # Search across multiple fields
-        accessories = accessories.filter(Q(accessory_name__icontains=query))
-
     if request.method == "POST":
         form = AccessoryForm(request.POST)
 
@@ -1231,11 +979,8 @@ def manage_item_sets(request):
     """
     Displays a list of all Item Sets and handles search.
     """
-    query = request.GET.get("search", "")
-    item_sets = ItemSet.objects.all().order_by("name")
-
-    if query:
-        item_sets = item_sets.filter(Q(name__icontains=query) | Q(description__icontains=query))
+    query = request.GET.get(filters.SEARCH_PARAM, "")
+    item_sets, _ = filters.filter_item_sets(ItemSet.objects.all().order_by("name"), request.GET)
 
     if request.method == "POST":
         form = ItemSetForm(request.POST, request.FILES)
@@ -1426,7 +1171,8 @@ def manage_rental_transactions(request):
     """Lists all rental transactions with filtering."""
 
     transactions_list = (
-        RentalTransaction.objects.select_related("customer__user")
+        RentalTransaction.objects.with_financials()
+        .select_related("customer__user")
         .prefetch_related(
             "rentalitemdetail_set__item__item_type",
             "rentalsetdetail_set__item_set",
@@ -1435,49 +1181,20 @@ def manage_rental_transactions(request):
         .order_by("-start_date", "-created_at")
     )  # Default order
 
-    # --- Filtering Logic ---
+    # --- Filtering Logic (shared with export_rental_transactions_excel) ---
     status_filter = request.GET.get("status")
     customer_filter = request.GET.get("customer")  # Search by customer name/email
     date_from_filter = request.GET.get("date_from")
     date_to_filter = request.GET.get("date_to")
-
-    if status_filter:
-        transactions_list = transactions_list.filter(payment_status=status_filter)
-
-    if customer_filter:
-        transactions_list = transactions_list.filter(
-            Q(customer__first_name__icontains=customer_filter)
-            | Q(customer__last_name__icontains=customer_filter)
-            | Q(customer__user__email__icontains=customer_filter)
-        )
-
-    if date_from_filter:
-        try:
-            # Assuming YYYY-MM-DD format from a date input
-            start_date = timezone.datetime.strptime(date_from_filter, "%Y-%m-%d").date()
-            transactions_list = transactions_list.filter(start_date__gte=start_date)
-        except ValueError:
-            messages.warning(request, "Invalid 'Date From' format. Please use YYYY-MM-DD.")
-
-    if date_to_filter:
-        try:
-            end_date = timezone.datetime.strptime(date_to_filter, "%Y-%m-%d").date()
-            # Filter for rentals ENDING on or before the specified date
-            transactions_list = transactions_list.filter(end_date__lte=end_date)
-        except ValueError:
-            messages.warning(request, "Invalid 'Date To' format. Please use YYYY-MM-DD.")
+    transactions_list, errors = filters.filter_rental_transactions(transactions_list, request.GET)
+    for error in errors:
+        messages.warning(request, error)
 
     # --- Pagination ---
-    paginator = Paginator(transactions_list, 25)  # Show 25 transactions per page
-    page_number = request.GET.get("page")
-    try:
-        transactions = paginator.page(page_number)
-    except PageNotAnInteger:
-        # If page is not an integer, deliver first page.
-        transactions = paginator.page(1)
-    except EmptyPage:
-        # If page is out of range (e.g. 9999), deliver last page of results.
-        transactions = paginator.page(paginator.num_pages)
+    # Page numbers for small tables, cursors once the table grows (see core.pagination)
+    transactions = pagination.paginate(
+        request, transactions_list, ["-start_date", "-created_at", "-pk"], 25
+    )
 
     context = {
         "transactions": transactions,
@@ -1496,6 +1213,7 @@ def manage_rental_transactions(request):
 def manage_returns(request):
     """Lists active rentals that are due or overdue for return and settlement."""
     today = timezone.now().date()
+    # balance_due is a stored ledger column here, so no financial annotations are needed
     returnable_transactions = (
         RentalTransaction.objects.filter(
             Q(payment_status=PaymentStatus.PAID) | Q(payment_status=PaymentStatus.PARTIAL),
@@ -1509,26 +1227,30 @@ def manage_returns(request):
 
     query = request.GET.get("search", "")
     if query:
-        returnable_transactions = returnable_transactions.filter(
-            Q(id__icontains=query)
-            | Q(customer__first_name__icontains=query)
-            | Q(customer__last_name__icontains=query)
-            | Q(customer__user__email__icontains=query)
-        )
+        # Customer name/email through the search index, or a transaction number
+        condition = search.matches("rental_transactions", query)
+        if query.strip().lstrip("#").isdigit():
+            condition |= Q(pk=int(query.strip().lstrip("#")))
+        returnable_transactions = returnable_transactions.filter(condition)
+
+    # Outstanding-balance filter and sort use the indexed balance_due column
+    outstanding_only = request.GET.get("outstanding") == "1"
+    sort = request.GET.get("sort", "")
+    if outstanding_only:
+        returnable_transactions = returnable_transactions.filter(balance_due__gt=0)
+    if sort == "balance":
+        ordering = ["-balance_due", "end_date", "pk"]
+    else:
+        ordering = ["end_date", "created_at", "pk"]
 
-    paginator = Paginator(returnable_transactions, 20)
-    page_number = request.GET.get("page")
-    try:
-        transactions_page = paginator.page(page_number)
-    except PageNotAnInteger:
-        transactions_page = paginator.page(1)
-    except EmptyPage:
-        transactions_page = paginator.page(paginator.num_pages)
+    transactions_page = pagination.paginate(request, returnable_transactions, ordering, 20)
 
     context = {
         "transactions": transactions_page,
         "title": "Process Returns & Settlements",
         "search_query": query,
+        "outstanding_only": outstanding_only,
+        "current_sort": sort,
         "PaymentStatus": PaymentStatus,  # Pass Enum for template comparisons
     }
     return render(request, "core/dashboard/pages/manage_returns.html", context)
@@ -1537,7 +1259,9 @@ def manage_returns(request):
 @login_required
 def process_return(request, transaction_pk):
     transaction_obj = get_object_or_404(
-        RentalTransaction.objects.select_related("customer__user").prefetch_related(
+        RentalTransaction.objects.with_financials()
+        .select_related("customer__user")
+        .prefetch_related(
             "rentalitemdetail_set__item__item_type",
             "rentalsetdetail_set__item_set__itemsetcomponent_set__item_type",
             "payment_set",
@@ -1579,7 +1303,7 @@ def process_return(request, transaction_pk):
             notes_on_return = form.cleaned_data.get("notes_on_return")
 
             try:
-                with transaction.atomic():
+                with transaction.atomic(), ledger.batch():
                     if additional_fine and additional_fine > 0:
                         transaction_obj.total_fines += additional_fine
 
@@ -1637,15 +1361,27 @@ def process_return(request, transaction_pk):
     return render(request, "core/dashboard/pages/process_return.html", context)
 
 
+def _booking_history_querysets(request):
+    rentals = RentalTransaction.objects.filter(customer__user=request.user)
+    return [
+        rentals,
+        RentalItemDetail.objects.filter(rental__in=rentals),
+        RentalSetDetail.objects.filter(rental__in=rentals),
+    ]
+
+
 @login_required
+@conditional.conditional_page(_booking_history_querysets)
 def booking_history_view(request):
     """Displays the rental transaction history for the logged-in customer."""
     # Ensure the user has a customer profile
     customer = get_object_or_404(Customer, user=request.user)
 
     # Fetch all rental transactions for this customer, ordered by start date descending
-    transactions = RentalTransaction.objects.filter(customer=customer).order_by(
-        "-start_date", "-created_at"
+    transactions = (
+        RentalTransaction.objects.with_financials()
+        .filter(customer=customer)
+        .order_by("-start_date", "-created_at")
     )
 
     context = {
@@ -1658,53 +1394,26 @@ def booking_history_view(request):
 def revenue_report_view(request):
     """Displays a report of revenue, filterable by month and year."""
     current_year = timezone.now().year
-    selected_year = request.GET.get("year", str(current_year))
     selected_month = request.GET.get("month", "")
 
     payments_query = Payment.objects.select_related("rental__customer__user").order_by(
         "-transaction_date"
     )
 
-    # Apply year filter
-    try:
-        year_int = int(selected_year)
-        payments_query = payments_query.filter(transaction_date__year=year_int)
-    except ValueError:
-        messages.error(request, "Invalid year selected.")
-        year_int = current_year  # Fallback to current year
-        payments_query = payments_query.filter(transaction_date__year=year_int)
+    # Year/month filters shared with the revenue export
+    payments_query, errors = filters.filter_payments(payments_query, request.GET)
+    for error in errors:
+        messages.error(request, error)
+    year_int, month_filter, _ = filters.revenue_period(request.GET)
 
-    # Apply month filter
-    if selected_month:
-        try:
-            month_int = int(selected_month)
-            if 1 <= month_int <= 12:
-                payments_query = payments_query.filter(transaction_date__month=month_int)
-            else:
-                messages.error(request, "Invalid month selected.")
-        except ValueError:
-            messages.error(request, "Invalid month format.")
-
-    total_revenue = payments_query.aggregate(total=Sum("amount"))["total"] or decimal.Decimal(
-        "0.00"
-    )
+    # Totals come from the daily rollup rather than summing every payment
+    total_revenue = revenue.total(year=year_int, month=month_filter)
 
     # Pagination
-    paginator = Paginator(payments_query, 25)  # Show 25 payments per page
-    page_number = request.GET.get("page")
-    try:
-        payments_page = paginator.page(page_number)
-    except PageNotAnInteger:
-        payments_page = paginator.page(1)
-    except EmptyPage:
-        payments_page = paginator.page(paginator.num_pages)
+    payments_page = pagination.paginate(request, payments_query, ["-transaction_date", "-pk"], 25)
 
     # Generate year choices for the filter
-    first_payment_year = (
-        Payment.objects.earliest("transaction_date").transaction_date.year
-        if Payment.objects.exists()
-        else current_year
-    )
+    first_payment_year = revenue.first_year(default=current_year)
     year_choices = range(first_payment_year, current_year + 1)
 
     context = {
@@ -1728,560 +1437,113 @@ def manage_products(request):
 
 # -------- Export Sections
 #
+# Each export accepts ?format=xlsx (default), csv or ndjson; see core.exports.
+# The catalogue exports are served from cached artifacts with ETags; see core.export_jobs.
 @login_required
 def export_users_excel(request):
-    """Exports user data to an Excel file, respecting current filters."""
-    query = request.GET.get("search", "")
-    users = Account.objects.all().order_by("-date_joined")
-
-    if query:
-        users = users.filter(Q(email__icontains=query))
-
-    # Create a new Excel workbook and sheet
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Users"
-
-    # Define headers
-    headers = ["Email", "Date Joined", "Last Login", "Is Active", "Is Staff", "Is Admin"]
-    sheet.append(headers)
-
-    # Write data rows
-    for user in users:
-        sheet.append(
-            [
-                user.email,
-                user.date_joined.strftime("%d/%m/%Y %H:%M") if user.date_joined else "",
-                user.last_login.strftime("%d/%m/%Y %H:%M") if user.last_login else "N/A",
-                "Yes" if user.is_active else "No",
-                "Yes" if user.is_staff else "No",
-                "Yes" if user.is_superuser else "No",
-            ]
-        )
-
-    # Optional: Adjust column widths
-    for col in range(1, len(headers) + 1):
-        sheet.column_dimensions[get_column_letter(col)].auto_width = True
-
-    # Prepare the HTTP response
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    response["Content-Disposition"] = "attachment; filename=users_export.xlsx"
-
-    # Save the workbook to the response
-    workbook.save(response)
-
-    return response
+    """Exports user data, respecting the filters of its list view."""
+    return exports.export_response(request, exports.UserExport)
 
 
 @login_required
 def export_employees_excel(request):
-    """Exports employee data to an Excel file, respecting current filters."""
-    query = request.GET.get("search", "")
-    employees = Employee.objects.all().order_by("-updated_at")
-
-    if query:
-        employees = employees.filter(
-            Q(first_name__icontains=query)
-            | Q(last_name__icontains=query)
-            | Q(phone_number__icontains=query)
-        )
-
-    # Create a new Excel workbook and sheet
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Employees"
-
-    # Define headers
-    headers = [
-        "First Name",
-        "Last Name",
-        "Phone Number",
-        "Address",
-        "Employment Date",
-        "User Email",
-        "User Status",
-    ]
-    sheet.append(headers)
-
-    # Write data rows
-    for emp in employees:
-        sheet.append(
-            [
-                emp.first_name,
-                emp.last_name,
-                emp.phone_number,
-                emp.address,
-                emp.employment_date.strftime("%d/%m/%Y") if emp.employment_date else "",
-                emp.user.email if emp.user else "N/A",
-                "Active" if emp.user and emp.user.is_active else "Inactive",
-            ]
-        )
-
-    # Optional: Adjust column widths
-    for col in range(1, len(headers) + 1):
-        sheet.column_dimensions[get_column_letter(col)].auto_width = True
-
-    # Prepare the HTTP response
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    response["Content-Disposition"] = "attachment; filename=employees_export.xlsx"
-
-    # Save the workbook to the response
-    workbook.save(response)
-
-    return response
+    """Exports employee data, respecting the filters of its list view."""
+    return exports.export_response(request, exports.EmployeeExport)
 
 
 @login_required
 def export_customers_excel(request):
-    """Exports customer data to an Excel file, respecting current filters."""
-    query = request.GET.get("search", "")
-    customers = Customer.objects.all().order_by("-updated_at")
-
-    if query:
-        customers = customers.filter(
-            Q(first_name__icontains=query)
-            | Q(last_name__icontains=query)
-            | Q(phone_number__icontains=query)
-        )
-
-    # Create a new Excel workbook and sheet
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Customers"
-
-    # Define headers
-    headers = [
-        "First Name",
-        "Last Name",
-        "Phone Number",
-        "Address",
-        "User Email",
-        "User Status",
-    ]
-    sheet.append(headers)
-
-    # Write data rows
-    for customer in customers:
-        sheet.append(
-            [
-                customer.first_name,
-                customer.last_name,
-                customer.phone_number,
-                customer.address,
-                customer.user.email if customer.user else "N/A",
-                "Active" if customer.user and customer.user.is_active else "Inactive",
-            ]
-        )
-
-    # Optional: Adjust column widths
-    for col in range(1, len(headers) + 1):
-        sheet.column_dimensions[get_column_letter(col)].auto_width = True
-
-    # Prepare the HTTP response
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    response["Content-Disposition"] = "attachment; filename=customers_export.xlsx"
-
-    # Save the workbook to the response
-    workbook.save(response)
-
-    return response
+    """Exports customer data, respecting the filters of its list view."""
+    return exports.export_response(request, exports.CustomerExport)
 
 
 @login_required
 def export_rental_item_types_excel(request):
-    """Exports rental item type data to an Excel file, respecting current filters."""
-    query = request.GET.get("search", "")
-    rental_item_types = RentalItemType.objects.all().order_by("-updated_at")
-
-    if query:
-        rental_item_types = rental_item_types.filter(Q(type_name__icontain=query))
-
-    # Create a new Excel workbook and sheet
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Rental Item Types"
-
-    # Define headers
-    headers = [
-        "Type Name",
-        "Size",
-        "Capacity",
-        "Rental Price Per Day",
-        "Replacement Cost",
-        "Description",
-    ]
-    sheet.append(headers)
-
-    # Write data rows
-    for item_type in rental_item_types:
-        sheet.append(
-            [
-                item_type.type_name,
-                item_type.size or "N/A",
-                item_type.capacity or "N/A",
-                item_type.rental_price_per_day,
-                item_type.replacement_cost,
-                item_type.description or "N/A",
-            ]
-        )
-
-    # Optional: Adjust column widths
-    for col in range(1, len(headers) + 1):
-        sheet.column_dimensions[get_column_letter(col)].auto_width = True
-
-    # Prepare the HTTP response
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    response["Content-Disposition"] = "attachment; filename=rental_item_types_export.xlsx"
-
-    # Save the workbook to the response
-    workbook.save(response)
-
-    return response
+    """Exports rental item type data, respecting the filters of its list view."""
+    return export_jobs.cached_export_response(request, exports.RentalItemTypeExport)
 
 
 @login_required
 def export_rental_items_excel(request):
-    """Exports rental item data to an Excel file, respecting current filters."""
-    query = request.GET.get("search", "")
-    rental_items = RentalItem.objects.all().order_by("-updated_at")
-
-    if query:
-        rental_items = rental_items.filter(Q(serial_number__icontains=query))
-
-    # Create a new Excel workbook and sheet
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Rental Items"
-
-    # Define headers
-    headers = [
-        "Serial Number",
-        "Item Type",
-        "Status",
-        "Purchase Date",
-        "Last Inspection Date",
-        "Condition Notes",
-    ]
-    sheet.append(headers)
-
-    # Write data rows
-    for item in rental_items:
-        sheet.append(
-            [
-                item.serial_number,
-                str(item.item_type),  # Use __str__ method
-                item.get_status_display(),
-                item.purchase_date.strftime("%d/%m/%Y") if item.purchase_date else "",
-                item.last_inspection_date.strftime("%d/%m/%Y") if item.last_inspection_date else "",
-                item.condition_notes or "N/A",
-            ]
-        )
-
-    # Optional: Adjust column widths
-    for col in range(1, len(headers) + 1):
-        sheet.column_dimensions[get_column_letter(col)].auto_width = True
-
-    # Prepare the HTTP response
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    response["Content-Disposition"] = "attachment; filename=rental_items_export.xlsx"
-
-    # Save the workbook to the response
-    workbook.save(response)
-
-    return response
+    """Exports rental item data, respecting the filters of its list view."""
+    return export_jobs.cached_export_response(request, exports.RentalItemExport)
 
 
 @login_required
 def export_accessories_excel(request):
-    """Exports accessory data to an Excel file, respecting current filters."""
-    query = request.GET.get("search", "")
-    accessories = Accessory.objects.all().order_by("-updated_at")
-
-    if query:
-        accessories = accessories.filter(Q(accessory_name__icontains=query))
-
-    # Create a new Excel workbook and sheet
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Accessories"
-
-    # Define headers
-    headers = [
-        "Accessory Name",
-        "Item Type",
-        "Standard Quantity",
-        "Replacement Cost",
-    ]
-    sheet.append(headers)
-
-    # Write data rows
-    for accessory in accessories:
-        sheet.append(
-            [
-                accessory.accessory_name,
-                str(accessory.item_type),  # Use __str__ method
-                accessory.standard_quantity,
-                accessory.replacement_cost,
-            ]
-        )
-
-    # Optional: Adjust column widths
-    for col in range(1, len(headers) + 1):
-        sheet.column_dimensions[get_column_letter(col)].auto_width = True
-
-    # Prepare the HTTP response
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    response["Content-Disposition"] = "attachment; filename=accessories_export.xlsx"
-
-    # Save the workbook to the response
-    workbook.save(response)
-
-    return response
+    """Exports accessory data, respecting the filters of its list view."""
+    return exports.export_response(request, exports.AccessoryExport)
 
 
 @login_required
 def export_item_sets_excel(request):
-    """Exports item set data to an Excel file, respecting current filters."""
-    query = request.GET.get("search", "")
-    item_sets = (
-        ItemSet.objects.all().order_by("name").prefetch_related("itemsetcomponent_set__item_type")
-    )
-
-    if query:
-        item_sets = item_sets.filter(Q(name__icontains=query) | Q(description__icontains=query))
-
-    # Create a new Excel workbook and sheet
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Item Sets"
-
-    # Define headers
-    headers = [
-        "Set Name",
-        "Description",
-        "Base Price",
-        "Replacement Deposit",
-        "Components",
-    ]
-    sheet.append(headers)
-
-    # Write data rows
-    for item_set in item_sets:
-        components_list = ", ".join(
-            [f"{c.item_type.type_name} x {c.quantity}" for c in item_set.itemsetcomponent_set.all()]
-        )
-        sheet.append(
-            [
-                item_set.name,
-                item_set.description or "N/A",
-                item_set.base_price,
-                item_set.replacement_deposit,
-                components_list or "None",
-            ]
-        )
-
-    # Optional: Adjust column widths
-    for col in range(1, len(headers) + 1):
-        sheet.column_dimensions[get_column_letter(col)].auto_width = True
-
-    # Prepare the HTTP response
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    response["Content-Disposition"] = "attachment; filename=item_sets_export.xlsx"
-
-    # Save the workbook to the response
-    workbook.save(response)
-
-    return response
+    """Exports item set data, respecting the filters of its list view."""
+    return export_jobs.cached_export_response(request, exports.ItemSetExport)
 
 
 @login_required
 def export_rental_transactions_excel(request):
-    """Exports rental transaction data to an Excel file, respecting current filters."""
+    """Exports rental transaction data, respecting the filters of its list view."""
+    return exports.export_response(request, exports.RentalTransactionExport)
 
-    transactions_list = (
-        RentalTransaction.objects.select_related("customer__user")
-        .prefetch_related(
-            "rentalitemdetail_set__item__item_type",
-            "rentalsetdetail_set__item_set",
-            "payment_set",
-        )
-        .order_by("-start_date", "-created_at")
-    )
-
-    # --- Apply Filtering Logic (same as manage_rental_transactions) ---
-    status_filter = request.GET.get("status")
-    customer_filter = request.GET.get("customer")
-    date_from_filter = request.GET.get("date_from")
-    date_to_filter = request.GET.get("date_to")
-
-    if status_filter:
-        transactions_list = transactions_list.filter(payment_status=status_filter)
-
-    if customer_filter:
-        transactions_list = transactions_list.filter(
-            Q(customer__first_name__icontains=customer_filter)
-            | Q(customer__last_name__icontains=customer_filter)
-            | Q(customer__user__email__icontains=customer_filter)
-        )
 
-    if date_from_filter:
-        try:
-            start_date = timezone.datetime.strptime(date_from_filter, "%Y-%m-%d").date()
-            transactions_list = transactions_list.filter(start_date__gte=start_date)
-        except ValueError:
-            pass  # Ignore invalid date filter for export
-
-    if date_to_filter:
-        try:
-            end_date = timezone.datetime.strptime(date_to_filter, "%Y-%m-%d").date()
-            transactions_list = transactions_list.filter(end_date__lte=end_date)
-        except ValueError:
-            pass  # Ignore invalid date filter for export
-
-    # Create a new Excel workbook and sheet
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Rental Transactions"
-
-    # Define headers
-    headers = [
-        "Transaction ID",
-        "Customer Name",
-        "Customer Email",
-        "Rental Dates",
-        "Total Days",
-        "Items/Sets Rented",
-        "Total Deposit",
-        "Total Rental Cost",
-        "Amount Paid",
-        "Payment Status",
-        "Created At",
-    ]
-    sheet.append(headers)
-
-    # Write data rows
-    for transaction in transactions_list:
-        items_sets_list = "; ".join(
-            [
-                f"{d.quantity} x {d.item_set.name} (Set)"
-                for d in transaction.rentalsetdetail_set.all()
-            ]
-            + [
-                f"{d.quantity} x {d.item.item_type} ({d.item.serial_number})"
-                for d in transaction.rentalitemdetail_set.filter(set_rental__isnull=True)
-            ]
-        )
-        sheet.append(
-            [
-                transaction.id,
-                transaction.customer.first_name + " " + transaction.customer.last_name,
-                transaction.customer.user.email if transaction.customer.user else "N/A",
-                f"{transaction.start_date.strftime('%d/%m/%Y')} - {transaction.end_date.strftime('%d/%m/%Y')}",
-                transaction.total_rental_days,
-                items_sets_list or "None",
-                transaction.total_deposit,
-                transaction.total_rental_cost,
-                transaction.amount_paid,
-                transaction.get_payment_status_display(),
-                transaction.created_at.strftime("%d/%m/%Y %H:%M"),
-            ]
-        )
+@login_required
+def export_revenue_report_excel(request):
+    """Exports the filtered revenue report."""
+    return exports.export_response(request, exports.RevenueExport)
 
-    # Optional: Adjust column widths
-    for col in range(1, len(headers) + 1):
-        sheet.column_dimensions[get_column_letter(col)].auto_width = True
 
-    # Prepare the HTTP response
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    response["Content-Disposition"] = "attachment; filename=rental_transactions_export.xlsx"
+# -------- Background export jobs
 
-    # Save the workbook to the response
-    workbook.save(response)
 
-    return response
+def _export_job_payload(job):
+    payload = {
+        "id": job.pk,
+        "status": job.status,
+        "progress": job.progress,
+        "rows_written": job.rows_written,
+        "total_rows": job.total_rows,
+        "status_url": reverse("export_job_status", args=[job.pk]),
+    }
+    if job.status == ExportStatus.DONE:
+        payload["download_url"] = reverse("download_export_job", args=[job.pk])
+    elif job.status == ExportStatus.FAILED:
+        payload["error"] = job.error
+    return payload
 
 
 @login_required
-def export_revenue_report_excel(request):
-    """Exports the filtered revenue report to an Excel file."""
-    selected_year = request.GET.get("year", str(timezone.now().year))
-    selected_month = request.GET.get("month", "")
-
-    payments_query = Payment.objects.select_related("rental__customer__user").order_by(
-        "-transaction_date"
+@require_POST
+def start_export_job(request, dataset):
+    """Queues (or reuses) a background export of a dataset with the querystring's filters."""
+    dataset_class = exports.DATASETS.get(dataset)
+    if dataset_class is None:
+        raise Http404("Unknown export.")
+    export_format = request.GET.get(exports.FORMAT_PARAM, exports.DEFAULT_FORMAT)
+    if export_format not in exports.FORMATS:
+        return JsonResponse({"error": "Unsupported export format."}, status=400)
+
+    job, created = export_jobs.request_export(
+        dataset_class, export_format, request.GET, user=request.user
     )
+    return JsonResponse(_export_job_payload(job), status=202 if created else 200)
 
-    try:
-        year_int = int(selected_year)
-        payments_query = payments_query.filter(transaction_date__year=year_int)
-    except ValueError:  # Fallback if year is invalid
-        payments_query = payments_query.filter(transaction_date__year=timezone.now().year)
 
-    if selected_month:
-        try:
-            month_int = int(selected_month)
-            if 1 <= month_int <= 12:
-                payments_query = payments_query.filter(transaction_date__month=month_int)
-        except ValueError:
-            pass  # Ignore invalid month for export
-
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Revenue Report"
-    headers = [
-        "Payment Date",
-        "Rental ID",
-        "Customer",
-        "Amount",
-        "Payment Type",
-        "Payment Method",
-        "Notes",
-    ]
-    sheet.append(headers)
-
-    for payment in payments_query:
-        sheet.append(
-            [
-                payment.transaction_date.strftime("%Y-%m-%d %H:%M"),
-                payment.rental.id if payment.rental else "N/A",
-                (
-                    payment.rental.customer.first_name + " " + payment.rental.customer.last_name
-                    if payment.rental and payment.rental.customer
-                    else "N/A"
-                ),
-                payment.amount,
-                payment.get_payment_type_display(),
-                payment.get_payment_method_display(),
-                payment.notes or "",
-            ]
-        )
+@login_required
+def export_job_status(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk)
+    return JsonResponse(_export_job_payload(job))
 
-    for col_num, header in enumerate(headers, 1):
-        column_letter = get_column_letter(col_num)
-        sheet.column_dimensions[column_letter].auto_size = True
 
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    filename_month = f"_month-{selected_month}" if selected_month else ""
-    response["Content-Disposition"] = (
-        f"attachment; filename=revenue_report_{selected_year}{filename_month}.xlsx"
+@login_required
+def download_export_job(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk, status=ExportStatus.DONE)
+    if not job.file:
+        raise Http404("Export file not found.")
+    dataset = exports.DATASETS[job.dataset](job.params)
+    return FileResponse(
+        job.file.open("rb"),
+        as_attachment=True,
+        filename=f"{dataset.get_filename()}.{job.export_format}",
+        content_type=exports.CONTENT_TYPES[job.export_format],
     )
-    workbook.save(response)
-    return response